@@ -0,0 +1,67 @@
+#!/usr/local/bin/python3
+"""
+Benchmark the JSON codecs on the two things we do most: decoding pages of
+devices and encoding publish batches.  (Decoding is timed on page bodies
+rendered up front, as going through a Response against the stand-in is
+dominated by the stand-in rendering each page.)
+
+    python3 benchmarks/bench_codec.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tests'))
+
+import spectreapi  # noqa: E402
+from standin import devices  # noqa: E402
+
+ROWS = 20000
+PAGE_SIZE = 500
+BATCH = 1000
+
+
+def codecs():
+    yield spectreapi.StdlibCodec()
+    if spectreapi.codec.orjson is not None:
+        yield spectreapi.OrjsonCodec()
+
+
+def pages(rows):
+    """The page bodies the server would send for <rows>"""
+    return [spectreapi.StdlibCodec.dumps({'@class': 'apiresponse', 'status': 'SUCCESS', 'total': len(rows),
+                                          'results': rows[i:i + PAGE_SIZE]})
+            for i in range(0, len(rows), PAGE_SIZE)]
+
+
+def page_rows_per_second(codec, bodies):
+    start = time.perf_counter()
+    count = sum(len(codec.loads(body)['results']) for body in bodies)
+    return count / (time.perf_counter() - start)
+
+
+def publish_rows_per_second(codec, rows):
+    server = spectreapi.Server('standin', codec=codec)
+    collector = spectreapi.Collector(1, 'uuid', 'collector', None, server=server)
+    start = time.perf_counter()
+    nbytes = 0
+    for i in range(0, len(rows), BATCH):
+        nbytes += len(collector._devices_payload({'devices': rows[i:i + BATCH]}, 'external', 'unspecified', False))
+    return len(rows) / (time.perf_counter() - start), nbytes
+
+
+def main():
+    rows = devices(ROWS)
+    bodies = pages(rows)
+    print(f'{"codec":>8} {"decode rows/s":>14} {"decode MB/s":>12} {"publish rows/s":>16}')
+    for codec in codecs():
+        page_rows_per_second(codec, bodies)  # warm up
+        decode = page_rows_per_second(codec, bodies)
+        megabytes = decode * sum(map(len, bodies)) / len(rows) / 1e6
+        publish, _ = publish_rows_per_second(codec, rows)
+        print(f'{codec.name:>8} {decode:>14.0f} {megabytes:>12.1f} {publish:>16.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/local/bin/python3
+"""
+Benchmark the detail presets and field projection: bytes per page body,
+rows/s through a Response and bytes of results held afterwards, against a
+stand-in that adds a made-up payload for each detail.* asked for.  (rows/s
+includes the stand-in rendering each page, which grows with the body.)
+
+    python3 benchmarks/bench_projection.py
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tests'))
+
+import spectreapi  # noqa: E402
+from standin import StandInSession, devices  # noqa: E402
+
+ROWS = 10000
+PAGE_SIZE = 500
+FIELDS = ('id', 'ip', 'mac', 'lastObserved')
+
+
+class DetailSession(StandInSession):
+    """A stand-in whose devices grow with each detail asked for"""
+
+    def __init__(self, rows):
+        super().__init__({'zonedata/devices': lambda: self.detailed})
+        self.rows = rows
+        self.detailed = rows
+        self._details = None
+
+    def get(self, url, params=None, headers=None, **kargs):
+        details = sorted(name[len('detail.'):] for name in (params or {}) if name.startswith('detail.'))
+        if details != self._details:
+            self._details = details
+            self.detailed = [dict(row, **{detail[0].lower() + detail[1:]: [{'name': f'{detail}-{i}',
+                                                                             'value': 'x' * 24}
+                                                                            for i in range(3)]
+                                          for detail in details})
+                             for row in self.rows]
+        return super().get(url, params=params, headers=headers, **kargs)
+
+
+def measure(server, preset, fields):
+    query = server.query().preset(preset)
+    if fields:
+        query.fields(*fields)
+    list(query.run())  # warm up (and have the stand-in render its rows)
+    server.stats.reset()
+    start = time.perf_counter()
+    kept = list(query.run())
+    elapsed = time.perf_counter() - start
+    return server.stats.body_bytes, len(kept) / elapsed, len(json.dumps(kept))
+
+
+def main():
+    server = spectreapi.Server('standin', page_size=PAGE_SIZE)
+    server.session = DetailSession(devices(ROWS))
+    print(f'{"preset":>8} {"fields":>8} {"body MB":>8} {"rows/s":>10} {"kept MB":>8}')
+    for preset in spectreapi.DETAIL_PRESETS:
+        for fields in (None, FIELDS):
+            body, rate, kept = measure(server, preset, fields)
+            print(f'{preset:>8} {"some" if fields else "all":>8} {body / 1e6:>8.2f} {rate:>10.0f} {kept / 1e6:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
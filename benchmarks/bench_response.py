@@ -0,0 +1,42 @@
+#!/usr/local/bin/python3
+"""
+Micro-benchmark for iterating a Response.
+
+Each page is only decoded once, so the per-row cost of walking a result
+set should stay flat as page_size grows.
+
+    python3 benchmarks/bench_response.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tests'))
+
+import spectreapi  # noqa: E402
+from standin import StandInSession, devices  # noqa: E402
+
+ROWS = 20000
+
+
+def per_row_cost(page_size, rows):
+    server = spectreapi.Server('standin', page_size=page_size)
+    server.session = StandInSession({'zonedata/devices': rows})
+    start = time.perf_counter()
+    count = 0
+    for _ in server.get('zonedata/devices'):
+        count += 1
+    elapsed = time.perf_counter() - start
+    return elapsed / count
+
+
+def main():
+    rows = devices(ROWS)
+    print(f'{"page_size":>10} {"usec/row":>10}')
+    for page_size in (50, 100, 500, 1000, 2000, 5000):
+        print(f'{page_size:>10} {per_row_cost(page_size, rows) * 1e6:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
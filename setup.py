@@ -19,6 +19,7 @@ setup(
         version="0.5.6",
         license="MIT",
         install_requires=['requests'],
+        extras_require={'async': ['httpx'], 'fast': ['orjson']},
         packages=find_packages(where="src"),
         package_dir={'': 'src'},
         long_description=long_description,
@@ -2,3 +2,20 @@ from spectreapi.server import *
 from spectreapi.response import *
 from spectreapi.zone import *
 from spectreapi.collector import *
+from spectreapi.stream import *
+from spectreapi.spool import *
+from spectreapi.pagesize import *
+from spectreapi.columns import *
+from spectreapi.export import *
+from spectreapi.cidrs import *
+from spectreapi.aio import *
+from spectreapi.retry import *
+from spectreapi.stats import *
+from spectreapi.codec import *
+from spectreapi.cache import *
+from spectreapi.catalog import *
+from spectreapi.inhibit import *
+from spectreapi.index import *
+from spectreapi.sync import *
+from spectreapi.projection import *
+from spectreapi.partition import *
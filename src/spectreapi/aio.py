@@ -0,0 +1,580 @@
+"""
+asyncio support for the Spectre API.
+
+AsyncServer (via AsyncAPIKeyServer or AsyncUsernameServer) mirrors Server,
+but every call is a coroutine and results are iterated with "async for".
+It sits on a pooled httpx.AsyncClient so one event loop can drive hundreds
+of concurrent Command Center calls without wrapping anything in
+run_in_executor.  Zones and Collectors it hands back (AsyncZone and
+AsyncCollector) have the same methods as their blocking cousins, awaitable.
+
+This needs httpx (pip3 install spectre-api[async]).
+
+>>> import asyncio, spectreapi
+>>> async def main():
+...     async with spectreapi.AsyncAPIKeyServer('server', api_key='...') as server:
+...         zone = await server.get_zone_by_name('Twilight')
+...         async for device in zone.query().run():
+...             print(device['ip'])
+>>> asyncio.run(main())
+"""
+import asyncio
+import collections
+import ipaddress
+import os
+import time
+from typing import List, Optional
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+import spectreapi
+from spectreapi.export import _CsvWriter, _NdjsonWriter, _RawWriter, _check_export
+from spectreapi.partition import CIDR_FILTER, PartitionedResults, _partitions
+
+DEFAULT_HEADERS = {'Accept': 'application/json', 'Content-Type': 'application/json'}
+
+
+class AsyncServer:
+    """
+    An AsyncServer is the asyncio flavor of Server.  Like Server it's not
+    meant to be instantiated directly, use AsyncAPIKeyServer or
+    AsyncUsernameServer and then either "async with" it or await connect().
+    <max_connections> bounds the connection pool shared by every call.
+    """
+
+    def __init__(self, server, page_size=500, verify_cert=False, max_connections=100,
+                 max_keepalive_connections=20, timeout=120, adaptive_page_size=None, transport=None, codec=None):
+        if httpx is None:
+            raise spectreapi.SpectreException('AsyncServer needs httpx: pip3 install spectre-api[async]')
+
+        self.page_size = page_size
+        self.page_sizer = adaptive_page_size
+        self.codec = codec or spectreapi.default_codec()
+        self.url = "https://" + server + "/api/rest/"
+        self._host = server
+        self._version = None
+        self._name = None
+        self.client = httpx.AsyncClient(
+            verify=verify_cert,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_keepalive_connections),
+            transport=transport,
+        )
+
+    @property
+    def host(self) -> str:
+        """Returns the server name (or IP) specified in the constructor"""
+        return self._host
+
+    @property
+    def name(self) -> str:
+        """Returns the server name """
+        return self._name
+
+    @property
+    def version(self) -> str:
+        """Returns the version of the Spectre server we're talking with (as reported by that server)"""
+        return self._version
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def connect(self):
+        """Authenticate to the server (subclasses know how)"""
+        return self
+
+    async def close(self):
+        """Close the connection pool"""
+        await self.client.aclose()
+
+    def page_size_for(self, api) -> int:
+        """The page size we'll ask for when paging through <api> (see Server.page_size_for)"""
+        if self.page_sizer is not None:
+            return self.page_sizer.size_for(api)
+        return self.page_size
+
+    async def _request(self, method, api, **kargs):
+        if isinstance(kargs.get('data'), (str, bytes)):
+            kargs['content'] = kargs.pop('data')
+        result = await self.client.request(method, self.url + api, **kargs)
+        if not result.is_success:
+            raise spectreapi.APIException(result)
+        return result
+
+    async def post(self, api, **kargs):
+        """This method POSTs to the Spectre API"""
+        kargs.setdefault('headers', DEFAULT_HEADERS)
+        return await self._request('POST', api, **kargs)
+
+    async def raw_post(self, api, **kargs):
+        """This method POSTs to the Spectre API but _doesn't_ set any headers (see Server.raw_post)"""
+        return await self._request('POST', api, **kargs)
+
+    async def put(self, api, **kargs):
+        """Method PUTs through to the server"""
+        kargs.setdefault('headers', DEFAULT_HEADERS)
+        return await self._request('PUT', api, **kargs)
+
+    async def delete(self, api, **kargs):
+        """Method sends DELETEs through to server"""
+        kargs.setdefault('headers', DEFAULT_HEADERS)
+        return await self._request('DELETE', api, **kargs)
+
+    async def getpage(self, api, params=None, page=0, headers=None, page_size=None):
+        """Fetch one page of a GET API call"""
+        params = dict(params) if params is not None else {}
+        params["query.pagesize"] = page_size or self.page_size
+        params["query.page"] = page
+        return await self._request('GET', api, params=params, headers=headers or DEFAULT_HEADERS)
+
+    def get(self, api, params=None, prefetch=0, fields=None) -> 'AsyncResponse':
+        """
+        GET results from an API call.  The AsyncResponse can be awaited (to
+        fetch the first page and total) and iterated with "async for".
+        Set prefetch to have that many upcoming pages fetched concurrently,
+        and fields to keep just those of each result.
+        """
+        return AsyncResponse(self, api, params, prefetch=prefetch, fields=fields)
+
+    def query(self, api="zonedata/devices") -> 'AsyncQuery':
+        return AsyncQuery(self, api)
+
+    async def get_zones(self) -> List['AsyncZone']:
+        """Returns all the Zones configured on the server"""
+        return [AsyncZone(zone['id'], zone['name'], zone['description'], server=self)
+                async for zone in self.get('zone')]
+
+    async def get_zone_by_name(self, name) -> Optional['AsyncZone']:
+        """Returns the Zone configured on the server named <name> (if present)"""
+        async for zone in self.get('zone', {'filter.zone.name': name}):
+            if zone['name'] == name:  # In case the server doesn't filter on name
+                return AsyncZone(zone['id'], zone['name'], zone['description'], server=self)
+        return None
+
+    async def get_or_create_zone(self, name, description="Test Zone",
+                                 organization={"id": 1, "name": "Test Organization"}):
+        zone = await self.get_zone_by_name(name)
+        if zone:
+            return zone
+        data = [{"@class": "zone",
+                 "name": name,
+                 "description": description,
+                 "organization": organization
+                 }]
+        await self.post("zone", data=self.codec.dumps(data))
+        return await self.get_zone_by_name(name)
+
+    def _collector(self, collector):
+        return AsyncCollector(
+            collector['id'],
+            collector['uuid'],
+            collector['name'],
+            AsyncZone(collector['zone']['id'], collector['zone']['name']),
+            server=self,
+        )
+
+    async def get_collectors(self) -> List['AsyncCollector']:
+        """Returns the Collectors configured on the server"""
+        return [self._collector(collector) async for collector in self.get('zone/collector')]
+
+    async def get_collector_by_name(self, name) -> Optional['AsyncCollector']:
+        """Returns the Collector configured on the server named <name> (if present)"""
+        async for collector in self.get('zone/collector', {'filter.collector.name': name}):
+            if collector['name'] == name:  # In case the server doesn't filter on name
+                return self._collector(collector)
+        return None
+
+
+class AsyncAPIKeyServer(AsyncServer):
+    """An AsyncServer that authenticates via API key (see APIKeyServer)"""
+
+    def __init__(self, server, api_key, page_size=500, verify_cert=False, **kargs):
+        super().__init__(server, page_size=page_size, verify_cert=verify_cert, **kargs)
+        self.client.headers['Authorization'] = "Bearer " + api_key
+
+    async def connect(self):
+        info = await self.get("system/information").result()
+        self._version = info['version']
+        self._name = info['name']
+        return self
+
+
+class AsyncUsernameServer(AsyncServer):
+    """
+    An AsyncServer that uses username and password authentication for the
+    initial request, and then uses the session cookie from there out
+    """
+
+    def __init__(self, server, username, password, page_size=500, verify_cert=False, **kargs):
+        super().__init__(server, page_size=page_size, verify_cert=verify_cert, **kargs)
+        self._auth = (username, password)
+
+    async def connect(self):
+        results = await self.client.get(self.url + "system/information", headers=DEFAULT_HEADERS,
+                                        auth=self._auth)
+        if not results.is_success:
+            raise spectreapi.APIException(results)
+        self._auth = None  # The client's cookie jar has our session now
+        info = self.codec.loads(results.content)['results'][0]
+        self._version = info['version']
+        self._name = info['name']
+        return self
+
+
+class AsyncResponse:
+    """
+    The asyncio flavor of Response.  Each "async for" over it is an
+    independent pass; await it (or any of values()/result()/json()) to
+    fetch the first page and learn the total.  With <prefetch> pages in
+    flight and ordered=False, each page's rows come as soon as it arrives.
+    """
+
+    def __init__(self, server, api, params, prefetch=0, fields=None, ordered=True):
+        self.server = server
+        self.api = api
+        self.params = params
+        self.prefetch = prefetch
+        self.ordered = ordered
+        self._project = spectreapi.projector(fields) if fields else None
+        self.total = None
+        self._page = None
+        self._size = None
+
+    async def fetch(self) -> 'AsyncResponse':
+        """Fetch page 0 (once) so we know the total"""
+        if self._page is None:
+            self._size = self.server.page_size_for(self.api)
+            self._page = await self._fetch_page(0)
+            self.total = self._page.get('total', 1)
+        return self
+
+    def __await__(self):
+        return self.fetch().__await__()
+
+    async def _fetch_rows(self, offset):
+        return (await self._fetch_page(offset // self._size)).get('results', [])
+
+    async def _fetch_page(self, page):
+        """Fetch and decode <page>, telling the server's AdaptivePageSize (if any) how it went"""
+        start = time.perf_counter()
+        results = await self.server.getpage(self.api, self.params, page=page, page_size=self._size)
+        decoded = self._decode(results)
+        if self.server.page_sizer is not None:
+            self.server.page_sizer.observe(self.api, self._size, len(decoded.get('results', [])),
+                                           time.perf_counter() - start, len(results.content))
+        return decoded
+
+    def _decode(self, results):
+        page = self.server.codec.loads(results.content)
+        if self._project is not None and 'results' in page:
+            page['results'] = [self._project(row) for row in page['results']]
+        return page
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await self.fetch()
+        rows = self._page.get('results', [])
+        for row in rows:
+            yield row
+        if len(rows) < self._size:
+            return
+
+        offsets = iter(range(self._size, self.total, self._size))
+        in_flight = collections.deque()
+        try:
+            for offset in offsets:
+                in_flight.append(asyncio.ensure_future(self._fetch_rows(offset)))
+                if len(in_flight) > self.prefetch:
+                    break
+
+            while in_flight:
+                if self.ordered:
+                    rows = await in_flight.popleft()
+                else:
+                    done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    task = done.pop()
+                    in_flight.remove(task)
+                    rows = task.result()
+                for offset in offsets:
+                    in_flight.append(asyncio.ensure_future(self._fetch_rows(offset)))
+                    break
+                for row in rows:
+                    yield row
+                if self.ordered and len(rows) < self._size:
+                    return  # This could happen if the underlying query shrinks under us
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    async def json(self):
+        """Return the decoded body of page 0"""
+        await self.fetch()
+        return self._page
+
+    async def values(self):
+        """Return the values from page 0 of the API call"""
+        await self.fetch()
+        return self._page.get('results', [])
+
+    async def result(self):
+        """Return result 0 (the only result for singletons)"""
+        return (await self.values())[0]
+
+    value = result
+
+
+class AsyncQuery(spectreapi.Query):
+    """The asyncio flavor of Query"""
+
+    def run(self, prefetch=0) -> AsyncResponse:
+        return self.server.get(self.api, self.params, prefetch=prefetch, fields=self.projection)
+
+    def run_parallel(self, workers=4, ordered=True) -> AsyncResponse:
+        """With asyncio, running in parallel is just prefetching <workers> pages
+        (yielded as each arrives with ordered=False)"""
+        return AsyncResponse(self.server, self.api, self.params, prefetch=workers, fields=self.projection,
+                             ordered=ordered)
+
+    async def run_partitioned(self, by='zone', workers=4, progress=None,
+                              cidr_filter=CIDR_FILTER) -> 'AsyncPartitionedResults':
+        """
+        Split the query into disjoint sub-queries by zone or by a list of
+        CIDRs (see Query.run_partitioned), <workers> of them running at once.
+        Await this, then "async for" over the merged rows.
+        """
+        zones = await self.server.get_zones() if by == 'zone' else None
+        return AsyncPartitionedResults(self, _partitions(self, by, zones, cidr_filter),
+                                       workers=workers, progress=progress)
+
+    async def count(self) -> int:
+        params = {name: value for name, value in self.params.items() if not name.startswith('detail.')}
+        page = self.server.codec.loads((await self.server.getpage(self.api, params, page_size=1)).content)
+        return page.get('total', len(page.get('results', [])))
+
+    async def exists(self) -> bool:
+        return await self.count() > 0
+
+    async def export(self, path, format='ndjson', fields=None, raw=False) -> 'spectreapi.ExportStats':
+        """Stream the query's results straight to a file at <path> (see Query.export)"""
+        fields = fields or self.projection
+        _check_export(format, fields, raw)
+
+        start = time.perf_counter()
+        if format == 'csv':
+            with open(path, 'w', newline='', encoding='utf-8') as out:
+                writer = _CsvWriter(out, fields, self.server.codec)
+                async for row in self.server.get(self.api, self.params):
+                    writer.write(row)
+            rows, nbytes = writer.rows, os.path.getsize(path)
+        elif raw:
+            with open(path, 'wb') as out:
+                writer = _RawWriter(out, self.server.page_size_for(self.api))
+                while True:
+                    page = await self.server.getpage(self.api, self.params, page=writer.pages, page_size=writer.size)
+                    if writer.write_page(page.content):
+                        break
+            rows, nbytes = writer.rows, writer.bytes
+        else:
+            with open(path, 'wb') as out:
+                writer = _NdjsonWriter(out, fields, self.server.codec)
+                async for row in self.server.get(self.api, self.params):
+                    writer.write(row)
+            rows, nbytes = writer.rows, writer.bytes
+
+        return spectreapi.ExportStats(path, rows, nbytes, time.perf_counter() - start)
+
+
+async def _set_cidrs(owner, api, cidrs, append, chunk_size, collapse):
+    """POST <cidrs> to <api> for an AsyncZone or AsyncCollector <owner>, a chunk at a time"""
+    if collapse:
+        cidrs = owner.last_collapse = spectreapi.collapse_cidrs(cidrs)
+
+    results = None
+    for data in spectreapi.cidr_payloads(cidrs, chunk_size, owner.server.codec):
+        params = {"append": str(append).lower()}
+        results = await owner.server.post(api, data=data, params=params)
+        append = True  # after the first chunk, append regardless
+    return results
+
+
+async def _delete_cidrs(owner, api, cidrs, chunk_size):
+    """DELETE <cidrs> from <api> for an AsyncZone or AsyncCollector <owner>, a chunk at a time"""
+    results = None
+    for data in spectreapi.cidr_payloads(cidrs, chunk_size, owner.server.codec):
+        results = await owner.server.delete(api, data=data)
+    return results
+
+
+class AsyncPartitionedResults(PartitionedResults):
+    """The asyncio flavor of PartitionedResults, iterated with "async for" """
+
+    def __iter__(self):
+        raise TypeError('Use "async for" over the results of AsyncQuery.run_partitioned')
+
+    async def _run(self, partition, results, limit):
+        async with limit:
+            try:
+                fields, project = self._projection(partition)
+                response = await self.query.server.get(self.query.api, partition.params, fields=fields)
+                partition.total = response.total
+                size = self.query.server.page_size_for(self.query.api)
+                page = []
+                async for row in response:
+                    if partition.keep(row):
+                        page.append(row if project is None else project(row))
+                    if len(page) >= size:
+                        await results.put((partition, page))
+                        page = []
+                if page:
+                    await results.put((partition, page))
+            except Exception as e:  # Handed over to be raised where we're iterated
+                await results.put((partition, e))
+                return
+        await results.put((partition, None))
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        self._reset()
+        results = asyncio.Queue(maxsize=2 * self.workers)
+        limit = asyncio.Semaphore(self.workers)
+        tasks = [asyncio.ensure_future(self._run(partition, results, limit)) for partition in self.partitions]
+        running = len(tasks)
+        try:
+            while running:
+                partition, page = await results.get()
+                self._take(partition, page)
+                if page is None:
+                    running -= 1
+                else:
+                    for row in page:
+                        yield row
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+class AsyncZone(spectreapi.Zone):
+    """
+    The asyncio flavor of Zone.  The CIDR, collector and device methods
+    have the same names and arguments as Zone's, but are awaitable.
+    """
+
+    async def _get_cidrs(self, cidr_type):
+        api = self._cidr_api(cidr_type, '_get_cidrs')
+        return [ipaddress.ip_network(cidr) async for cidr in self.server.get(api)]
+
+    async def _set_cidrs(self, cidr_type, *cidrs, append=False, chunk_size=5000, collapse=False):
+        return await _set_cidrs(self, self._cidr_api(cidr_type, '_set_cidrs'), cidrs, append, chunk_size, collapse)
+
+    async def _delete_cidrs(self, cidr_type, *cidrs, chunk_size=5000):
+        return await _delete_cidrs(self, self._cidr_api(cidr_type, '_delete_cidrs'), cidrs, chunk_size)
+
+    async def get_or_create_collector(self, name):
+        collector = await self.server.get_collector_by_name(name)
+        if collector:
+            return collector
+
+        await self.server.post("zone/collector", data=self._collector_payload(name))
+        return await self.server.get_collector_by_name(name)
+
+    async def get_device_details_by_ip(self, ip_address, query_reference_ip=True):
+        """Return the details for one device for a zone with an address of <ip>
+        (see Zone.get_device_details_by_ip)"""
+        if query_reference_ip and ip_address in self.reference_ips:
+            return await self.get_device_details_by_ip(self.reference_ips[ip_address])
+
+        params = self._device_details_params(ip_address)
+        temp = await self.server.get('zonedata/devices', params=params)
+
+        if temp.total == 0:
+            if query_reference_ip:
+                result = await self.query()\
+                    .detail('ReferenceIp')\
+                    .filter('address.ip', ip_address)\
+                    .filter('device.associated', 'true')\
+                    .run()
+                if result.total > 0:
+                    reference_ip = (await result.result())['referenceIp']
+                    if reference_ip:
+                        self.reference_ips[ip_address] = reference_ip
+                        return await self.get_device_details_by_ip(reference_ip)
+            else:
+                params['filter.device.associated'] = True
+                return await self.server.get('zonedata/devices', params=params)
+        else:
+            return temp
+
+    async def get_device_details_by_ips(self, ips, workers=8, query_reference_ip=True):
+        """Async generator yielding (ip, details) for each distinct IP in <ips>
+        as its lookup completes, <workers> at a time (see Zone.get_device_details_by_ips)"""
+        limit = asyncio.Semaphore(workers)
+
+        async def lookup(ip_address):
+            async with limit:
+                results = await self.get_device_details_by_ip(ip_address, query_reference_ip)
+                if results is None or not results.total:
+                    return ip_address, None
+                return ip_address, await results.result()
+
+        for done in asyncio.as_completed([lookup(ip) for ip in dict.fromkeys(str(ip) for ip in ips)]):
+            yield await done
+
+
+class AsyncCollector(spectreapi.Collector):
+    """
+    The asyncio flavor of Collector.  The CIDR, publishing and property
+    methods have the same names and arguments as Collector's, but are awaitable.
+    """
+
+    async def _get_cidrs(self, cidr_type):
+        api = self._cidr_api(cidr_type, '_get_cidrs')
+        return [ipaddress.ip_network(cidr) async for cidr in self.server.get(api)]
+
+    async def _set_cidrs(self, cidr_type, *cidrs, append=False, chunk_size=5000, collapse=False):
+        return await _set_cidrs(self, self._cidr_api(cidr_type, '_set_cidrs'), cidrs, append, chunk_size, collapse)
+
+    async def _delete_cidrs(self, cidr_type, *cidrs, chunk_size=5000):
+        return await _delete_cidrs(self, self._cidr_api(cidr_type, '_delete_cidrs'), cidrs, chunk_size)
+
+    async def add_traces(self, traces, scanType='external', protocol='unspecified'):
+        await self.server.put(f'publish/path/{self.uuid}',
+                              data=self._traces_payload(traces, scanType, protocol))
+
+    async def add_devices(self, devices, scanType='external', protocol='unspecified', nack=False):
+        await self.server.put(f'publish/device/{self.uuid}',
+                              data=self._devices_payload(devices, scanType, protocol, nack))
+
+    async def get_property(self, prop):
+        if self.server is None:
+            raise spectreapi.NoServerException('Collector.get_property() needs a server')
+
+        results = await self.server.getpage(f'zone/collector/{self.id_num}/property/get/{prop}')
+        return self.server.codec.loads(results.content).get('result')
+
+    async def set_property(self, prop, value, *, query_first=True):
+        if self.server is None:
+            raise spectreapi.NoServerException('Collector.set_property() needs a server')
+
+        if query_first and await self.get_property(prop) == value:
+            return
+
+        await self.server.getpage(f'zone/collector/{self.id_num}/property/set/{prop}', params={'value': value})
+
+    async def get_config(self):
+        if self.server is None:
+            raise spectreapi.NoServerException('Collector.get_config() needs a server')
+
+        return await self.server.get('zone/collector',
+                                     params=dict(spectreapi.CONFIG_DETAILS,
+                                                 **{'filter.collector.id': self.id_num})).result()
@@ -0,0 +1,143 @@
+"""
+An opt-in cache for GETs of read-mostly endpoints.
+
+Looking up a zone or collector by name means downloading the whole zone
+or zone/collector list, so a script that touches 200 collectors downloads
+it hundreds of times.  With a ResponseCache on the Server those lists are
+kept for a while (a TTL per endpoint), revalidated with the server
+(If-None-Match / If-Modified-Since) once they go stale where the server
+hands out an ETag or Last-Modified, and dropped as soon as we POST, PUT
+or DELETE anything under the same path.
+"""
+import threading
+import time
+
+import requests
+
+DEFAULT_TTLS = {
+    'zone': 60,
+    'zone/collector': 60,
+    'system/information': 300,
+}
+
+
+def _related(a, b):
+    """Does a change to one of these paths affect the other?"""
+    return a == b or a.startswith(b + '/') or b.startswith(a + '/')
+
+
+class CacheEntry:
+    """One cached GET: the body and headers, when we got it and how it can be revalidated"""
+
+    def __init__(self, api, results, ttl):
+        self.api = api
+        self.body = results.content
+        self.headers = requests.structures.CaseInsensitiveDict(results.headers)
+        self.expires = time.monotonic() + ttl
+
+    @property
+    def fresh(self) -> bool:
+        return time.monotonic() < self.expires
+
+    def validators(self) -> dict:
+        """The headers to ask the server whether our copy is still good"""
+        validators = {}
+        if 'ETag' in self.headers:
+            validators['If-None-Match'] = self.headers['ETag']
+        if 'Last-Modified' in self.headers:
+            validators['If-Modified-Since'] = self.headers['Last-Modified']
+        return validators
+
+    def response(self, url) -> requests.Response:
+        """A new requests.Response carrying the cached body (callers are free to consume it)"""
+        results = requests.Response()
+        results.status_code = 200
+        results.url = url
+        results.headers = requests.structures.CaseInsensitiveDict(self.headers)
+        results._content = self.body
+        results._content_consumed = True
+        return results
+
+
+class ResponseCache:
+    """
+    Caches GETs of the APIs in <ttls> (path to seconds, by default zone,
+    zone/collector and system/information) keyed by path and parameters.
+    APIs not in <ttls> are cached for <default_ttl> seconds (0: not at all).
+
+    >>> import spectreapi
+    >>> s = spectreapi.APIKeyServer('server', api_key='...', cache=True)
+    >>> for name in collector_names:
+    ...     s.get_collector_by_name(name)     # zone/collector is only fetched once a minute
+    """
+
+    def __init__(self, ttls=None, default_ttl=0, max_entries=256):
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return (f'ResponseCache({len(self._entries)} entries, hits={self.hits}, misses={self.misses}, '
+                f'revalidated={self.revalidated})')
+
+    def __len__(self):
+        return len(self._entries)
+
+    def ttl_for(self, api) -> float:
+        return self.ttls.get(api, self.default_ttl)
+
+    @staticmethod
+    def _key(api, params, headers):
+        return (api,
+                tuple(sorted((str(k), str(v)) for k, v in (params or {}).items())),
+                (headers or {}).get('Accept'))
+
+    def fetch(self, api, params, headers, url, send) -> requests.Response:
+        """
+        GET <api> through the cache: serve a fresh copy if we have one,
+        otherwise call send(headers) (with revalidation headers added if we
+        hold a stale copy) and keep what comes back.
+        """
+        ttl = self.ttl_for(api)
+        if not ttl:
+            return send(headers)
+
+        key = self._key(api, params, headers)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.fresh:
+                self.hits += 1
+                return entry.response(url)
+            self.misses += 1
+
+        if entry is not None:
+            headers = dict(headers or {}, **entry.validators())
+        results = send(headers)
+
+        with self._lock:
+            if entry is not None and results.status_code == 304:
+                self.revalidated += 1
+                entry.expires = time.monotonic() + ttl
+                self._entries[key] = entry
+                return entry.response(url)
+            if results.status_code == 200:
+                self._entries.pop(key, None)
+                if len(self._entries) >= self.max_entries:
+                    # Dicts keep insertion order, so the first entry is the oldest
+                    del self._entries[next(iter(self._entries))]
+                self._entries[key] = CacheEntry(api, results, ttl)
+        return results
+
+    def invalidate(self, api=None):
+        """Forget everything cached under (or above) the path <api> (everything if None)"""
+        with self._lock:
+            if api is None:
+                self._entries.clear()
+                return
+            for key in [key for key, entry in self._entries.items() if _related(entry.api, api)]:
+                del self._entries[key]
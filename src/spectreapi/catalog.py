@@ -0,0 +1,165 @@
+"""
+Indexes of a server's zones and collectors.
+
+Finding a zone or collector by name used to mean downloading the whole
+list and comparing names one by one, every time.  A Catalog keeps dict
+indexes by id, name and uuid instead, asks the server for just the one
+we're after (filter.zone.name / filter.collector.name) when it doesn't
+know it yet, and folds whatever comes back into the indexes as it goes.
+"""
+import re
+import threading
+import time
+from typing import List, Optional
+
+import spectreapi
+
+# Writes to these (rather than to things inside a zone or collector, like its CIDRs) can rename or remove them
+_STRUCTURAL = re.compile(r'^zone(/collector)?(/\d+)?$')
+
+
+class Catalog:
+    """
+    Zones and collectors of <server>, indexed by id, name and uuid.
+    Entries are trusted for <max_age> seconds, after which they're looked
+    up again.  By default (max_age=0) nothing is trusted and we go to the
+    server every time, though still only for the one entry we need.  Get
+    one via Server.catalog.
+
+    >>> import spectreapi
+    >>> s = spectreapi.APIKeyServer('server', api_key='...')
+    >>> s.catalog.max_age = 60
+    >>> s.catalog.refresh()
+    >>> s.catalog.collector(name='Collector-7').uuid
+    """
+
+    def __init__(self, server, max_age=0):
+        self.server = server
+        self.max_age = max_age
+        self.zones_by_id = {}
+        self.zones_by_name = {}
+        self.collectors_by_id = {}
+        self.collectors_by_name = {}
+        self.collectors_by_uuid = {}
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'Catalog({len(self.zones_by_id)} zones, {len(self.collectors_by_id)} collectors)'
+
+    def _fresh(self, entry) -> bool:
+        seen = self._seen.get((type(entry).__name__, entry.id_num))
+        return seen is not None and time.monotonic() - seen < self.max_age
+
+    def _add_zone(self, row):
+        zone = spectreapi.Zone(row['id'], row['name'], row.get('description'), server=self.server)
+        with self._lock:
+            old = self.zones_by_id.get(zone.id_num)
+            if old is not None and self.zones_by_name.get(old.name) is old:
+                del self.zones_by_name[old.name]
+            self.zones_by_id[zone.id_num] = zone
+            self.zones_by_name[zone.name] = zone
+            self._seen[('Zone', zone.id_num)] = time.monotonic()
+        return zone
+
+    def _add_collector(self, row):
+        collector = spectreapi.Collector(
+            row['id'],
+            row['uuid'],
+            row['name'],
+            spectreapi.Zone(row['zone']['id'], row['zone']['name']),
+            server=self.server,
+        )
+        with self._lock:
+            old = self.collectors_by_id.get(collector.id_num)
+            if old is not None:
+                if self.collectors_by_name.get(old.name) is old:
+                    del self.collectors_by_name[old.name]
+                if self.collectors_by_uuid.get(old.uuid) is old:
+                    del self.collectors_by_uuid[old.uuid]
+            self.collectors_by_id[collector.id_num] = collector
+            self.collectors_by_name[collector.name] = collector
+            self.collectors_by_uuid[collector.uuid] = collector
+            self._seen[('Collector', collector.id_num)] = time.monotonic()
+        return collector
+
+    def load_zones(self, params=None) -> List['spectreapi.Zone']:
+        """GET zones (all of them, or those matching <params>) and index them"""
+        return [self._add_zone(row) for row in self.server.get('zone', params)]
+
+    def load_collectors(self, params=None) -> List['spectreapi.Collector']:
+        """GET collectors (all of them, or those matching <params>) and index them"""
+        return [self._add_collector(row) for row in self.server.get('zone/collector', params)]
+
+    def _by_name(self, load, filter_name, name):
+        """Load what's named <name>, asking the server to filter on <filter_name>
+        (or, if it won't, looking through everything)"""
+        try:
+            loaded = load({filter_name: name})
+        except spectreapi.APIException:
+            loaded = load()
+        for entry in loaded:
+            if entry.name == name:  # In case the server doesn't filter on name
+                return entry
+        return None
+
+    def refresh(self, zones=True, collectors=True):
+        """Download the full zone and/or collector lists, dropping anything that's gone"""
+        if zones:
+            loaded = self.load_zones()
+            with self._lock:
+                ids = {zone.id_num for zone in loaded}
+                self.zones_by_id = {id_num: zone for id_num, zone in self.zones_by_id.items() if id_num in ids}
+                self.zones_by_name = {zone.name: zone for zone in self.zones_by_id.values()}
+        if collectors:
+            loaded = self.load_collectors()
+            with self._lock:
+                ids = {collector.id_num for collector in loaded}
+                self.collectors_by_id = {id_num: collector for id_num, collector in self.collectors_by_id.items()
+                                         if id_num in ids}
+                self.collectors_by_name = {c.name: c for c in self.collectors_by_id.values()}
+                self.collectors_by_uuid = {c.uuid: c for c in self.collectors_by_id.values()}
+
+    def invalidate(self):
+        """Stop trusting what we have (it'll be looked up again as it's needed)"""
+        with self._lock:
+            self._seen.clear()
+
+    def forget_write(self, api):
+        """Called on every POST/PUT/DELETE so creating, renaming or removing
+        a zone or collector doesn't leave us out of date"""
+        if _STRUCTURAL.match(api):
+            self.invalidate()
+
+    def zone(self, id_num=None, name=None) -> Optional['spectreapi.Zone']:
+        """The Zone with id <id_num> or named <name> (None if there isn't one)"""
+        if name is not None:
+            zone = self.zones_by_name.get(name)
+            if zone is not None and self._fresh(zone):
+                return zone
+            return self._by_name(self.load_zones, 'filter.zone.name', name)
+
+        zone = self.zones_by_id.get(id_num)
+        if zone is None or not self._fresh(zone):
+            self.refresh(collectors=False)
+            zone = self.zones_by_id.get(id_num)
+        return zone
+
+    def collector(self, id_num=None, name=None, uuid=None) -> Optional['spectreapi.Collector']:
+        """The Collector with id <id_num>, named <name> or with uuid <uuid> (None if there isn't one)"""
+        if name is not None:
+            collector = self.collectors_by_name.get(name)
+            if collector is not None and self._fresh(collector):
+                return collector
+            return self._by_name(self.load_collectors, 'filter.collector.name', name)
+
+        def lookup():
+            if uuid is not None:
+                return self.collectors_by_uuid.get(uuid)
+            return self.collectors_by_id.get(id_num)
+
+        collector = lookup()
+        if collector is None or not self._fresh(collector):
+            self.refresh(zones=False)
+            collector = lookup()
+        return collector
@@ -0,0 +1,106 @@
+"""Helpers for building the CIDR payloads Zones and Collectors upload"""
+import ipaddress
+import math
+import re
+from typing import Iterator, List
+
+import spectreapi
+
+_OCTET = re.compile(r'(25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)\Z')
+_PREFIX = re.compile(r'(3[0-2]|[12]?\d)\Z')
+
+
+def cidr_strings(cidrs) -> List[str]:
+    """Flatten <cidrs> (strings, ipaddress networks/addresses, or lists of them) into strings"""
+    clist = []
+    for cidr in cidrs:
+        if isinstance(cidr, list):  # Okay, we're a list of CIDRs (hopefully)
+            for list_entry in cidr:
+                clist.append(str(list_entry))
+        else:
+            clist.append(str(cidr))
+    return clist
+
+
+def cidr_payloads(cidrs, chunk_size=5000, codec=None) -> Iterator[bytes]:
+    """Yield the {"addresses": [...]} bodies to send <cidrs> in chunks of <chunk_size>,
+    encoded with <codec> (see spectreapi.default_codec)"""
+    codec = codec or spectreapi.default_codec()
+    clist = [{'address': cidr} for cidr in cidr_strings(cidrs)]
+    for i in range(math.ceil(len(clist) / chunk_size)):
+        yield codec.dumps({'addresses': clist[i * chunk_size:(i + 1) * chunk_size]})
+
+
+class CollapsedCidrs(list):
+    """The CIDR strings collapse_cidrs() produced, remembering how many went in"""
+
+    def __init__(self, cidrs, before):
+        super().__init__(cidrs)
+        self.before = before
+
+    @property
+    def ratio(self) -> float:
+        """How many CIDRs went in for each one that came out (e.g. 8.0 for eight /32s into a /29)"""
+        return self.before / len(self) if self else 1.0
+
+    def __repr__(self):
+        return f'CollapsedCidrs({self.before} -> {len(self)}, ratio {self.ratio:.1f})'
+
+
+def _blocks(first, last, bits):
+    """The fewest CIDRs (as (address, prefix length)) exactly covering <first> to <last>"""
+    while first <= last:
+        # The biggest block that starts at <first> (aligned) and doesn't run past <last>
+        size = first & -first if first else 1 << bits
+        while size > last - first + 1:
+            size >>= 1
+        yield first, bits - size.bit_length() + 1
+        first += size
+
+
+def _interval(cidr):
+    """(version, first, last) integer addresses of the network <cidr>.  Plain
+    dotted IPv4 is parsed by hand as ipaddress takes a good deal longer."""
+    address, slash, length = cidr.partition('/')
+    octets = address.split('.')
+    if len(octets) == 4 and all(_OCTET.match(octet) for octet in octets) and \
+            (_PREFIX.match(length) if slash else True):
+        value = int(octets[0]) << 24 | int(octets[1]) << 16 | int(octets[2]) << 8 | int(octets[3])
+        host = (1 << (32 - int(length or 32))) - 1
+        return 4, value & ~host, value | host
+    network = ipaddress.ip_network(cidr, strict=False)
+    return network.version, int(network.network_address), int(network.broadcast_address)
+
+
+def collapse_cidrs(cidrs) -> CollapsedCidrs:
+    """
+    Merge adjacent and overlapping networks in <cidrs> (anything cidr_strings
+    takes) into the fewest CIDRs covering the same addresses, IPv4 and IPv6
+    separately.  Each network becomes an interval of integers, the
+    intervals are sorted and merged in one pass, and each merged interval is
+    cut back up into aligned blocks.  Anything that isn't a network (a range,
+    say) is passed through as is.
+    """
+    strings = cidr_strings(cidrs)
+    intervals = {4: [], 6: []}
+    others = []
+    for cidr in strings:
+        try:
+            version, first, last = _interval(cidr)
+        except ValueError:
+            others.append(cidr)
+            continue
+        intervals[version].append((first, last))
+
+    collapsed = []
+    for version, bits, network_class in ((4, 32, ipaddress.IPv4Network), (6, 128, ipaddress.IPv6Network)):
+        merged = []
+        for first, last in sorted(intervals[version]):
+            if merged and first <= merged[-1][1] + 1:
+                if last > merged[-1][1]:
+                    merged[-1][1] = last
+            else:
+                merged.append([first, last])
+        for first, last in merged:
+            collapsed.extend(str(network_class(block)) for block in _blocks(first, last, bits))
+    return CollapsedCidrs(collapsed + others, len(strings))
@@ -2,15 +2,27 @@
 """
 import calendar
 import ipaddress
-import json
-import math
 import time
-from typing import List, Union
+from typing import Dict, List, Set, Tuple, Union
 
 import spectreapi
 
 IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
 
+# The details that make up a collector's configuration
+CONFIG_DETAILS = {'detail.Config': True, 'detail.Interface': True}
+
+
+def diff_configs(before: Dict[int, dict], after: Dict[int, dict]) -> Tuple[Set[int], Set[int], Set[int]]:
+    """
+    Compare two snapshots from Server.get_collector_configs(), returning the
+    collector ids (added, removed, changed)
+    """
+    added = after.keys() - before.keys()
+    removed = before.keys() - after.keys()
+    changed = {id_num for id_num in before.keys() & after.keys() if before[id_num] != after[id_num]}
+    return added, removed, changed
+
 
 class Collector:
     """This class encapsulates operations on Spectre collectors.
@@ -23,6 +35,7 @@ class Collector:
         self.name = name
         self.zone = zone
         self.server = server
+        self.last_collapse = None  # What the last set_*_cidrs(collapse=True) sent (a CollapsedCidrs)
 
     def __repr__(self):
         return f'Collector({self.id_num}, "{self.uuid}", "{self.name}", {self.zone.__repr__()}'
@@ -30,41 +43,34 @@ class Collector:
     def __str__(self):
         return f'id={self.id_num}, uuid={self.uuid}, name={self.name}, zone={self.zone.__str__()})'
 
-    def _get_cidrs(self, cidr_type) -> List[IPNetwork]:
+    def _cidr_api(self, cidr_type, method) -> str:
+        """The API path for our <cidr_type> CIDRs, checking we can call <method> on them"""
         if cidr_type not in ('target', 'avoid', 'stop'):
-            raise spectreapi.InvalidArgument(f'{cidr_type} is not a valid type for _get_cidrs')
+            raise spectreapi.InvalidArgument(f'{cidr_type} is not a valid type for {method}')
 
         if self.server is None:
-            raise spectreapi.NoServerException('Collector.getCidrs() needs a Collector with server')
+            raise spectreapi.NoServerException(f'Collector.{method}() needs a Collector with server')
+
+        return f'zone/collector/{self.id_num}/cidr/{cidr_type}'
 
+    def _get_cidrs(self, cidr_type) -> List[IPNetwork]:
+        api = self._cidr_api(cidr_type, '_get_cidrs')
         cidrs = []
-        cidr_results = self.server.get(f'zone/collector/{self.id_num}/cidr/{cidr_type}')
+        cidr_results = self.server.get(api)
         for cidr in cidr_results:
             cidrs.append(ipaddress.ip_network(cidr))
 
         return cidrs
 
-    def _set_cidrs(self, cidr_type, *cidrs, append=False, chunk_size=5000):
-        if cidr_type not in ('target', 'avoid', 'stop'):
-            raise spectreapi.InvalidArgument('%s is not a valid type for _set_cidrs')
-
-        if self.server is None:
-            raise spectreapi.NoServerException('collector.setcidrs() needs a collector with server')
+    def _set_cidrs(self, cidr_type, *cidrs, append=False, chunk_size=5000, collapse=False):
+        api = self._cidr_api(cidr_type, '_set_cidrs')
+        if collapse:
+            cidrs = self.last_collapse = spectreapi.collapse_cidrs(cidrs)
 
-        clist = []
         results = None
-        for cidr in cidrs:
-            if isinstance(cidr, list):  # okay, we're a list of cidrs (hopefully)
-                for c in cidr:
-                    clist.append(f'{{"address":"{c}"}}')
-            else:
-                clist.append(f'{{"address":"{str(cidr)}"}}')
-
-        for i in range(math.ceil(len(clist) / chunk_size)):
-            data = '{"addresses":[' + ','.join(clist[i * chunk_size:(i + 1) * chunk_size]) + ']}'
+        for data in spectreapi.cidr_payloads(cidrs, chunk_size, self.server.codec):
             params = {"append": str(append).lower()}
-            results = self.server.post(f'zone/collector/{self.id_num}/cidr/{cidr_type}',
-                                       data=data, params=params)
+            results = self.server.post(api, data=data, params=params)
             append = True  # after the first chunk, append regardless
 
             if not results.ok:
@@ -73,25 +79,10 @@ class Collector:
         return results
 
     def _delete_cidrs(self, cidr_type, *cidrs, chunk_size=5000):
-        if cidr_type not in ('target', 'avoid', 'stop'):
-            raise spectreapi.InvalidArgument('%s is not a valid type for _delete_cidrs')
-
-        if self.server is None:
-            raise spectreapi.NoServerException('collector._delete_cidrs() needs a server')
-
-        clist = []
+        api = self._cidr_api(cidr_type, '_delete_cidrs')
         results = None
-        for cidr in cidrs:
-            if isinstance(cidr, list):  # okay, we're a list of cidrs (hopefully)
-                for c in cidr:
-                    clist.append(f'{{"address":"{c}"}}')
-            else:
-                clist.append(f'{{"address":"{str(cidr)}"}}')
-
-        for i in range(math.ceil(len(clist) / chunk_size)):
-            data = '{"addresses":[' + ','.join(clist[i * chunk_size:(i + 1) * chunk_size]) + ']}'
-            results = self.server.delete(f'zone/collector/{self.id_num}/cidr/{cidr_type}',
-                                         data=data)
+        for data in spectreapi.cidr_payloads(cidrs, chunk_size, self.server.codec):
+            results = self.server.delete(api, data=data)
             if not results.ok:
                 raise spectreapi.SpectreException(results.text)
 
@@ -106,7 +97,7 @@ class Collector:
     def delete_stop_cidrs(self, *cidrs, chunk_size=5000):
         return self._delete_cidrs('stop', *cidrs, chunk_size=chunk_size)
 
-    def set_target_cidrs(self, *cidrs, append=False, chunk_size=5000):
+    def set_target_cidrs(self, *cidrs, append=False, chunk_size=5000, collapse=False):
         """ Sets Targets for a given Collector.
         By default it will overwrite all targets for this collector, set append=True
         to add CIDRs to the target list.
@@ -122,18 +113,18 @@ class Collector:
         [IPv4Network(...
         >>>
         """
-        return self._set_cidrs('target', *cidrs, append=append, chunk_size=chunk_size)
+        return self._set_cidrs('target', *cidrs, append=append, chunk_size=chunk_size, collapse=collapse)
 
-    def set_avoid_cidrs(self, *cidrs, append=False, chunk_size=5000):
+    def set_avoid_cidrs(self, *cidrs, append=False, chunk_size=5000, collapse=False):
         """Set "Avoid" CIDRs, Spectre shouldn't emit packets
         at these addresses (though we could trace through them
         via path as we're not targeting the hops themselves)"""
-        return self._set_cidrs('avoid', *cidrs, append=append, chunk_size=chunk_size)
+        return self._set_cidrs('avoid', *cidrs, append=append, chunk_size=chunk_size, collapse=collapse)
 
-    def set_stop_cidrs(self, *cidrs, append=False, chunk_size=5000):
+    def set_stop_cidrs(self, *cidrs, append=False, chunk_size=5000, collapse=False):
         """Set "Stop" CIDRs, if Spectre sees a hop in one of
         these CIDRs it should stop tracing that path"""
-        return self._set_cidrs('stop', *cidrs, append=append, chunk_size=chunk_size)
+        return self._set_cidrs('stop', *cidrs, append=append, chunk_size=chunk_size, collapse=collapse)
 
     def get_target_cidrs(self) -> List[IPNetwork]:
         """
@@ -158,7 +149,7 @@ class Collector:
         """Return the list of "Stop" CIDRs for this collector"""
         return self._get_cidrs('stop')
 
-    def add_traces(self, traces, scanType='external', protocol='unspecified'):
+    def _traces_payload(self, traces, scanType, protocol):
         if "traces" not in traces:
             traces = {'traces': [traces]}
 
@@ -172,11 +163,9 @@ class Collector:
         for trace in traces['traces']:
             trace['response'] = responses
 
-        result = self.server.put(f'publish/path/{self.uuid}', data=json.dumps(traces))
-        if not result.ok:
-            raise spectreapi.APIException(result)
+        return self.server.codec.dumps(traces)
 
-    def add_devices(self, devices, scanType='external', protocol='unspecified', nack=False):
+    def _devices_payload(self, devices, scanType, protocol, nack):
         if "devices" not in devices:
             devices = {'devices': [devices]}
 
@@ -189,7 +178,17 @@ class Collector:
         for device in devices['devices']:
             device['responses'] = responses
 
-        result = self.server.put(f'publish/device/{self.uuid}', data=json.dumps(devices))
+        return self.server.codec.dumps(devices)
+
+    def add_traces(self, traces, scanType='external', protocol='unspecified'):
+        result = self.server.put(f'publish/path/{self.uuid}',
+                                 data=self._traces_payload(traces, scanType, protocol))
+        if not result.ok:
+            raise spectreapi.APIException(result)
+
+    def add_devices(self, devices, scanType='external', protocol='unspecified', nack=False):
+        result = self.server.put(f'publish/device/{self.uuid}',
+                                 data=self._devices_payload(devices, scanType, protocol, nack))
         if not result.ok:
             raise spectreapi.APIException(result)
 
@@ -201,7 +200,7 @@ class Collector:
         if not results.ok:
             raise spectreapi.APIException(results)
 
-        return json.loads(results.results.text).get('result')
+        return results.json().get('result')
 
     def set_property(self, prop, value, *, query_first=True):
         if self.server is None:
@@ -214,14 +213,15 @@ class Collector:
                                   params={'value': value})
         if not results.ok:
             raise spectreapi.APIException(results)
+        if self.server.cache is not None:
+            # Properties are set with a GET, so the cache can't tell this changed the collector
+            self.server.cache.invalidate(f'zone/collector/{self.id_num}')
 
     def get_config(self):
         if self.server is None:
             raise spectreapi.NoServerException(
                 'Collector.get_property() needs a server')
 
-        results = self.server.get('/zone/collector',
-                                  params={'detail.Config': True,
-                                          'detail.Interface': True,
-                                          'filter.collector.id': self.id_num})
-        return json.loads(results.results.text).get('results')[0]
+        results = self.server.get('zone/collector',
+                                  params=dict(CONFIG_DETAILS, **{'filter.collector.id': self.id_num}))
+        return results.value()
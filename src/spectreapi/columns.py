@@ -0,0 +1,315 @@
+"""
+Compact, column oriented storage for large result sets.
+
+A million devices as dicts (each repeating "@class", "ip", "mac",
+"firstObserved"...) costs several GB.  Columns keeps each field in its own
+array instead: integers and timestamps in array('q'), IP addresses as packed
+integers, and strings dictionary encoded so each distinct value is stored
+once.  The arrays support the buffer protocol, so they can be handed
+straight to numpy (numpy.frombuffer) for vectorized filtering.
+"""
+import ipaddress
+import sys
+from array import array
+from typing import Iterable, List, Optional
+
+INT_NULL = -2 ** 63
+
+
+def _lookup(row, field):
+    """Get <field> from <row>, following dotted names into nested dicts (e.g. "zone.id")"""
+    if field in row:
+        return row[field]
+    value = row
+    for part in field.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _is_ip_field(field):
+    name = field.rsplit('.', 1)[-1]
+    return name == 'ip' or name.endswith('Ip')
+
+
+class IntColumn:
+    """Integers (ids, timestamps...) in an array('q'), None stored as INT_NULL"""
+    typecode = 'q'
+    null = INT_NULL
+
+    def __init__(self, nulls=0):
+        self.data = array(self.typecode, [self.null]) * nulls
+
+    def append(self, value):
+        if value is None:
+            self.data.append(INT_NULL)
+        elif isinstance(value, bool) or not isinstance(value, int):
+            raise TypeError(value)
+        else:
+            self.data.append(value)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        value = self.data[i]
+        return None if value == INT_NULL else value
+
+    def take(self, indices):
+        column = type(self)()
+        column.data = array(self.typecode, (self.data[i] for i in indices))
+        return column
+
+
+class FloatColumn(IntColumn):
+    """Floats in an array('d'), None stored as NaN"""
+    typecode = 'd'
+    null = float('nan')
+
+    def append(self, value):
+        if value is None:
+            self.data.append(self.null)
+        elif isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise TypeError(value)
+        else:
+            self.data.append(value)
+
+    def __getitem__(self, i):
+        value = self.data[i]
+        return None if value != value else value
+
+
+class BoolColumn(IntColumn):
+    """Booleans in an array('b'): 1, 0 or -1 for None"""
+    typecode = 'b'
+    null = -1
+
+    def append(self, value):
+        if value is None:
+            self.data.append(self.null)
+        elif not isinstance(value, bool):
+            raise TypeError(value)
+        else:
+            self.data.append(value)
+
+    def __getitem__(self, i):
+        value = self.data[i]
+        return None if value < 0 else bool(value)
+
+
+class StrColumn:
+    """Dictionary encoded strings: each distinct string is kept once in <values>
+    and each row is an index into it in <codes> (-1 for None)"""
+
+    def __init__(self, nulls=0):
+        self.codes = array('l', [-1]) * nulls
+        self.values = []
+        self._index = {}
+
+    def _code(self, value):
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.values)
+            self.values.append(sys.intern(value))
+        return code
+
+    def append(self, value):
+        if value is None:
+            self.codes.append(-1)
+        elif not isinstance(value, str):
+            raise TypeError(value)
+        else:
+            self.codes.append(self._code(value))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        code = self.codes[i]
+        return None if code < 0 else self.values[code]
+
+    def take(self, indices):
+        """A new column of the rows at <indices>, with its own dictionary of just their values"""
+        column = StrColumn()
+        for i in indices:
+            column.append(self[i])
+        return column
+
+    def equals(self, value) -> List[bool]:
+        """Mask of the rows equal to <value> (one dictionary lookup, then integer compares)"""
+        code = self._index.get(value, -2)
+        return [c == code for c in self.codes]
+
+
+class IPColumn:
+    """
+    IP addresses packed into integers: <version> is 4, 6 or 0 (None) and
+    the address is split across the <hi> and <lo> 64 bit halves
+    (IPv4 addresses live entirely in <lo>).
+    """
+
+    def __init__(self, nulls=0):
+        self.version = array('B', [0]) * nulls
+        self.hi = array('Q', [0]) * nulls
+        self.lo = array('Q', [0]) * nulls
+
+    def append(self, value):
+        if value is None:
+            version, address = 0, 0
+        elif not isinstance(value, str):
+            raise TypeError(value)
+        else:
+            ip = ipaddress.ip_address(value)
+            version, address = ip.version, int(ip)
+        self.version.append(version)
+        self.hi.append(address >> 64)
+        self.lo.append(address & 0xFFFFFFFFFFFFFFFF)
+
+    def __len__(self):
+        return len(self.version)
+
+    def address(self, i) -> Optional[int]:
+        """The address in row <i> as an integer"""
+        if not self.version[i]:
+            return None
+        return self.hi[i] << 64 | self.lo[i]
+
+    def __getitem__(self, i):
+        version = self.version[i]
+        if not version:
+            return None
+        address = self.hi[i] << 64 | self.lo[i]
+        return str(ipaddress.IPv4Address(address) if version == 4 else ipaddress.IPv6Address(address))
+
+    def take(self, indices):
+        column = IPColumn()
+        column.version = array('B', (self.version[i] for i in indices))
+        column.hi = array('Q', (self.hi[i] for i in indices))
+        column.lo = array('Q', (self.lo[i] for i in indices))
+        return column
+
+    def in_network(self, network) -> List[bool]:
+        """Mask of the rows whose address falls inside <network>"""
+        network = ipaddress.ip_network(network, strict=False)
+        first = int(network.network_address)
+        last = int(network.broadcast_address)
+        version = network.version
+        if version == 4:
+            return [v == 4 and first <= lo <= last for v, lo in zip(self.version, self.lo)]
+        return [v == 6 and first <= (hi << 64 | lo) <= last
+                for v, hi, lo in zip(self.version, self.hi, self.lo)]
+
+
+class ObjectColumn:
+    """Anything else (nested dicts, lists, mixed types) kept as a plain list"""
+
+    def __init__(self, nulls=0):
+        self.data = [None] * nulls
+
+    def append(self, value):
+        self.data.append(value)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        return self.data[i]
+
+    def take(self, indices):
+        column = ObjectColumn()
+        column.data = [self.data[i] for i in indices]
+        return column
+
+
+def _column_for(field, value, nulls):
+    """Pick a column type for <field> based on the first real value we see"""
+    if isinstance(value, bool):
+        return BoolColumn(nulls)
+    if isinstance(value, int):
+        return IntColumn(nulls)
+    if isinstance(value, float):
+        return FloatColumn(nulls)
+    if isinstance(value, str):
+        if _is_ip_field(field):
+            try:
+                ipaddress.ip_address(value)
+                return IPColumn(nulls)
+            except ValueError:
+                pass
+        return StrColumn(nulls)
+    return ObjectColumn(nulls)
+
+
+class Columns:
+    """
+    A batch of results stored column by column (see the module docstring).
+
+    >>> import spectreapi
+    >>> s=spectreapi.UsernameServer('server','username','password')
+    >>> devices = s.query().filter('zone.id', 2).run().to_columns(['id', 'ip', 'mac', 'lastObserved'])
+    >>> inside = devices.filter(devices['ip'].in_network('10.20.0.0/14'))
+    """
+
+    def __init__(self, fields: Iterable[str]):
+        self.fields = list(fields)
+        self.columns = {field: None for field in self.fields}
+        self._nulls = {field: 0 for field in self.fields}
+        self.length = 0
+
+    def __repr__(self):
+        return f'Columns({self.fields}, {self.length} rows)'
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, field):
+        column = self.columns[field]
+        if column is None:
+            column = self.columns[field] = ObjectColumn(self._nulls[field])
+        return column
+
+    def append(self, row):
+        """Add one result (a dict) to the batch"""
+        for field in self.fields:
+            value = _lookup(row, field)
+            column = self.columns[field]
+            if column is None:
+                if value is None:
+                    self._nulls[field] += 1
+                    continue
+                column = self.columns[field] = _column_for(field, value, self._nulls[field])
+            try:
+                column.append(value)
+            except (TypeError, ValueError):
+                # The field isn't the type we guessed, fall back to keeping objects
+                fallback = ObjectColumn()
+                fallback.data = [column[i] for i in range(len(column))]
+                fallback.append(value)
+                self.columns[field] = fallback
+        self.length += 1
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+        return self
+
+    def row(self, i) -> dict:
+        """Row <i> as a dict"""
+        return {field: self[field][i] for field in self.fields}
+
+    def __iter__(self):
+        for i in range(self.length):
+            yield self.row(i)
+
+    def take(self, indices) -> 'Columns':
+        """A new Columns holding just rows <indices>"""
+        indices = list(indices)
+        taken = Columns(self.fields)
+        taken.columns = {field: self[field].take(indices) for field in self.fields}
+        taken.length = len(indices)
+        return taken
+
+    def filter(self, mask) -> 'Columns':
+        """A new Columns holding the rows where <mask> is true"""
+        return self.take(i for i, keep in enumerate(mask) if keep)
@@ -0,0 +1,187 @@
+"""
+Streaming export of query results to disk as NDJSON or CSV.
+
+Rows are written as each page is decoded, so memory stays bounded no matter
+how big the result set is.  For NDJSON there's also a raw mode that copies
+each result's JSON text straight from the page body into the file without
+decoding it into Python objects and encoding it again.
+"""
+import csv
+import os
+import re
+import time
+
+import spectreapi
+from spectreapi.columns import _lookup
+
+_RESULTS = re.compile(rb'"results"\s*:\s*\[')
+_TOTAL = re.compile(rb'"total"\s*:\s*(\d+)')
+_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|[\[\]{},]')
+# Newlines can't appear inside JSON strings, so a newline and the indentation after it is always layout
+_LAYOUT = re.compile(rb'\r?\n\s*')
+
+
+class ExportStats:
+    """What an export wrote and how fast it went"""
+
+    def __init__(self, path, rows=0, nbytes=0, seconds=0.0):
+        self.path = path
+        self.rows = rows
+        self.bytes = nbytes
+        self.seconds = seconds
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def __repr__(self):
+        return f'ExportStats({self.path!r}, rows={self.rows}, bytes={self.bytes}, seconds={self.seconds:.3f})'
+
+    def __str__(self):
+        return (f'{self.rows} rows, {self.bytes} bytes to {self.path} in {self.seconds:.1f}s '
+                f'({self.rows_per_second:.0f} rows/s, {self.bytes_per_second / 1e6:.2f} MB/s)')
+
+
+def raw_results(body):
+    """
+    Split the "results" array of a page <body> (bytes) into the raw JSON text
+    of each element, without decoding them.  Returns (total, elements); total
+    is None if the page doesn't have one.
+    """
+    match = _RESULTS.search(body)
+    if match is None:
+        total = _TOTAL.search(body)
+        return (int(total.group(1)) if total else None), []
+
+    total = _TOTAL.search(body, 0, match.start())
+    elements = []
+    depth = 0
+    start = end = match.end()
+    for token in _TOKEN.finditer(body, match.end()):
+        end = token.end()
+        char = token.group()[0]
+        if char in b'[{':
+            depth += 1
+        elif char in b']}':
+            if depth == 0:
+                element = body[start:token.start()].strip()
+                if element:
+                    elements.append(_LAYOUT.sub(b'', element))
+                break
+            depth -= 1
+        elif char == ord(',') and depth == 0:
+            elements.append(_LAYOUT.sub(b'', body[start:token.start()].strip()))
+            start = token.end()
+
+    if total is None:
+        total = _TOTAL.search(body, end)
+    return (int(total.group(1)) if total else None), elements
+
+
+class _RawWriter:
+    """Copies each result of a page body out as a line of NDJSON"""
+
+    def __init__(self, out, size):
+        self.out = out
+        self.size = size
+        self.rows = self.bytes = self.pages = 0
+
+    def write_page(self, body) -> bool:
+        """Write the results in page <body>, returns whether that was the last page"""
+        total, elements = raw_results(body)
+        for element in elements:
+            self.out.write(element)
+            self.out.write(b'\n')
+            self.bytes += len(element) + 1
+        self.rows += len(elements)
+        self.pages += 1
+        return len(elements) < self.size or (total is not None and self.pages * self.size >= total)
+
+
+class _NdjsonWriter:
+    def __init__(self, out, fields, codec):
+        self.out = out
+        self.fields = fields
+        self.codec = codec
+        self.rows = self.bytes = 0
+
+    def write(self, row):
+        if self.fields:
+            row = {field: _lookup(row, field) for field in self.fields}
+        line = self.codec.dumps(row) + b'\n'
+        self.out.write(line)
+        self.rows += 1
+        self.bytes += len(line)
+
+
+def _csv_value(value, codec):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return codec.dumps(value).decode('utf-8')
+    return value
+
+
+class _CsvWriter:
+    def __init__(self, out, fields, codec):
+        self.out = out
+        self.fields = fields
+        self.codec = codec
+        self.writer = None
+        self.rows = 0
+
+    def write(self, row):
+        if self.writer is None:
+            self.fields = self.fields or list(row)
+            self.writer = csv.writer(self.out)
+            self.writer.writerow(self.fields)
+        self.writer.writerow([_csv_value(_lookup(row, field), self.codec) for field in self.fields])
+        self.rows += 1
+
+
+def _check_export(format, fields, raw):
+    if format not in ('ndjson', 'csv'):
+        raise spectreapi.InvalidArgument(f'{format} is not a valid export format')
+    if raw and (format != 'ndjson' or fields):
+        raise spectreapi.InvalidArgument('raw export is only for NDJSON with all fields')
+
+
+def export_results(server, api, params, path, format='ndjson', fields=None, raw=False) -> ExportStats:
+    """
+    Write every result of GETting <api> with <params> to <path>, one page at
+    a time.  <format> is "ndjson" or "csv"; <fields> picks (and orders) the
+    fields written (dotted names reach into nested objects, e.g. "zone.id").
+    CSV defaults to the fields of the first result.
+
+    raw=True (NDJSON only, all fields) copies each result's JSON text
+    straight out of the page body without decoding and re-encoding it.
+    """
+    _check_export(format, fields, raw)
+
+    start = time.perf_counter()
+    if format == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8') as out:
+            writer = _CsvWriter(out, fields, server.codec)
+            for row in server.get(api, params, stream=True):
+                writer.write(row)
+        rows, nbytes = writer.rows, os.path.getsize(path)
+    elif raw:
+        with open(path, 'wb') as out:
+            writer = _RawWriter(out, server.page_size_for(api))
+            while True:
+                page = server.getpage(api, params, page=writer.pages, page_size=writer.size)
+                if writer.write_page(page.content):
+                    break
+        rows, nbytes = writer.rows, writer.bytes
+    else:
+        with open(path, 'wb') as out:
+            writer = _NdjsonWriter(out, fields, server.codec)
+            for row in server.get(api, params, stream=True):
+                writer.write(row)
+        rows, nbytes = writer.rows, writer.bytes
+
+    return ExportStats(path, rows, nbytes, time.perf_counter() - start)
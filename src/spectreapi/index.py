@@ -0,0 +1,206 @@
+"""
+A local index of devices by IP address.
+
+"Which device is 10.20.1.7?" or "which devices are inside 10.20.0.0/14?"
+would otherwise each be another zonedata/devices query.  A DeviceIndex is
+built once from a query's results and answers them locally: addresses are
+kept as integers in sorted arrays (one per IP version), so a point lookup
+or the start and end of a CIDR range is a binary search.  Networks (a
+zone's known CIDRs, say) can be added too, for longest-prefix matches.
+"""
+import ipaddress
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# array('L') is 8 bytes on most 64 bit platforms, 'I' is enough for IPv4 where it's 4
+_IPV4_TYPECODE = 'I' if array('I').itemsize >= 4 else 'L'
+_BITS = {4: 32, 6: 128}
+
+
+class _Addresses:
+    """The addresses of one IP version, sorted, with the id of the device at each"""
+
+    def __init__(self, version):
+        self.addresses = array(_IPV4_TYPECODE) if version == 4 else []  # IPv6 doesn't fit in an array
+        self.ids = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def build(self, pairs):
+        pairs = sorted(pairs, key=lambda pair: pair[0])
+        del self.addresses[:]
+        self.addresses.extend(address for address, _ in pairs)
+        self.ids = [id_num for _, id_num in pairs]
+
+    def insert(self, address, id_num):
+        i = bisect_right(self.addresses, address)
+        self.addresses.insert(i, address)
+        self.ids.insert(i, id_num)
+
+    def remove(self, address, id_num):
+        i = bisect_left(self.addresses, address)
+        while i < len(self.ids) and self.addresses[i] == address:
+            if self.ids[i] == id_num:
+                del self.addresses[i]
+                del self.ids[i]
+                return
+            i += 1
+
+    def between(self, first, last) -> List:
+        """The ids of the devices with addresses from <first> to <last> (inclusive)"""
+        return self.ids[bisect_left(self.addresses, first):bisect_right(self.addresses, last)]
+
+
+def _parse(ip_address) -> Optional[Tuple[int, int]]:
+    """(version, integer address) for <ip_address>, None if it isn't one"""
+    if ip_address is None:
+        return None
+    try:
+        ip_address = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return None
+    return ip_address.version, int(ip_address)
+
+
+class DeviceIndex:
+    """
+    Devices (zonedata/devices rows) indexed by their <key> address
+    ("ip" by default), upserted by <id_field>.  Pass <fields> to keep just those
+    fields of each device rather than the whole row.  Rows without an
+    <id_field> are keyed by their address instead.
+
+    >>> import spectreapi
+    >>> s=spectreapi.UsernameServer('server','username','password')
+    >>> zone = s.get_zone_by_name('Twilight')
+    >>> index = zone.query().run().to_index(['id', 'ip', 'mac', 'lastObserved'])
+    >>> index.get('10.20.1.7')
+    >>> len(list(index.within('10.20.0.0/14')))
+    >>> index.add_networks(zone.get_known_cidrs())
+    >>> index.longest_prefix('10.20.1.7')
+    """
+
+    def __init__(self, rows: Iterable[dict] = (), fields=None, key='ip', id_field='id'):
+        self.fields = list(fields) if fields else None
+        self.key = key
+        self.id_field = id_field
+        self.devices = {}
+        self._addresses = {4: _Addresses(4), 6: _Addresses(6)}
+        self._where = {}  # device id -> (version, address) it's indexed under
+        self._networks = {4: {}, 6: {}}  # version -> prefix length -> network >> host bits -> value
+        self._prefix_lengths = {4: [], 6: []}
+        self.update(rows)
+
+    @classmethod
+    def from_query(cls, query, fields=None, **kargs) -> 'DeviceIndex':
+        """Run <query> and index the results"""
+        return cls(query.run(), fields=fields, **kargs)
+
+    def __repr__(self):
+        networks = sum(len(nets) for by_length in self._networks.values() for nets in by_length.values())
+        return f'DeviceIndex({len(self.devices)} devices, {networks} networks)'
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __contains__(self, ip_address):
+        return self.get(ip_address) is not None
+
+    def _keep(self, row) -> dict:
+        if self.fields is None:
+            return row
+        return {field: row.get(field) for field in self.fields}
+
+    def update(self, rows: Iterable[dict]) -> int:
+        """
+        Add or replace devices (matched by id) from <rows>, e.g. the
+        results of a later query for what's changed.  Returns how many rows
+        were indexed.
+        """
+        moves = []
+        count = 0
+        for row in rows:
+            count += 1
+            id_num = row.get(self.id_field, row.get(self.key))
+            where = _parse(row.get(self.key))
+            self.devices[id_num] = self._keep(row)
+            old = self._where.get(id_num)
+            if old != where:
+                moves.append((id_num, old, where))
+                if where is None:
+                    self._where.pop(id_num, None)
+                else:
+                    self._where[id_num] = where
+
+        if len(moves) > len(self._where) // 8:  # Cheaper to sort everything again than to insert one by one
+            self._rebuild()
+        else:
+            for id_num, old, where in moves:
+                if old is not None:
+                    self._addresses[old[0]].remove(old[1], id_num)
+                if where is not None:
+                    self._addresses[where[0]].insert(where[1], id_num)
+        return count
+
+    def remove(self, ids: Iterable) -> int:
+        """Drop the devices with <ids>, returns how many there were"""
+        removed = 0
+        for id_num in ids:
+            if self.devices.pop(id_num, None) is None:
+                continue
+            removed += 1
+            where = self._where.pop(id_num, None)
+            if where is not None:
+                self._addresses[where[0]].remove(where[1], id_num)
+        return removed
+
+    def _rebuild(self):
+        for version, addresses in self._addresses.items():
+            addresses.build((address, id_num) for id_num, (v, address) in self._where.items() if v == version)
+
+    def get(self, ip_address) -> Optional[dict]:
+        """The device with address <ip_address> (None if there isn't one)"""
+        devices = self.get_all(ip_address)
+        return devices[0] if devices else None
+
+    def get_all(self, ip_address) -> List[dict]:
+        """Every device with address <ip_address>"""
+        where = _parse(ip_address)
+        if where is None:
+            return []
+        return [self.devices[id_num] for id_num in self._addresses[where[0]].between(where[1], where[1])]
+
+    def within(self, network) -> Iterator[dict]:
+        """The devices inside <network> (a CIDR or ipaddress network), in address order"""
+        network = ipaddress.ip_network(network, strict=False)
+        ids = self._addresses[network.version].between(int(network.network_address),
+                                                       int(network.broadcast_address))
+        return (self.devices[id_num] for id_num in ids)
+
+    def add_networks(self, networks: Iterable, value=None):
+        """Add <networks> (CIDRs or ipaddress networks) for longest_prefix(),
+        each mapping to <value> (default the network itself, as a string)"""
+        for network in networks:
+            network = ipaddress.ip_network(network, strict=False)
+            host_bits = _BITS[network.version] - network.prefixlen
+            by_length = self._networks[network.version]
+            if network.prefixlen not in by_length:
+                by_length[network.prefixlen] = {}
+                self._prefix_lengths[network.version] = sorted(by_length, reverse=True)
+            by_length[network.prefixlen][int(network.network_address) >> host_bits] = \
+                str(network) if value is None else value
+
+    def longest_prefix(self, ip_address):
+        """The value of the most specific network added with add_networks()
+        that contains <ip_address> (None if none do)"""
+        where = _parse(ip_address)
+        if where is None:
+            return None
+        version, address = where
+        by_length = self._networks[version]
+        for length in self._prefix_lengths[version]:
+            value = by_length[length].get(address >> (_BITS[version] - length))
+            if value is not None:
+                return value
+        return None
@@ -0,0 +1,128 @@
+"""
+Scheduling collector inhibits.
+
+Server.initiate_collector_inhibits goes through the collectors one at a
+time, reading and then setting each one's "inhibited" property: two round
+trips per collector, back to back.  An InhibitScheduler reads all the
+properties concurrently, works out which collectors actually need to
+change, and only sets those (also concurrently).  It can run once, or as a
+daemon that ticks every <interval> seconds keeping the collector list
+between ticks.
+"""
+import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+import spectreapi
+
+
+def _as_property(value) -> str:
+    """Properties come back as booleans or strings, we set them as 'true'/'false'"""
+    return str(value).lower()
+
+
+class InhibitScheduler:
+    """
+    Inhibits collectors for which func(t, collector) returns True and
+    un-inhibits the rest (see Server.initiate_collector_inhibits), talking
+    to the server on <workers> threads.  The collector list is fetched again
+    once it's more than <refresh_seconds> old.
+
+    >>> import spectreapi
+    >>> def weekday_inhibit(t, collector):
+    ...     return t.weekday() < 5 and collector.name == "Foo"
+    >>> s = spectreapi.UsernameServer('command_center', 'username', 'password')
+    >>> scheduler = spectreapi.InhibitScheduler(s, weekday_inhibit, workers=16, interval=600)
+    >>> scheduler.tick()                 # once, e.g. from cron
+    >>> scheduler.start()                # or every 10 minutes on a daemon thread
+    """
+
+    def __init__(self, server, func, workers=8, interval=600.0, refresh_seconds=3600.0, debug=False):
+        self.server = server
+        self.func = func
+        self.workers = workers
+        self.interval = interval
+        self.refresh_seconds = refresh_seconds
+        self.debug = debug
+        self.errors = {}
+        self.ticks = 0
+        self._collectors = None
+        self._loaded_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        return f'InhibitScheduler({self.func.__name__}, workers={self.workers}, interval={self.interval})'
+
+    def collectors(self):
+        """The collectors, fetched again if our list is older than refresh_seconds"""
+        if self._collectors is None or time.monotonic() - self._loaded_at >= self.refresh_seconds:
+            self._collectors = self.server.get_collectors()
+            self._loaded_at = time.monotonic()
+        return self._collectors
+
+    def _each(self, executor, fn, collectors):
+        """Run fn(collector) for each collector, returning results and errors by collector"""
+        futures = {collector: executor.submit(fn, collector) for collector in collectors}
+        results = {}
+        for collector, future in futures.items():
+            try:
+                results[collector] = future.result()
+            except Exception as e:  # One collector failing shouldn't stop the rest
+                self.errors[collector.name] = e
+        return results
+
+    def tick(self, t=None) -> Dict[str, str]:
+        """
+        Bring every collector's inhibited property in line with func as of
+        <t> (default now).  Returns the collectors we changed (name to the
+        new value); any that failed are in <errors>.
+        """
+        t = t or datetime.datetime.now()
+        if self.debug:
+            print(t)
+        self.errors = {}
+        self.ticks += 1
+
+        collectors = self.collectors()
+        wanted = {collector: 'true' if self.func(t, collector) else 'false' for collector in collectors}
+
+        self.server.prepare_threads(self.workers)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='spectreapi-inhibit') as executor:
+            current = self._each(executor, lambda c: c.get_property('inhibited'), collectors)
+            changes = [c for c, value in current.items() if _as_property(value) != wanted[c]]
+            done = self._each(executor, lambda c: c.set_property('inhibited', wanted[c], query_first=False),
+                              changes)
+
+        changed = {collector.name: wanted[collector] for collector in changes if collector in done}
+        if self.debug:
+            for name, value in changed.items():
+                print(f'{"Inhibiting" if value == "true" else "Dis-Inhibiting"} collector {name}')
+            for name, e in self.errors.items():
+                print(f'Collector {name} failed: {e}')
+        return changed
+
+    def run_forever(self):
+        """Tick every <interval> seconds until stop() is called"""
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except (spectreapi.SpectreException, OSError) as e:  # e.g. the server's down, try again next tick
+                if self.debug:
+                    print(f'Tick failed: {e}')
+            self._stop.wait(self.interval)
+
+    def start(self) -> threading.Thread:
+        """run_forever() on a daemon thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, name='spectreapi-inhibit-scheduler',
+                                        daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, wait=True):
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,71 @@
+"""
+Adaptive page sizing.
+
+A fixed page size is a poor fit for every endpoint at once: thin "zone"
+listings want big pages (fewer round trips) while zonedata/devices with lots
+of details turned on wants small ones (pages that don't take forever or time
+out).  AdaptivePageSize tunes query.pagesize per API path from what it sees.
+"""
+import threading
+
+
+class AdaptivePageSize:
+    """
+    Picks a page size per API path, aiming for pages that take about
+    <target_seconds> to fetch and (optionally) are no bigger than
+    <target_bytes>, staying within <min_size> and <max_size>.
+
+    Sizes are always <min_size> times a power of two, which lets a Response
+    change page size part way through an iteration and still land on page
+    boundaries.
+
+    >>> import spectreapi
+    >>> sizer = spectreapi.AdaptivePageSize(min_size=50, max_size=6400, target_seconds=2)
+    >>> s = spectreapi.APIKeyServer('server', api_key='...', adaptive_page_size=sizer)
+    """
+
+    def __init__(self, min_size=50, max_size=5000, target_seconds=2.0, target_bytes=None, initial=500):
+        if min_size < 1 or max_size < min_size:
+            raise ValueError('AdaptivePageSize needs 1 <= min_size <= max_size')
+        self.min_size = min_size
+        self.max_size = self._snap(max_size, min_size=min_size, max_size=max_size)
+        self.target_seconds = target_seconds
+        self.target_bytes = target_bytes
+        self.initial = self._snap(initial)
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'AdaptivePageSize({self._sizes})'
+
+    def _snap(self, size, min_size=None, max_size=None):
+        """Round <size> down to min_size * 2**n, within our bounds"""
+        min_size = min_size or self.min_size
+        max_size = max_size or self.max_size
+        snapped = min_size
+        while snapped * 2 <= min(size, max_size):
+            snapped *= 2
+        return snapped
+
+    def size_for(self, api):
+        """The page size we'd currently use for <api>"""
+        return self._sizes.get(api, self.initial)
+
+    def observe(self, api, size, rows, seconds, nbytes):
+        """
+        Feed back how fetching a page of <size> from <api> went:
+        <rows> results came back in <seconds> carrying <nbytes> bytes.
+        A short page (the last of a query) says little about throughput, as
+        its time is mostly latency, so it's ignored.
+        """
+        if rows <= 0 or rows < size or seconds <= 0:
+            return
+
+        ideal = rows * self.target_seconds / seconds
+        if self.target_bytes and nbytes > 0:
+            ideal = min(ideal, rows * self.target_bytes / nbytes)
+
+        with self._lock:
+            current = self._sizes.get(api, self.initial)
+            # Don't let one quick page make us more than double; slow pages we back off from straight away
+            self._sizes[api] = self._snap(min(ideal, 2 * current))
@@ -0,0 +1,201 @@
+"""
+Running a query as several smaller ones at once.
+
+A query is one stream of pages, fetched one after the other, and the
+server gets slower the deeper the page offset.  When the results split
+naturally (by zone, or by address range) each part can be its own filtered
+query with its own, shallower, pages, and the parts can run concurrently.
+run_partitioned() does that and merges the rows into one iterator, keeping
+a Partition per part to say how far along it is.
+"""
+import ipaddress
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional
+
+import spectreapi
+
+# The filter (less its "filter." prefix) restricting devices to a CIDR
+CIDR_FILTER = 'address.cidr'
+
+
+class Partition:
+    """One part of a partitioned query: its <name>, the <params> it runs
+    with and how far along it is (<rows> of <total>, <done>)"""
+
+    def __init__(self, name, params, network=None):
+        self.name = name
+        self.params = params
+        self.network = network
+        self.total = None
+        self.rows = 0
+        self.done = False
+
+    def __repr__(self):
+        total = '?' if self.total is None else self.total
+        return f'Partition({self.name!r}, {self.rows}/{total}{", done" if self.done else ""})'
+
+    @property
+    def fraction(self) -> float:
+        """How much of the partition we've had (0 to 1)"""
+        if self.done:
+            return 1.0
+        return self.rows / self.total if self.total else 0.0
+
+    def keep(self, row) -> bool:
+        """Whether <row> belongs to this partition (in case the server didn't filter it out)"""
+        if self.network is None:
+            return True
+        try:
+            return ipaddress.ip_address(row.get('ip')) in self.network
+        except (TypeError, ValueError):
+            return False
+
+
+def _zone_partitions(query, zones) -> List[Partition]:
+    zone_id = query.params.get('filter.zone.id')
+    return [Partition(zone.name, dict(query.params, **{'filter.zone.id': zone.id_num}))
+            for zone in zones if zone_id is None or str(zone.id_num) == str(zone_id)]
+
+
+def _cidr_partitions(query, cidrs, cidr_filter) -> List[Partition]:
+    networks = sorted((ipaddress.ip_network(cidr, strict=False) for cidr in spectreapi.cidr_strings(cidrs)),
+                      key=lambda network: (network.version, network))
+    for before, after in zip(networks, networks[1:]):
+        if before.version == after.version and before.overlaps(after):
+            raise spectreapi.InvalidArgument(f'Partitions must not overlap ({before} and {after} do)')
+    return [Partition(str(network), dict(query.params, **{'filter.' + cidr_filter: str(network)}), network)
+            for network in networks]
+
+
+def _partitions(query, by, zones, cidr_filter) -> List[Partition]:
+    """Split <query> <by> zone (out of <zones>) or by a list of CIDRs"""
+    if by == 'zone':
+        return _zone_partitions(query, zones)
+    try:
+        return _cidr_partitions(query, [by] if isinstance(by, str) else by, cidr_filter)
+    except (TypeError, ValueError):
+        raise spectreapi.InvalidArgument(f"Partition by 'zone' or a list of CIDRs, not {by!r}") from None
+
+
+class PartitionedResults:
+    """
+    The merged rows of a partitioned query (see Query.run_partitioned).
+    <partitions> says how far along each part is; iterating again runs
+    the query again from scratch.
+    """
+
+    def __init__(self, query, partitions, workers=4, progress=None):
+        self.query = query
+        self.partitions = partitions
+        self.workers = workers
+        self.progress = progress
+
+    def __repr__(self):
+        return f'PartitionedResults({len(self.partitions)} partitions, {self.rows} rows)'
+
+    @property
+    def rows(self) -> int:
+        return sum(partition.rows for partition in self.partitions)
+
+    @property
+    def total(self) -> Optional[int]:
+        """The total across all partitions, once every one has started"""
+        if any(partition.total is None for partition in self.partitions):
+            return None
+        return sum(partition.total for partition in self.partitions)
+
+    def _reset(self):
+        for partition in self.partitions:
+            partition.total = None
+            partition.rows = 0
+            partition.done = False
+
+    def _projection(self, partition):
+        """The fields to ask the server to keep, and how to project rows ourselves"""
+        fields = self.query.projection
+        if fields and partition.network is not None:  # keep() needs the address, so project after it
+            return None, spectreapi.projector(fields)
+        return fields, None
+
+    def _take(self, partition, page):
+        """Account for a <page> of rows (None once it's done) that came in for <partition>"""
+        if isinstance(page, Exception):
+            raise page
+        if page is None:
+            partition.done = True
+        else:
+            partition.rows += len(page)
+        if self.progress is not None:
+            self.progress(partition)
+
+    def _run(self, partition, results, stop):
+        """Fetch one partition (on a worker thread), handing its rows over a page at a time"""
+        def put(item):
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        if stop.is_set():  # Abandoned before we got going
+            return
+        try:
+            fields, project = self._projection(partition)
+            response = self.query.server.get(self.query.api, partition.params, fields=fields)
+            partition.total = response.total
+            size = self.query.server.page_size_for(self.query.api)
+            page = []
+            for row in response:
+                if partition.keep(row):
+                    page.append(row if project is None else project(row))
+                if len(page) >= size:
+                    if not put((partition, page)):
+                        return
+                    page = []
+            if page and not put((partition, page)):
+                return
+        except Exception as e:  # Handed over to be raised in the caller's thread
+            put((partition, e))
+            return
+        put((partition, None))
+
+    def __iter__(self) -> Iterator[dict]:
+        self._reset()
+        if not self.partitions:
+            return
+        self.query.server.prepare_threads(self.workers)
+        results = queue.Queue(maxsize=2 * self.workers)
+        stop = threading.Event()
+        running = len(self.partitions)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='spectreapi-partition') as executor:
+            futures = []
+            try:
+                for partition in self.partitions:
+                    futures.append(executor.submit(self._run, partition, results, stop))
+                while running:
+                    partition, page = results.get()
+                    self._take(partition, page)
+                    if page is None:
+                        running -= 1
+                    elif page:
+                        yield from page
+            finally:
+                stop.set()
+                for future in futures:  # Partitions that haven't started never will
+                    future.cancel()
+
+
+def run_partitioned(query, by='zone', workers=4, progress: Callable[[Partition], None] = None,
+                    cidr_filter=CIDR_FILTER) -> PartitionedResults:
+    """
+    Split <query> into disjoint sub-queries <by> zone (by='zone') or by
+    address range (a list of CIDRs), run them on <workers> threads and
+    merge the rows as they come.  <progress> is called with the Partition
+    each time one gets more rows or finishes.
+    """
+    partitions = _partitions(query, by, query.server.get_zones() if by == 'zone' else None, cidr_filter)
+    return PartitionedResults(query, partitions, workers=workers, progress=progress)
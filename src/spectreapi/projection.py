@@ -0,0 +1,60 @@
+"""
+Asking for less: detail presets and field projection.
+
+Every detail.* flag makes each device bigger on the wire, and most scripts
+only look at a handful of fields of what comes back.  DETAIL_PRESETS names
+the usual sets of details (Query.preset), and a projector cuts each result
+down to the fields asked for (Query.fields) as each page is decoded, so
+only those are held onto and handed along.
+"""
+from typing import Callable, Dict, Iterable, Tuple
+
+import spectreapi
+
+# Everything get_device_details_by_ip asks for
+_ALL_DETAILS = ('ScanType', 'Attributes', 'Protocol', 'Port', 'AlternateAddress', 'Profile', 'ProfileDetails',
+                'ReferenceIp', 'Details', 'LeakResponse', 'Certificate', 'Interfaces', 'Vlans', 'Collector',
+                'SnmpAlias')
+
+DETAIL_PRESETS: Dict[str, Tuple[str, ...]] = {
+    'minimal': (),
+    'network': ('AlternateAddress', 'ReferenceIp', 'Interfaces', 'Vlans', 'Protocol', 'Port'),
+    'full': _ALL_DETAILS,
+}
+
+
+def detail_params(preset) -> Dict[str, bool]:
+    """The detail.* params for the details in <preset> (see DETAIL_PRESETS)"""
+    try:
+        details = DETAIL_PRESETS[preset]
+    except KeyError:
+        raise spectreapi.InvalidArgument(
+            f'{preset} is not a detail preset (try one of {", ".join(DETAIL_PRESETS)})') from None
+    return {'detail.' + detail: True for detail in details}
+
+
+def projector(fields: Iterable[str]) -> Callable[[dict], dict]:
+    """
+    A function cutting a result down to just <fields>.  Dotted names reach
+    into nested dicts ("zone.id" keeps {"zone": {"id": ...}}); fields a
+    result doesn't have are left out rather than set to None.
+    """
+    top = []
+    nested = {}
+    for field in fields:
+        head, _, rest = field.partition('.')
+        if rest:
+            nested.setdefault(head, []).append(rest)
+        else:
+            top.append(field)
+    nested = {head: projector(rest) for head, rest in nested.items() if head not in top}
+
+    def project(row):
+        kept = {field: row[field] for field in top if field in row}
+        for head, inner in nested.items():
+            value = row.get(head)
+            if isinstance(value, dict):
+                kept[head] = inner(value)
+        return kept
+
+    return project
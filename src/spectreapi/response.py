@@ -3,65 +3,382 @@
 The spectre module is used to make access to Lumeta's Spectre API
 a little easier (Lumeta and Spectre are trademarks of the Lumeta Corporation).
 """
+import collections
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable
+
 import requests
 import urllib3
 import spectreapi
 
 
+def _decode_page(results, codec, project=None):
+    """Decode one page of results (with <codec>) and drop the raw body.
+    Once a page has been decoded we only ever look at the decoded copy,
+    so there's no sense in holding both in memory.  Each result is passed
+    through <project>, if given."""
+    page = _projected(codec.loads(results.content), project)
+    results._content = None
+    return page
+
+
+def _projected(page, project):
+    if project is not None and 'results' in page:
+        page['results'] = [project(row) for row in page['results']]
+    return page
+
+
+def _spooled_response(url):
+    """Stand in for the requests.Response of a page we read back from the spool"""
+    results = requests.Response()
+    results.status_code = 200
+    results.url = url
+    results._content = None
+    return results
+
+
+def _close_fetched(future):
+    """Release the connection behind a prefetched page nobody is going to read"""
+    if not future.cancelled() and future.exception() is None:
+        future.result()[0].close()
+
+
+class ResponseIterator:
+    """
+    One pass over the results of a Response.  Each iterator keeps its own
+    place (and its own prefetched pages) so two loops over the same
+    Response don't interfere with each other.
+
+    Pages are tracked by the offset of their first row, as the page size can
+    change part way through when the server is sizing pages adaptively.
+    """
+
+    def __init__(self, response):
+        self.response = response
+        self.offset = 0
+        self.size = None
+        self.page_line = 0
+        self._executor = None
+        self._pending = {}
+        self._stream = None
+        self._held = None
+        self._results = None
+        self._page = None
+        self._values = None
+        self._values_base = 0
+
+    @property
+    def page(self):
+        """The page we're on (in terms of the current page size)"""
+        return self.offset // self.size if self.size else 0
+
+    def _load_page(self, offset):
+        """Fetch the page starting at <offset> (or pick it up from the prefetcher)
+        and decode it into our page buffer"""
+        if self._stream is not None:
+            self._stream.close()
+
+        pending = self._pending.pop(offset, None)
+        if pending is not None:
+            future, self.size = pending
+            self._results, decoded = future.result()
+        else:
+            self.size = self.response._size_at(offset)
+            self._results, decoded = self.response._fetch_page(offset, self.size)
+
+        self._held = offset
+        self._values_base = 0
+        if isinstance(decoded, spectreapi.PageStream):
+            self._stream = decoded
+            self._page = decoded.header
+            self._values = None
+        else:
+            self._stream = None
+            self._page = decoded
+            self._values = decoded.get('results', [])
+
+    def _release_page(self):
+        """Drop the page we're holding, it'll be fetched again when it's next needed"""
+        if self._stream is not None:
+            self._stream.close()
+        self._held = None
+        self._results = None
+        self._stream = None
+        self._page = None
+        self._values = None
+
+    def _hold_current_page(self):
+        if self._held is None:
+            self._load_page(self.offset)
+
+    def _next_value(self):
+        if self._values is None:
+            return next(self._stream)
+        return self._values[self.page_line - self._values_base]
+
+    def _schedule_prefetch(self):
+        """Queue up the next <prefetch> pages (that exist) on the background thread"""
+        response = self.response
+        for n in range(1, response.prefetch + 1):
+            offset = self.offset + n * self.size
+            if offset >= response.total:
+                break
+            if offset not in self._pending:
+                if self._executor is None:
+                    response.server.prepare_threads(2)
+                    self._executor = ThreadPoolExecutor(max_workers=1,
+                                                        thread_name_prefix='spectreapi-prefetch')
+                self._pending[offset] = (self._executor.submit(response._fetch_page, offset, self.size),
+                                         self.size)
+
+    def _cancel_prefetch(self):
+        for future, _ in self._pending.values():
+            if not future.cancel():
+                future.add_done_callback(_close_fetched)
+        self._pending = {}
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def rewind(self):
+        """Used to reset state after iterating over results.
+        This doesn't go back to the server; page 0 is only fetched again if
+        and when it's needed (and not at all if we're still holding it)."""
+        self._cancel_prefetch()
+        self.offset = 0
+        self.page_line = 0
+        if not (self._held == 0 and self._values is not None and self._values_base == 0):
+            self._release_page()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """This facilitates being able to iterate over the results of a GET"""
+        response = self.response
+        if self.offset + self.page_line == response.total:
+            self.rewind()
+            raise StopIteration
+
+        if self.size is not None and self.page_line >= self.size:
+            self.offset += self.size
+            self.page_line = 0
+
+        if self._held != self.offset:
+            self._load_page(self.offset)
+
+        if response.prefetch and self.page_line == 0:
+            self._schedule_prefetch()
+
+        try:
+            value = self._next_value()
+        except (IndexError, StopIteration):
+            self.rewind()
+            raise StopIteration  # This could happen if the underlying query shrinks under us
+
+        self.page_line += 1
+        return value
+
+
 class Response:
     """
     This class is used to present the results of a "GET" API call
     It handles iterating through the results and fetching pages as
-    needed from the server
+    needed from the server.  Each loop over a Response gets its own
+    independent iterator.
+
+    If <prefetch> is non-zero, up to that many of the upcoming pages are
+    fetched on a background thread while the caller works through the
+    current one.
+
+    If <stream> is True each page is decoded incrementally as it comes off
+    the wire (see PageStream), so we never hold more than one result of a
+    page at a time.
+
+    If <spool> is given (a PageSpool, or True for a default in-memory one)
+    fetched pages are kept there so another pass over the results can
+    skip going back to the server.
+
+    If <fields> is given, each result is cut down to just those fields as
+    its page is decoded (see projector).
     """
 
-    def __init__(self, server, api, params):
+    def __init__(self, server, api, params, prefetch=0, stream=False, spool=None, fields=None):
+        if stream and spool:
+            raise spectreapi.InvalidArgument('Streamed pages are never buffered, so they cannot be spooled')
+
         self.server = server
         self.api = api
         self.params = params
-        self.page = 0
-        self.page_line = 0
-        self.results = self.server.getpage(api, params, page=self.page)
+        self.prefetch = prefetch
+        self.stream = stream
+        self.spool = spectreapi.PageSpool() if spool is True else spool
+        self.fields = fields
+        self._project = spectreapi.projector(fields) if fields else None
+        self._spooled_sizes = {}
+        # A spool can be shared by several Responses, so its pages are keyed by what was asked for too
+        self._spool_key = (api, tuple(sorted((str(name), str(value)) for name, value in (params or {}).items())))
+        self._cursor = ResponseIterator(self)
+        self._cursor._load_page(0)
 
-        if "total" in self.results.json():
-            self.total = self.results.json()['total']
+        if "total" in self._cursor._page:
+            self.total = self._cursor._page['total']
         else:
             self.total = 1
 
+    def _size_at(self, offset):
+        """The page size to use for a page starting at <offset>"""
+        if offset in self._spooled_sizes:
+            return self._spooled_sizes[offset]
+        size = self.server.page_size_for(self.api)
+        while offset % size:  # adaptive sizes are powers of two apart, so this lands on a boundary
+            size //= 2
+        return size
+
+    def _fetch_page(self, offset, size):
+        if self.spool is not None and self._spooled_sizes.get(offset) == size:
+            body = self.spool.get(self._spool_key + (offset, size))
+            if body is not None:
+                return (_spooled_response(self.server.url + self.api),
+                        _projected(self.server.codec.loads(body), self._project))
+
+        start = time.perf_counter()
+        results = self.server.getpage(self.api, self.params, page=offset // size, stream=self.stream,
+                                      page_size=size)
+        if self.stream:
+            return results, spectreapi.PageStream(results, project=self._project)
+
+        body = results.content
+        decoded = _decode_page(results, self.server.codec, self._project)
+        if self.server.page_sizer is not None:
+            self.server.page_sizer.observe(self.api, size, len(decoded.get('results', [])),
+                                           time.perf_counter() - start, len(body))
+        if self.spool is not None:
+            self._spooled_sizes[offset] = size
+            self.spool.put(self._spool_key + (offset, size), body)
+        return results, decoded
+
+    @property
+    def page(self):
+        return self._cursor.page
+
+    @property
+    def page_line(self):
+        return self._cursor.page_line
+
     def rewind(self):
         """Used to reset state after iterating over results"""
-        self.page = 0
-        self.page_line = 0
-        self.results = self.server.getpage(
-            self.api, self.params, page=self.page)
+        self._cursor.rewind()
+
+    def __len__(self):
+        return self.total
 
     def __iter__(self):
-        return self
+        iterator = ResponseIterator(self)
+        cursor = self._cursor
+        if cursor._held == 0 and cursor._values is not None and cursor._values_base == 0:
+            # Decoded pages aren't changed once loaded, so a new pass can share page 0 with us
+            iterator._held = 0
+            iterator.size = cursor.size
+            iterator._results = cursor._results
+            iterator._page = cursor._page
+            iterator._values = cursor._values
+        elif cursor._held == 0 and cursor._stream is not None and cursor.page_line == 0:
+            # A streamed page can only be read once, so the first pass takes over the
+            # one we opened to learn the total rather than asking for page 0 again
+            iterator._held = 0
+            iterator.size = cursor.size
+            iterator._results = cursor._results
+            iterator._page = cursor._page
+            iterator._stream = cursor._stream
+            cursor._held = None
+            cursor._results = None
+            cursor._stream = None
+            cursor._page = None
+        return iterator
 
     def __next__(self):
-        """This facilitates being able to iterate over the results of a GET"""
-        if self.page * self.server.page_size + self.page_line == self.total:
-            self.rewind()
-            raise StopIteration
-
-        if self.page_line < self.server.page_size:
-            self.page_line += 1
-            try:
-                return self.results.json()['results'][self.page_line - 1]
-            except IndexError:
-                self.rewind()
-                raise StopIteration  # This could happen if the underlying query shrinks under us
+        """Step our own iterator (the one values() and friends look at)"""
+        return next(self._cursor)
 
+    def fan_out(self, workers=4, ordered=True):
+        """
+        Generator that yields every row of the results, fetching all the
+        remaining pages concurrently on <workers> threads.  We already know
+        the total from page 0, so every page offset is known up front.
+        With ordered=False rows are yielded page by page as each page arrives.
+        At most 2 * <workers> pages are held at any time.
+        """
+        self.server.prepare_threads(workers)
+        cursor = self._cursor
+        if cursor._held == 0 and cursor.page_line == 0:
+            size = cursor.size
+            offsets = iter(range(size, self.total, size))
+            yield from cursor._values if cursor._values is not None else cursor._stream
         else:
-            self.page_line = 1
-            self.page += 1
-            self.results = self.server.getpage(
-                self.api, self.params, page=self.page)
+            size = self._size_at(0)
+            offsets = iter(range(0, self.total, size))
+
+        window = 2 * workers
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='spectreapi-fanout') as executor:
+            in_flight = collections.deque()
             try:
-                return self.results.json()['results'][0]
-            except IndexError:
-                self.rewind()
-                raise StopIteration  # This could happen if the underlying query shrinks under us
+                for offset in offsets:
+                    in_flight.append(executor.submit(self._fetch_page, offset, size))
+                    if len(in_flight) >= window:
+                        break
+
+                while in_flight:
+                    if ordered:
+                        done = [in_flight.popleft()]
+                    else:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            in_flight.remove(future)
+
+                    for offset in offsets:
+                        in_flight.append(executor.submit(self._fetch_page, offset, size))
+                        if len(in_flight) >= window:
+                            break
+
+                    for future in done:
+                        _, page = future.result()
+                        yield from page if self.stream else page.get('results', [])
+            finally:
+                for future in in_flight:
+                    future.cancel()
+
+    def to_columns(self, fields=None) -> 'spectreapi.Columns':
+        """Gather all the results into a compact, column oriented Columns.
+        <fields> defaults to the keys of the first result."""
+        return next(self.batches(None, fields), None) or spectreapi.Columns(fields or [])
+
+    def to_index(self, fields=None, **kargs) -> 'spectreapi.DeviceIndex':
+        """Gather all the results into a DeviceIndex, to look them up by IP address.
+        <fields> defaults to keeping every field."""
+        return spectreapi.DeviceIndex(self, fields=fields, **kargs)
+
+    def batches(self, size, fields=None) -> Iterable['spectreapi.Columns']:
+        """Generator that yields the results as Columns of (up to) <size> rows each
+        (size=None for one batch of everything)"""
+        batch = None
+        for row in self:
+            if batch is None:
+                fields = fields or list(row)
+                batch = spectreapi.Columns(fields)
+            batch.append(row)
+            if size and len(batch) >= size:
+                yield batch
+                batch = spectreapi.Columns(fields)
+        if batch:
+            yield batch
+
+    @property
+    def results(self):
+        """The requests.Response for the page we're on"""
+        self._cursor._hold_current_page()
+        return self._cursor._results
 
     @property
     def ok(self):
@@ -72,6 +389,21 @@ class Response:
         """Return result 0 (the only result for singletons"""
         return self.values()[0]
 
+    def json(self):
+        """Return the decoded body of the current page"""
+        self._cursor._hold_current_page()
+        return self._cursor._page
+
+    def value(self):
+        """Return value 0 (the only value for singletons (replaces result())"""
+        return self.values()[0]
+
     def values(self):
-        """Return the values from the API call"""
-        return self.results.json()['results']
+        """Return the values from the API call
+        (when streaming, the values of the current page we haven't iterated over yet)"""
+        cursor = self._cursor
+        cursor._hold_current_page()
+        if cursor._values is None:
+            cursor._values = list(cursor._stream)
+            cursor._values_base = cursor.page_line
+        return cursor._values
@@ -0,0 +1,134 @@
+"""
+Retrying failed requests, and backing off when the server is struggling.
+
+A single 502 part way through a 50k device add_devices run or a long
+paginated export shouldn't sink the whole thing.  A RetryPolicy says which
+methods get retried on which failures, and how long to wait in between
+(exponential backoff with jitter, or whatever the server's Retry-After
+asks for).  A CircuitBreaker stops us piling more requests onto a Command
+Center that keeps failing them.
+"""
+import email.utils
+import math
+import random
+import threading
+import time
+
+import spectreapi
+
+# Statuses that say the server is overloaded or a proxy couldn't reach it, rather than that the request was bad
+TRANSIENT_STATUSES = (429, 502, 503, 504)
+
+
+class RetryPolicy:
+    """
+    Retry up to <attempts> times in all for <methods> (only GET by default,
+    as PUT and POST aren't necessarily safe to send twice) when the request
+    fails to connect, times out or comes back with one of <statuses>.
+
+    Waits between attempts grow as <backoff> * 2**n seconds up to
+    <max_backoff>, each picked at random between 0 and that ("full jitter")
+    unless jitter=False.  A Retry-After from the server takes precedence
+    (though we never wait longer than <max_backoff>).
+
+    >>> import spectreapi
+    >>> policy = spectreapi.RetryPolicy(attempts=6, methods=('GET', 'PUT', 'POST'))
+    >>> s = spectreapi.APIKeyServer('server', api_key='...', retry=policy)
+    """
+
+    def __init__(self, attempts=4, backoff=0.5, max_backoff=30.0, jitter=True,
+                 statuses=TRANSIENT_STATUSES, methods=('GET',)):
+        if attempts < 1:
+            raise ValueError('RetryPolicy needs at least one attempt')
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = frozenset(statuses)
+        self.methods = frozenset(method.upper() for method in methods)
+
+    def __repr__(self):
+        return (f'RetryPolicy(attempts={self.attempts}, backoff={self.backoff}, '
+                f'methods={sorted(self.methods)}, statuses={sorted(self.statuses)})')
+
+    def retries(self, method) -> bool:
+        return method.upper() in self.methods
+
+    def delay(self, attempt, retry_after=None) -> float:
+        """How long to wait after failed attempt number <attempt> (counting from 0)"""
+        if retry_after is not None:
+            seconds = _retry_after_seconds(retry_after)
+            if seconds is not None:
+                return min(self.max_backoff, seconds)
+
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return random.uniform(0, delay) if self.jitter else delay
+
+
+def _retry_after_seconds(value):
+    """Retry-After is either a number of seconds or an HTTP date"""
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        return None if math.isnan(seconds) else max(0.0, seconds)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class CircuitBreaker:
+    """
+    After <threshold> failures in a row, fail every request straight away
+    (with CircuitOpenException) for <reset_seconds>.  After that one request
+    is let through to test the water: if it works we're back in business,
+    if it doesn't the circuit opens again.
+    """
+
+    def __init__(self, threshold=5, reset_seconds=30.0):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'CircuitBreaker({self.state}, failures={self.failures})'
+
+    @property
+    def state(self) -> str:
+        """"closed" (all's well), "open" (failing fast) or "half-open" (trying one request)"""
+        if self.opened_at is None:
+            return 'closed'
+        if self._trial or time.monotonic() - self.opened_at >= self.reset_seconds:
+            return 'half-open'
+        return 'open'
+
+    def before(self):
+        """Call before each request: raises CircuitOpenException if we're failing fast"""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            waited = time.monotonic() - self.opened_at
+            if waited < self.reset_seconds or self._trial:
+                raise spectreapi.CircuitOpenException(
+                    f'{self.failures} failures in a row, not trying again for '
+                    f'{max(0.0, self.reset_seconds - waited):.1f}s')
+            self._trial = True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self._trial = False
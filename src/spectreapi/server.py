@@ -4,13 +4,24 @@ The spectre module is used to make access to Lumeta's Spectre API
 a little easier (Lumeta and Spectre are trademarks of the Lumeta Corporation).
 """
 import datetime
-import json
+import gzip
+import threading
+import time
 
 import requests
 import urllib3
 
 import spectreapi
-from typing import Optional, List, Iterable
+from typing import Dict, Optional, List, Iterable
+
+
+def _body_size(data):
+    """How many bytes a request body is (0 for anything we can't measure, like a file)"""
+    if isinstance(data, str):
+        return len(data.encode('utf-8'))
+    if isinstance(data, bytes):
+        return len(data)
+    return 0
 
 
 class Server:
@@ -21,18 +32,104 @@ class Server:
     authenticating to the Spectre Command Center in question.
     """
 
-    def __init__(self, server, page_size=500, verify_cert=False):
-        self.session = requests.Session()
-        self.session.verify = False
+    def __init__(self, server, page_size=500, verify_cert=False, adaptive_page_size=None,
+                 thread_safe=False, max_connections=10, keepalive=True, connect_timeout=10, read_timeout=120,
+                 retry=None, circuit_breaker=None, pretty=False, gzip_threshold=None, codec=None,
+                 cache=None):
+        """
+        With thread_safe=True every thread gets its own requests.Session, so a
+        single Server can be shared by a pool of workers.  All the sessions
+        share one connection pool (<max_connections> connections to the server),
+        one set of headers (including any Authorization) and one cookie jar,
+        so we only ever log in once.  Our own helpers that send requests from
+        several threads at once (get_parallel, prefetching, ...) switch
+        thread_safe on themselves (see prepare_threads).
+        <connect_timeout> and <read_timeout> (seconds) apply to every request.
+
+        <retry> is a RetryPolicy (by default GETs are retried a few times, other
+        methods aren't) and <circuit_breaker> a CircuitBreaker; pass False for
+        either to turn it off.
+
+        Responses come back compact (pretty=True for the indented json:pretty
+        the API used to be asked for) and gzip or deflate compressed where the
+        server obliges.  Request bodies of <gzip_threshold> bytes or more are
+        gzipped (None, the default, never compresses them).  Bytes and time
+        saved are tallied in <stats> (a RequestStats).
+
+        All our JSON goes through <codec> (see spectreapi.default_codec).
+
+        <cache> is a ResponseCache (or True for one with the default TTLs) to
+        keep GETs of read-mostly endpoints like zone and zone/collector around.
+        """
         self.page_size = page_size
+        self.page_sizer = adaptive_page_size
         self.url = "https://" + server + "/api/rest/"
         self._host = server
         self._version = None
         self._name = None
-        self.session.timeout = 1
+        self.verify_cert = verify_cert
+        self.thread_safe = thread_safe
+        self.timeout = (connect_timeout, read_timeout)
+        self.headers = requests.utils.default_headers()
+        self.headers['Accept-Encoding'] = 'gzip, deflate'
+        self.json_headers = {'Accept': 'json:pretty' if pretty else 'application/json',
+                             'Content-Type': 'application/json'}
+        self.gzip_threshold = gzip_threshold
+        self.stats = spectreapi.RequestStats()
+        self.codec = codec or spectreapi.default_codec()
+        if cache is True:
+            cache = spectreapi.ResponseCache()
+        self.cache = cache if cache is not False else None
+        self._catalog = None
+        if not keepalive:
+            self.headers['Connection'] = 'close'
+        self.cookies = requests.cookies.RequestsCookieJar()
+        self._adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_connections)
+        self._session = None
+        self._local = threading.local()
+        self.retry = spectreapi.RetryPolicy() if retry is None else retry
+        self.breaker = spectreapi.CircuitBreaker() if circuit_breaker is None else circuit_breaker
         if verify_cert is False:
             urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+    def _new_session(self) -> requests.Session:
+        """A Session wired up to our shared headers, cookies and connection pool"""
+        session = requests.Session()
+        session.verify = self.verify_cert
+        # Sessions only ever read their headers, so it's safe for them to share our dict
+        session.headers = self.headers
+        session.cookies = self.cookies
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        """The requests.Session for this thread (there's just the one unless we're thread_safe)"""
+        if self.thread_safe:
+            session = getattr(self._local, 'session', None)
+            if session is None:
+                session = self._local.session = self._new_session()
+        else:
+            session = self._session
+            if session is None:
+                session = self._session = self._new_session()
+
+        if session.adapters.get('https://') is not self._adapter:
+            session.mount('https://', self._adapter)
+        return session
+
+    @session.setter
+    def session(self, session):
+        if self.thread_safe:
+            self._local.session = session
+        self._session = session
+
+    @property
+    def catalog(self) -> 'spectreapi.Catalog':
+        """Indexes of our zones and collectors by id, name and uuid (see Catalog)"""
+        if self._catalog is None:
+            self._catalog = spectreapi.Catalog(self)
+        return self._catalog
+
     @property
     def host(self) -> str:
         """Returns the server name (or IP) specified in the constructor"""
@@ -48,13 +145,106 @@ class Server:
         """Returns the version of the Spectre server we're talking with (as reported by that server)"""
         return self._version
 
+    def page_size_for(self, api) -> int:
+        """The page size we'll ask for when paging through <api>.  That's page_size
+        unless we were given an AdaptivePageSize to tune it per API path."""
+        if self.page_sizer is not None:
+            return self.page_sizer.size_for(api)
+        return self.page_size
+
+    def size_pool(self, connections):
+        """Make sure the connection pool can hold <connections> connections
+        to the server so concurrent requests don't churn sockets"""
+        if self._adapter._pool_maxsize < connections:
+            # Sessions pick up the new pool the next time they're used, connections
+            # still out on a request are closed as they come back to the old one
+            old, self._adapter = self._adapter, requests.adapters.HTTPAdapter(pool_maxsize=connections)
+            old.close()
+
+    def prepare_threads(self, workers):
+        """Get ready for <workers> threads sending requests at once: switch
+        on thread_safe (this thread keeps the session it has) and make sure
+        the pool has room for them all"""
+        if not self.thread_safe:
+            if self._session is not None:
+                self._local.session = self._session
+            self.thread_safe = True
+        self.size_pool(workers)
+
     def close(self):
         """
         It's not _required_ to close a Server, but if you don't, you might
         hold tcp sockets open (the underlying requests and urllib3 modules
         hold them for keepalive purposes)
         """
-        self.session.close()
+        self._adapter.close()
+        if self._session is not None:
+            self._session.close()
+
+    def _send(self, method, api, retry=None, **kargs) -> requests.Response:
+        """
+        Send one request through this thread's session, retrying it as our
+        RetryPolicy allows (retry=True or False overrides whether <method>
+        gets retried at all) and keeping the circuit breaker informed.
+        Anything we change is dropped from the cache (and the catalog, if
+        it's a zone or collector itself).
+        """
+        if method == 'GET':
+            return self._request(method, api, retry=retry, **kargs)
+        try:
+            return self._request(method, api, retry=retry, **kargs)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(api)
+            if self._catalog is not None:
+                self._catalog.forget_write(api)
+
+    def _request(self, method, api, retry=None, **kargs) -> requests.Response:
+        """The retrying part of _send"""
+        kargs.setdefault('timeout', self.timeout)
+        sent = raw_sent = _body_size(kargs.get('data'))
+        if self.gzip_threshold is not None and sent and raw_sent >= self.gzip_threshold:
+            data = kargs['data']
+            kargs['data'] = gzip.compress(data.encode('utf-8') if isinstance(data, str) else data, compresslevel=6)
+            kargs['headers'] = dict(kargs.get('headers') or {}, **{'Content-Encoding': 'gzip'})
+            sent = len(kargs['data'])
+
+        policy = self.retry or None
+        if retry is None:
+            retry = policy is not None and policy.retries(method)
+        attempts = policy.attempts if retry and policy is not None else 1
+        send = getattr(self.session, method.lower())
+
+        for attempt in range(attempts):
+            if self.breaker:
+                self.breaker.before()
+            retry_after = None
+            start = time.perf_counter()
+            try:
+                result = send(self.url + api, **kargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if self.breaker:
+                    self.breaker.failure()
+                if attempt + 1 >= attempts:
+                    raise
+            except BaseException:  # Anything else still counts, or a half-open breaker never closes
+                if self.breaker:
+                    self.breaker.failure()
+                raise
+            else:
+                transient = result.status_code in (policy.statuses if policy else spectreapi.TRANSIENT_STATUSES)
+                if self.breaker and transient:
+                    self.breaker.failure()
+                elif self.breaker:
+                    self.breaker.success()  # Even an error means the server is answering
+                if result.ok:
+                    self.stats.record(result, time.perf_counter() - start, sent, raw_sent)
+                    return result
+                if not transient or attempt + 1 >= attempts:
+                    raise APIException(result)
+                retry_after = result.headers.get('Retry-After')
+                result.close()
+            time.sleep(policy.delay(attempt, retry_after))
 
     def post(self, api, **kargs) -> requests.Response:
         """
@@ -74,12 +264,9 @@ class Server:
         'SUCCESS'
         """
         if 'headers' not in kargs:
-            kargs['headers'] = {'Accept': 'json:pretty', 'Content-Type': 'application/json'}
+            kargs['headers'] = self.json_headers
 
-        result = self.session.post(self.url + api, **kargs)
-        if not result.ok:
-            raise APIException(result)
-        return result
+        return self._send('POST', api, **kargs)
 
     def raw_post(self, api, **kargs) -> requests.Response:
         """
@@ -98,56 +285,59 @@ class Server:
 
         server.raw_post('management/snmpd',data=data,headers={'Content-Type':'application/xml'})
         """
-        result = self.session.post(self.url + api, **kargs)
-        if not result.ok:
-            raise APIException(result)
-        return result
+        return self._send('POST', api, **kargs)
 
     def put(self, api, **kargs):
         """Method PUTs through to the server"""
 
         if 'headers' not in kargs:
-            kargs['headers'] = {'Accept': 'json:pretty', 'Content-Type': 'application/json'}
+            kargs['headers'] = self.json_headers
 
-        result = self.session.put(self.url + api, **kargs)
-        if not result.ok:
-            raise APIException(result)
-        return result
+        return self._send('PUT', api, **kargs)
 
     def delete(self, api, **kargs) -> requests.Response:
         """Method sends DELETEs through to server"""
 
         if 'headers' not in kargs:
-            kargs['headers'] = {'Accept': 'json:pretty', 'Content-Type': 'application/json'}
+            kargs['headers'] = self.json_headers
 
-        result = self.session.delete(self.url + api, **kargs)
-        if not result.ok:
-            raise APIException(result)
-        return result
+        return self._send('DELETE', api, **kargs)
 
-    def getpage(self, api, params=None, page=0, headers=None) -> requests.Response:
+    def getpage(self, api, params=None, page=0, headers=None, stream=False, page_size=None) -> requests.Response:
         """
         This private method is in place to handle the actual
-        fetching of GET API calls
+        fetching of GET API calls.  With stream=True the body is
+        left on the wire for the caller to read incrementally.
+        page_size overrides the server's page size for this page.
         """
-        if params is None:
-            params = {"query.pagesize": self.page_size}
+        # Copy the params, we're going to set paging on them and the caller
+        # (or another thread prefetching pages) may be sharing the dict
+        params = dict(params) if params is not None else {}
 
         if headers is None:
-            headers = {'Accept': 'json:pretty', 'Content-Type': 'application/json'}
+            headers = self.json_headers
 
-        params["query.pagesize"] = self.page_size
+        params["query.pagesize"] = page_size or self.page_size
         params["query.page"] = page
-        results = self.session.get(self.url + api, params=params, timeout=120, headers=headers)
-        if not results.ok:
-            print(results.text)
-            raise APIException(results)
-        return results
-
-    def get(self, api, params=None) -> Iterable['spectreapi.Response']:
+        try:
+            if self.cache is not None and not stream:
+                return self.cache.fetch(api, params, headers, self.url + api,
+                                        lambda headers: self._send('GET', api, params=params, headers=headers))
+            return self._send('GET', api, params=params, headers=headers, stream=stream)
+        except APIException as e:
+            print(e.request.text)
+            raise
+
+    def get(self, api, params=None, prefetch=0, stream=False, spool=None,
+            fields=None) -> Iterable['spectreapi.Response']:
         """
         Use this method to GET results from an API call and produce
-        an iterable response
+        an iterable response.  Set prefetch to fetch that many upcoming
+        pages in the background while you work through the current one.
+        Set stream to decode each result as it arrives rather than a page
+        at a time (handy for pages of detail-heavy devices).  Pass a PageSpool
+        (or True) as spool to keep fetched pages around for another pass.
+        Pass a list of fields to keep just those of each result.
         >>> import spectreapi
         >>> s=spectreapi.UsernameServer('server','username','password')
         >>> r = s.get('zone')
@@ -158,7 +348,20 @@ class Server:
         {'@class': 'zone', 'id': 1, 'name': 'Zone1', 'description': 'Default Zone'}
         >>>
         """
-        return spectreapi.Response(self, api, params)
+        return spectreapi.Response(self, api, params, prefetch=prefetch, stream=stream, spool=spool, fields=fields)
+
+    def get_parallel(self, api, params=None, workers=4, ordered=True, fields=None) -> Iterable[dict]:
+        """
+        Like get(), but once the first page tells us the total, all the
+        remaining pages are fetched concurrently by <workers> threads.
+        Rows come back in order unless ordered=False, in which case each
+        page's rows are yielded as soon as that page arrives.
+        >>> import spectreapi
+        >>> s=spectreapi.UsernameServer('server','username','password')
+        >>> for d in s.get_parallel('zonedata/devices', workers=8, ordered=False):
+        ...     print(d)
+        """
+        return spectreapi.Response(self, api, params, fields=fields).fan_out(workers=workers, ordered=ordered)
 
     def query(self, api="zonedata/devices"):
         """
@@ -172,21 +375,11 @@ class Server:
 
     def get_zones(self) -> List['spectreapi.Zone']:
         """Returns all the Zones configured on the server"""
-        zones = []
-        result = self.get('zone')
-        for zone in result:
-            zones.append(spectreapi.Zone(zone['id'], zone['name'], zone['description'], server=self))
-
-        return zones
+        return self.catalog.load_zones()
 
     def get_zone_by_name(self, name) -> Optional['spectreapi.Zone']:
         """Returns the Zone configured on the server named <name> (if present)"""
-        results = self.get('zone')
-        for zone in results:
-            if zone['name'] == name:
-                return spectreapi.Zone(zone['id'], zone['name'], zone['description'], server=self)
-
-        return None
+        return self.catalog.zone(name=name)
 
     def get_or_create_zone(self, name, description="Test Zone", organization={"id": 1, "name": "Test Organization"}):
         zone = self.get_zone_by_name(name)
@@ -197,25 +390,39 @@ class Server:
                  "description": description,
                  "organization": organization
                  }]
-        self.post("zone", data=json.dumps(data))
+        self.post("zone", data=self.codec.dumps(data))
         zone = self.get_zone_by_name(name)
         return zone
 
     def get_collectors(self) -> List['spectreapi.Collector']:
         """Returns the Collectors configured on the server"""
-        collectors = []
-        results = self.get('zone/collector')
-        for collector in results:
-            collectors.append(spectreapi.Collector(
-                collector['id'],
-                collector['uuid'],
-                collector['name'],
-                spectreapi.Zone(collector['zone']['id'], collector['zone']['name']),
-                server=self,
-            ))
-        return collectors
-
-    def initiate_collector_inhibits(self, func, *, debug=False):
+        return self.catalog.load_collectors()
+
+    def get_collector_configs(self, ids=None, workers=1) -> Dict[int, dict]:
+        """
+        Returns the configuration (Config and Interface details) of every
+        collector, or just those with an id in <ids>, keyed by collector id.
+        This is one paginated query rather than a get_config() per collector;
+        with workers=<n> its pages are fetched concurrently.  Two snapshots
+        can be compared with spectreapi.diff_configs().
+        >>> import spectreapi
+        >>> s=spectreapi.UsernameServer('server','username','password')
+        >>> before = s.get_collector_configs()
+        >>> added, removed, changed = spectreapi.diff_configs(before, s.get_collector_configs())
+        """
+        params = dict(spectreapi.CONFIG_DETAILS)
+        if ids is not None:
+            ids = set(ids)
+            if len(ids) == 1:
+                params['filter.collector.id'] = next(iter(ids))
+
+        if workers > 1:
+            results = self.get_parallel('zone/collector', params, workers=workers, ordered=False)
+        else:
+            results = self.get('zone/collector', params)
+        return {config['id']: config for config in results if ids is None or config['id'] in ids}
+
+    def initiate_collector_inhibits(self, func, *, debug=False, workers=None):
         """ This method evaluates <func> for each collector.  If <func>
         returns true we will set the collector's inhibited property.
         That might look like:
@@ -238,7 +445,18 @@ class Server:
 
         This can take a little while to percolate through to all the systems involved so we are
         really only initiating the changes.  They might take up to 10 minutes or so to take effect.
+
+        With lots of collectors pass workers=<n> to read all the properties concurrently
+        and only set the ones that need changing (see InhibitScheduler, which can also
+        run this as a daemon instead of from cron).
         """
+        if workers:
+            scheduler = spectreapi.InhibitScheduler(self, func, workers=workers, debug=debug)
+            scheduler.tick()
+            for e in scheduler.errors.values():
+                raise e
+            return
+
         t = datetime.datetime.now()
         if debug:
             print(t)
@@ -254,92 +472,7 @@ class Server:
 
     def get_collector_by_name(self, name) -> Optional['spectreapi.Collector']:
         """Returns the Collector configured on the server named <name> (if present)"""
-        results = self.get('zone/collector')
-        for collector in results:
-            if collector['name'] == name:
-                return spectreapi.Collector(
-                    collector['id'],
-                    collector['uuid'],
-                    collector['name'],
-                    spectreapi.Zone(collector['zone']['id'], collector['zone']['name']),
-                    server=self,
-                )
-
-        return None
-
-
-class Response:
-    """
-    This class is used to present the results of a "GET" API call
-    It handles iterating through the results and fetching pages as
-    needed from the server
-    """
-
-    def __init__(self, server, api, params):
-        self.server = server
-        self.api = api
-        self.params = params
-        self.page = 0
-        self.page_line = 0
-        self.results = self.server.getpage(api, params, page=self.page)
-
-        if "total" in self.results.json():
-            self.total = self.results.json()['total']
-        else:
-            self.total = 1
-
-    def rewind(self):
-        """Used to reset state after iterating over results"""
-        self.page = 0
-        self.page_line = 0
-        self.results = self.server.getpage(
-            self.api, self.params, page=self.page)
-
-    def __iter__(self):
-        return self
-
-    def __next__(self):
-        """This facilitates being able to iterate over the results of a GET"""
-        if self.page * self.server.page_size + self.page_line == self.total:
-            self.rewind()
-            raise StopIteration
-
-        if self.page_line < self.server.page_size:
-            self.page_line += 1
-            try:
-                return self.results.json()['results'][self.page_line - 1]
-            except IndexError:
-                self.rewind()
-                raise StopIteration  # This could happen if the underlying query shrinks under us
-
-        else:
-            self.page_line = 1
-            self.page += 1
-            self.results = self.server.getpage(
-                self.api, self.params, page=self.page)
-            try:
-                return self.results.json()['results'][0]
-            except IndexError:
-                self.rewind()
-                raise StopIteration  # This could happen if the underlying query shrinks under us
-
-    @property
-    def result(self):
-        """Return result 0 (the only result for singletons"""
-        return self.values()[0]
-
-    @property
-    def ok(self):
-        """Return result 0 (the only result for singletons"""
-        return self.results.ok
-
-    def value(self):
-        """Return value 0 (the only value for singletons (replaces result())"""
-        return self.results.json()['results'][0]
-
-    def values(self):
-        """Return the values from the API call"""
-        return self.results.json()['results']
+        return self.catalog.collector(name=name)
 
 
 class APIKeyServer(Server):
@@ -348,7 +481,7 @@ class APIKeyServer(Server):
     You get an API key from the CLI via the "user key new <username>" command
     """
 
-    def __init__(self, server, api_key, page_size=500, verify_cert=False):
+    def __init__(self, server, api_key, page_size=500, verify_cert=False, adaptive_page_size=None, **kargs):
         """
         APIKeyServer(server,api_key) where
         server is the Spectre server you're connecting to and
@@ -364,8 +497,9 @@ class APIKeyServer(Server):
         >>> r.json()['results'][0]['name']
         'i3'
         """
-        super().__init__(server, page_size=page_size, verify_cert=verify_cert)
-        self.session.headers['Authorization'] = "Bearer " + api_key
+        super().__init__(server, page_size=page_size, verify_cert=verify_cert,
+                         adaptive_page_size=adaptive_page_size, **kargs)
+        self.headers['Authorization'] = "Bearer " + api_key
         results = self.get("system/information")
         self._version = results.result['version']
         self._name = results.result['name']
@@ -377,14 +511,18 @@ class UsernameServer(Server):
     request, and then uses a session cookie from there out
     """
 
-    def __init__(self, server, username, password, page_size=500, verify_cert=False):
-        super().__init__(server, page_size=page_size, verify_cert=verify_cert)
+    def __init__(self, server, username, password, page_size=500, verify_cert=False, adaptive_page_size=None,
+                 **kargs):
+        super().__init__(server, page_size=page_size, verify_cert=verify_cert,
+                         adaptive_page_size=adaptive_page_size, **kargs)
         auth = requests.auth.HTTPBasicAuth(username, password)
-        headers = {'Accept': 'json:pretty', 'Content-Type': 'application/json'}
-        results = requests.get(self.url + "system/information", headers=headers, verify=False, auth=auth)
-        self._version = results.json()['results'][0]['version']
-        self._name = results.json()['results'][0]['name']
-        self.session.cookies = results.cookies
+        results = requests.get(self.url + "system/information", headers=self.json_headers, verify=verify_cert,
+                               auth=auth, timeout=self.timeout)
+        info = self.codec.loads(results.content)['results'][0]
+        self._version = info['version']
+        self._name = info['name']
+        # Every session (one per thread when thread_safe) shares this cookie jar
+        self.cookies.update(results.cookies)
 
 
 class Query:
@@ -404,12 +542,62 @@ class Query:
         self.server = server
         self.api = api
         self.params = {}
+        self.projection = None
 
-    def run(self) -> Iterable['spectreapi.Response']:
+    def run(self, prefetch=0, stream=False, spool=None) -> Iterable['spectreapi.Response']:
         """
         Go ahead and execute the query, return the results
         """
-        return self.server.get(self.api, self.params)
+        return self.server.get(self.api, self.params, prefetch=prefetch, stream=stream, spool=spool,
+                               fields=self.projection)
+
+    def run_parallel(self, workers=4, ordered=True) -> Iterable[dict]:
+        """
+        Execute the query, fetching pages concurrently (see Server.get_parallel)
+        """
+        return self.server.get_parallel(self.api, self.params, workers=workers, ordered=ordered,
+                                        fields=self.projection)
+
+    def run_partitioned(self, by='zone', workers=4, progress=None, **kargs) -> 'spectreapi.PartitionedResults':
+        """
+        Execute the query as disjoint sub-queries, one per zone (by='zone')
+        or per CIDR in a list, on <workers> threads, merging their rows into
+        one iterator (see spectreapi.run_partitioned).  <progress> is called
+        with each Partition as it gets more rows.
+        >>> import spectreapi
+        >>> s=spectreapi.UsernameServer('server','username','password')
+        >>> results = s.query().detail('Attributes').run_partitioned(by='zone', workers=8)
+        >>> for d in results:
+        ...     print(d)
+        >>> print(results.partitions)
+        """
+        return spectreapi.run_partitioned(self, by=by, workers=workers, progress=progress, **kargs)
+
+    def export(self, path, format='ndjson', fields=None, raw=False) -> 'spectreapi.ExportStats':
+        """
+        Stream the query's results straight to a file at <path> as NDJSON or CSV
+        (see spectreapi.export_results), returning rows/s and bytes/s stats
+        >>> import spectreapi
+        >>> s=spectreapi.UsernameServer('server','username','password')
+        >>> print(s.query().filter('zone.id', 2).export('devices.ndjson', raw=True))
+        """
+        return spectreapi.export_results(self.server, self.api, self.params, path,
+                                         format=format, fields=fields or self.projection, raw=raw)
+
+    def count(self) -> int:
+        """
+        Return how many results the query matches without fetching them
+        (we ask for a single row with no details and read the total)
+        """
+        params = {name: value for name, value in self.params.items() if not name.startswith('detail.')}
+        page = self.server.codec.loads(self.server.getpage(self.api, params, page_size=1).content)
+        return page.get('total', len(page.get('results', [])))
+
+    def exists(self) -> bool:
+        """
+        Return True if the query matches anything at all
+        """
+        return self.count() > 0
 
     def filter(self, name, value=True) -> 'spectreapi.Query':
         """
@@ -426,6 +614,30 @@ class Query:
         self.params['detail.' + name] = True
         return self
 
+    def preset(self, name) -> 'spectreapi.Query':
+        """
+        Ask for the details in preset <name> ('minimal', 'network' or 'full',
+        see DETAIL_PRESETS) instead of any we've added so far
+        """
+        details = spectreapi.detail_params(name)
+        self.params = {param: value for param, value in self.params.items() if not param.startswith('detail.')}
+        self.params.update(details)
+        return self
+
+    def fields(self, *names) -> 'spectreapi.Query':
+        """
+        Keep just the fields <names> of each result (dotted names like
+        "zone.id" reach into nested results), dropping the rest as each
+        page is decoded.  This doesn't change what the server sends, so pair
+        it with preset() to not ask for details you're going to drop.
+        >>> import spectreapi
+        >>> s=spectreapi.UsernameServer('server','username','password')
+        >>> for d in s.query().filter('zone.id', 2).preset('minimal').fields('ip', 'mac', 'lastObserved').run():
+        ...     print(d)
+        """
+        self.projection = list(names) or None
+        return self
+
 
 class SpectreException(Exception):
     """General Base Spectre exception"""
@@ -443,6 +655,11 @@ class InvalidArgument(SpectreException):
     pass
 
 
+class CircuitOpenException(SpectreException):
+    """The server has been failing, so we're not sending it requests for now"""
+    pass
+
+
 class APIException(SpectreException):
     """We got an exception back from the Spectre API call"""
 
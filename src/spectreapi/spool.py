@@ -0,0 +1,121 @@
+"""
+Spooling of fetched pages, so a second pass over a Response doesn't
+have to go back to the server for every page.
+"""
+import collections
+import mmap
+import tempfile
+import threading
+
+
+class PageSpool:
+    """
+    Holds on to the raw bytes of pages as they're fetched, keyed by page
+    (a Response uses its api and params, and the page's offset and size,
+    so one spool can be shared by several).
+    Pages are kept in memory by default, or pass <path> to spool them to
+    a temporary file (True for the system temp directory, or a directory
+    to put it in) that we read back through mmap.
+    Once we hold more than <max_bytes> the least recently used pages are
+    evicted.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, path=None):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._file = None
+        self._map = None
+        self._file_size = 0
+        if path is not None:
+            self._file = tempfile.TemporaryFile(dir=None if path is True else path)
+
+    def __repr__(self):
+        return f'PageSpool({len(self._entries)} pages, {self.size}/{self.max_bytes} bytes)'
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """Return the bytes spooled for <key>, or None if we don't have them"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if self._file is None:
+                return entry
+            return self._read(*entry)
+
+    def put(self, key, body):
+        """Spool <body> for <key>, evicting older pages if we go over budget"""
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            if self._file is None:
+                self._entries[key] = body
+            else:
+                self._entries[key] = self._write(body)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            if self._file is not None:
+                self._compact()
+
+    def close(self):
+        """Drop everything we've spooled (and the temp file if we have one)"""
+        self.clear()
+        if self._file is not None:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._file.close()
+            self._file = None
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry) if self._file is None else entry[1]
+
+    def _write(self, body):
+        # Evicted pages leave holes in the file, so once it's mostly holes rewrite it
+        if self._file_size > 2 * self.max_bytes:
+            self._compact()
+        offset = self._file_size
+        self._file.seek(offset)
+        self._file.write(body)
+        self._file.flush()
+        self._file_size += len(body)
+        return offset, len(body)
+
+    def _read(self, offset, length):
+        if self._map is None or len(self._map) < offset + length:
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + length]
+
+    def _compact(self):
+        live = [(key, self._read(*entry)) for key, entry in self._entries.items()]
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.seek(0)
+        self._file.truncate()
+        self._file_size = 0
+        for key, body in live:
+            self._entries[key] = self._write(body)
@@ -0,0 +1,92 @@
+"""
+Running totals of what a Server has sent and received.
+
+With compressed transfers the bytes that cross the wire and the bytes we
+actually work with differ, so RequestStats keeps both, and from the
+throughput we've been seeing estimates how much time compression saved.
+"""
+import threading
+
+
+class RequestStats:
+    """
+    Counts the requests a Server has made and the bytes involved:
+    <bytes_received> off the wire against <body_bytes> once decompressed, and
+    <bytes_sent> on the wire against <raw_bytes_sent> before compression.
+
+    >>> import spectreapi
+    >>> s = spectreapi.APIKeyServer('server', api_key='...', gzip_threshold=16384)
+    >>> devices = list(s.query().run())
+    >>> print(s.stats)
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.seconds = 0.0
+        self.bytes_received = 0
+        self.body_bytes = 0
+        self.bytes_sent = 0
+        self.raw_bytes_sent = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return (f'RequestStats(requests={self.requests}, bytes_received={self.bytes_received}, '
+                f'body_bytes={self.body_bytes}, bytes_sent={self.bytes_sent}, '
+                f'raw_bytes_sent={self.raw_bytes_sent}, seconds={self.seconds:.3f})')
+
+    def __str__(self):
+        return (f'{self.requests} requests in {self.seconds:.1f}s: '
+                f'received {self.bytes_received} bytes ({self.body_bytes} decoded), '
+                f'sent {self.bytes_sent} bytes ({self.raw_bytes_sent} before compression), '
+                f'{self.bytes_saved} bytes and about {self.seconds_saved:.1f}s saved')
+
+    def record(self, results, seconds, sent=0, raw_sent=0):
+        """
+        Add one request that took <seconds>, sending <sent> bytes of body
+        (<raw_sent> before compression).  <results> is the requests.Response;
+        streamed bodies haven't been read yet, so only count what they carried
+        if they've been read.
+        """
+        received = body = 0
+        if results._content_consumed and results._content:
+            body = len(results._content)
+            tell = getattr(results.raw, 'tell', None)
+            received = tell() if tell is not None else body
+            received = received or body
+
+        with self._lock:
+            self.requests += 1
+            self.seconds += seconds
+            self.bytes_received += received
+            self.body_bytes += body
+            self.bytes_sent += sent
+            self.raw_bytes_sent += raw_sent
+
+    @property
+    def bytes_saved(self) -> int:
+        """How many fewer bytes crossed the wire thanks to compression"""
+        return (self.body_bytes - self.bytes_received) + (self.raw_bytes_sent - self.bytes_sent)
+
+    @property
+    def compression_ratio(self) -> float:
+        """Uncompressed bytes for each byte on the wire (1.0 means no compression)"""
+        wire = self.bytes_received + self.bytes_sent
+        return (self.body_bytes + self.raw_bytes_sent) / wire if wire else 1.0
+
+    @property
+    def seconds_saved(self) -> float:
+        """Estimated time compression saved, assuming transfer time scales with the
+        bytes on the wire at the throughput we've been getting"""
+        wire = self.bytes_received + self.bytes_sent
+        if not wire or not self.seconds:
+            return 0.0
+        return self.bytes_saved * self.seconds / wire
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.seconds = 0.0
+            self.bytes_received = 0
+            self.body_bytes = 0
+            self.bytes_sent = 0
+            self.raw_bytes_sent = 0
@@ -0,0 +1,131 @@
+"""
+Incremental decoding of Spectre API pages.
+
+A page of zonedata/devices with lots of details turned on can run to many
+megabytes.  Rather than buffer the whole body and build the whole tree before
+we see the first device, a PageStream reads the HTTP body a chunk at a time
+and hands back each element of "results" as soon as it's complete, so memory
+is bounded by the largest single element rather than the page.
+"""
+import codecs
+import json
+import re
+
+import spectreapi
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class PageStream:
+    """
+    Iterate over the "results" of one page as they come off the wire.
+    Any other top level members of the page (e.g. "total") are collected
+    in <header>; those that come before "results" are available as soon
+    as the PageStream is created, anything after it once iteration is done.
+    If <project> is given, each result is passed through it (see projector).
+    """
+
+    def __init__(self, results, chunk_size=65536, project=None):
+        self.results = results
+        self.project = project
+        self.header = {}
+        self._chunks = results.iter_content(chunk_size)
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        self._in_results = False
+        self._expect('{')
+        self._read_members()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self._in_results:
+            raise StopIteration
+
+        char = self._peek()
+        if char == ',':
+            self._pos += 1
+            char = self._peek()
+        if char == ']':
+            self._pos += 1
+            self._in_results = False
+            self._read_members()
+            self.results.close()
+            raise StopIteration
+
+        if self.project is not None:
+            return self.project(self._value())
+        return self._value()
+
+    def close(self):
+        """Give the connection back if we're abandoning the page part way through"""
+        self.results.close()
+
+    def _fill(self, want=1):
+        """Read chunks until we have at least <want> unread characters (or run out)"""
+        if self._pos:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        while len(self._buf) < want and not self._eof:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                self._buf += self._utf8.decode(b'', final=True)
+                self._eof = True
+            else:
+                self._buf += self._utf8.decode(chunk)
+        return len(self._buf) >= want
+
+    def _peek(self):
+        """Return the next non-whitespace character without consuming it ('' at the end)"""
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise spectreapi.SpectreException(
+                f'Malformed page: expected {char!r} at {self._buf[self._pos:self._pos + 40]!r}')
+        self._pos += 1
+
+    def _value(self):
+        """Decode the next complete JSON value, reading more of the body as needed"""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # A number running up against the end of the buffer might have more digits to come
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            # Grow geometrically so a big element isn't re-scanned once per chunk
+            self._fill(2 * (len(self._buf) - self._pos) + 1)
+
+    def _read_members(self):
+        """Read top level members into <header> until we reach "results" or the end of the page"""
+        while True:
+            char = self._peek()
+            if char == ',':
+                self._pos += 1
+                char = self._peek()
+            if char in ('}', ''):
+                self._pos += 1
+                return
+
+            key = self._value()
+            self._expect(':')
+            if key == 'results' and self._peek() == '[':
+                self._pos += 1
+                self._in_results = True
+                return
+            self.header[key] = self._value()
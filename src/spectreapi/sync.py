@@ -0,0 +1,199 @@
+"""
+Keeping a local SQLite snapshot of a zone's devices up to date.
+
+Finding out what changed by downloading all of zonedata/devices every time
+is the heaviest thing a script can do to a Command Center.  A DeviceSync
+keeps the zone's devices in SQLite along with a watermark (the newest
+lastObserved/created it has seen).  The first sync is a normal paginated
+query; after that only devices observed since the watermark are fetched
+and upserted by id.  To spot devices that have gone, each sync asks the
+server how many devices the zone has (one row, see Query.count) and only
+if that's fewer than we hold does it list the ids to find which.
+"""
+import sqlite3
+import time
+from typing import Iterable, Iterator, List, Optional
+
+import spectreapi
+
+# The filter (less its "filter." prefix) asking for devices observed at or after a time (ms since the epoch)
+SINCE_FILTER = 'device.lastObserved.after'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS devices (
+    zone_id INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    ip TEXT,
+    mac TEXT,
+    last_observed INTEGER,
+    created INTEGER,
+    data BLOB NOT NULL,
+    PRIMARY KEY (zone_id, id)
+);
+CREATE INDEX IF NOT EXISTS devices_ip ON devices (zone_id, ip);
+CREATE TABLE IF NOT EXISTS sync_state (
+    zone_id INTEGER PRIMARY KEY,
+    watermark INTEGER,
+    synced_at REAL
+);
+'''
+
+
+def _stamp(row) -> int:
+    """The newest of a device's lastObserved and created"""
+    return max(row.get('lastObserved') or 0, row.get('created') or 0)
+
+
+class ChangeSet:
+    """What a DeviceSync.sync() changed: devices <added> and <updated>
+    (rows) and the ids of those <gone>"""
+
+    def __init__(self, zone_id, full=False):
+        self.zone_id = zone_id
+        self.full = full
+        self.added = []
+        self.updated = []
+        self.gone = []
+        self.fetched = 0
+        self.seconds = 0.0
+
+    def __bool__(self):
+        return bool(self.added or self.updated or self.gone)
+
+    def __repr__(self):
+        return (f'ChangeSet(zone {self.zone_id}, added={len(self.added)}, updated={len(self.updated)}, '
+                f'gone={len(self.gone)}, fetched={self.fetched}{", full" if self.full else ""})')
+
+
+class DeviceSync:
+    """
+    A SQLite snapshot (in the file at <path>, which can hold several zones)
+    of <zone>'s devices, fetched with <details>.  Each sync() fetches what's
+    changed and returns a ChangeSet; in between, the snapshot can be
+    queried offline.  If the server doesn't know <since_filter> it'll send
+    everything, which is slower but still gives the right answer.
+
+    >>> import spectreapi
+    >>> s = spectreapi.APIKeyServer('server', api_key='...')
+    >>> sync = spectreapi.DeviceSync(s.get_zone_by_name('Twilight'), 'devices.db', details=['Attributes'])
+    >>> changes = sync.sync()
+    >>> for device in changes.added:
+    ...     print('new device', device['ip'])
+    >>> inside = list(sync.devices("ip LIKE ?", ['10.20.%']))
+    """
+
+    def __init__(self, zone, path, details: Iterable[str] = (), since_filter=SINCE_FILTER, check_gone=True):
+        self.zone = zone
+        self.path = path
+        self.details = list(details)
+        self.since_filter = since_filter
+        self.check_gone = check_gone
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA)
+
+    def __repr__(self):
+        return f'DeviceSync({self.zone.name!r}, {self.path!r}, {len(self)} devices, watermark={self.watermark})'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM devices WHERE zone_id = ?', (self.zone.id_num,)).fetchone()[0]
+
+    @property
+    def watermark(self) -> Optional[int]:
+        """The newest lastObserved/created we've synced (None before the first sync)"""
+        row = self.db.execute('SELECT watermark FROM sync_state WHERE zone_id = ?', (self.zone.id_num,)).fetchone()
+        return row[0] if row else None
+
+    def query(self, since=None) -> 'spectreapi.Query':
+        """The query for our zone's devices (observed since <since>, if given)"""
+        query = self.zone.query()
+        for detail in self.details:
+            query.detail(detail)
+        if since is not None:
+            query.filter(self.since_filter, since)
+        return query
+
+    def sync(self, full=False) -> ChangeSet:
+        """
+        Bring the snapshot up to date, fetching everything on the first sync
+        (or if <full>) and only devices observed since the watermark after
+        that.  Returns what changed.
+        """
+        start = time.perf_counter()
+        watermark = None if full else self.watermark
+        changes = ChangeSet(self.zone.id_num, full=watermark is None)
+        newest = watermark or 0
+        seen = set()
+        codec = self.zone.server.codec
+
+        with self.db:
+            for row in self.query(watermark).run():
+                changes.fetched += 1
+                stamp = _stamp(row)
+                if watermark is not None and stamp < watermark:
+                    continue  # The server didn't filter, and we have this one already
+                newest = max(newest, stamp)
+                seen.add(row['id'])
+                self._upsert(row, codec.dumps(row), changes)
+
+            if changes.full:
+                known = self._ids()
+            elif self.check_gone and len(self) > self.zone.query().count():
+                known = self._ids()
+                seen = {row['id'] for row in self.zone.query().run()}
+            else:
+                known = set()
+            changes.gone = sorted(known - seen)
+            self.db.executemany('DELETE FROM devices WHERE zone_id = ? AND id = ?',
+                                ((self.zone.id_num, id_num) for id_num in changes.gone))
+
+            self.db.execute('INSERT OR REPLACE INTO sync_state (zone_id, watermark, synced_at) VALUES (?, ?, ?)',
+                            (self.zone.id_num, newest, time.time()))
+        changes.seconds = time.perf_counter() - start
+        return changes
+
+    def _ids(self) -> set:
+        return {row[0] for row in self.db.execute('SELECT id FROM devices WHERE zone_id = ?', (self.zone.id_num,))}
+
+    def _upsert(self, row, data, changes):
+        old = self.db.execute('SELECT data FROM devices WHERE zone_id = ? AND id = ?',
+                              (self.zone.id_num, row['id'])).fetchone()
+        if old is None:
+            changes.added.append(row)
+        elif bytes(old[0]) != data:
+            changes.updated.append(row)
+        else:
+            return
+        self.db.execute('INSERT OR REPLACE INTO devices (zone_id, id, ip, mac, last_observed, created, data) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (self.zone.id_num, row['id'], row.get('ip'), row.get('mac'), row.get('lastObserved'),
+                         row.get('created'), data))
+
+    def devices(self, where=None, params=()) -> Iterator[dict]:
+        """
+        The devices in the snapshot, optionally just those matching the SQL
+        <where> clause (over the id, ip, mac, last_observed and created
+        columns) with <params> for its placeholders
+        """
+        sql = 'SELECT data FROM devices WHERE zone_id = ?'
+        if where:
+            sql += f' AND ({where})'
+        loads = self.zone.server.codec.loads
+        for (data,) in self.db.execute(sql + ' ORDER BY id', [self.zone.id_num, *params]):
+            yield loads(data)
+
+    def device(self, id_num) -> Optional[dict]:
+        """The device with id <id_num> (None if we don't have it)"""
+        return next(self.devices('id = ?', [id_num]), None)
+
+    def get(self, ip_address) -> List[dict]:
+        """The devices with address <ip_address>"""
+        return list(self.devices('ip = ?', [str(ip_address)]))
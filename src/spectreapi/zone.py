@@ -1,6 +1,9 @@
 """Module to handle Spectre Zones"""
 import ipaddress
-import math
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+from typing import Iterator, Optional, Tuple
 
 import spectreapi
 
@@ -15,6 +18,8 @@ class Zone:
         self.name = name
         self.description = description
         self.server = server
+        self.reference_ips = {}  # child IP -> the reference IP of its device
+        self.last_collapse = None  # What the last set_*_cidrs(collapse=True) sent (a CollapsedCidrs)
 
     def __repr__(self):
         return f'Zone({self.id_num}, "{self.name}", "{self.description}")'
@@ -22,16 +27,20 @@ class Zone:
     def __str__(self):
         return f'id={self.id_num}, name={self.name}, description={self.description})'
 
-    def _get_cidrs(self, cidr_type):
+    def _cidr_api(self, cidr_type, method):
+        """The API path for our <cidr_type> CIDRs, checking we can call <method> on them"""
         if cidr_type not in ('known', 'trusted', 'internal', 'avoid'):
-            raise spectreapi.InvalidArgument(f'{cidr_type} is not a valid type for _get_cidrs')
+            raise spectreapi.InvalidArgument(f'{cidr_type} is not a valid type for {method}')
 
         if self.server is None:
-            raise spectreapi.NoServerException(
-                'Collector.getCidrs() requires a Collector with a server')
+            raise spectreapi.NoServerException(f'Zone.{method}() requires a Zone with a server')
+
+        return f'zone/{self.id_num}/cidr/{cidr_type}'
 
+    def _get_cidrs(self, cidr_type):
+        api = self._cidr_api(cidr_type, '_get_cidrs')
         cidrs = []
-        results = self.server.get(f'zone/{self.id_num}/cidr/{cidr_type}')
+        results = self.server.get(api)
         for cidr in results:
             cidrs.append(ipaddress.ip_network(cidr))
 
@@ -67,31 +76,17 @@ class Zone:
         """
         return self._get_cidrs('avoid')
 
-    def _set_cidrs(self, cidr_type, *cidrs, append=False, chunk_size=5000):
-        if cidr_type not in ('known', 'trusted', 'internal', 'avoid'):
-            raise spectreapi.InvalidArgument(f'{cidr_type} is not a valid type for _set_cidrs')
-
-        if self.server is None:
-            raise spectreapi.NoServerException(
-                'Collector.setCidrs() requires a Zone with a server')
+    def _set_cidrs(self, cidr_type, *cidrs, append=False, chunk_size=5000, collapse=False):
+        api = self._cidr_api(cidr_type, '_set_cidrs')
+        if collapse:
+            cidrs = self.last_collapse = spectreapi.collapse_cidrs(cidrs)
 
-        clist = []
         results = None
         print(cidrs)
-        for cidr in cidrs:
-            if isinstance(cidr, list):  # Okay, we're a list of CIDRs (hopefully)
-                for list_entry in cidr:
-                    clist.append(f'{{"address":"{str(list_entry)}"}}')
-            else:
-                clist.append(f'{{"address":"{str(cidr)}"}}')
-
-        for i in range(math.ceil(len(clist) / chunk_size)):
-
-            data = '{"addresses":[' + ','.join(clist[i * chunk_size:(i + 1) * chunk_size]) + ']}'
+        for data in spectreapi.cidr_payloads(cidrs, chunk_size, self.server.codec):
             params = {"append": str(append).lower()}
 
-            results = self.server.post(f'zone/{self.id_num}/cidr/{cidr_type}',
-                data=data, params=params)
+            results = self.server.post(api, data=data, params=params)
             append = True  # after the first chunk, append regardless
 
             if not results.ok:
@@ -100,66 +95,50 @@ class Zone:
         return results
 
     def _delete_cidrs(self, cidr_type, *cidrs, chunk_size=5000):
-        if cidr_type not in ('known', 'trusted', 'internal', 'avoid'):
-            raise spectreapi.InvalidArgument(f'{cidr_type} is not a valid type for _set_cidrs')
-
-        if self.server is None:
-            raise spectreapi.NoServerException(
-                'Collector.setCidrs() requires a Zone with a server')
-
-        clist = []
+        api = self._cidr_api(cidr_type, '_delete_cidrs')
         results = None
         print(cidrs)
-        for cidr in cidrs:
-            if isinstance(cidr, list):  # Okay, we're a list of CIDRs (hopefully)
-                for list_entry in cidr:
-                    clist.append(f'{{"address":"{str(list_entry)}"}}')
-            else:
-                clist.append(f'{{"address":"{str(cidr)}"}}')
-
-        for i in range(math.ceil(len(clist) / chunk_size)):
+        for data in spectreapi.cidr_payloads(cidrs, chunk_size, self.server.codec):
 
-            data = '{"addresses":[' + ','.join(clist[i * chunk_size:(i + 1) * chunk_size]) + ']}'
-
-            results = self.server.delete(f'zone/{self.id_num}/cidr/{cidr_type}', data=data)
+            results = self.server.delete(api, data=data)
 
             if not results.ok:
                 raise spectreapi.SpectreException(results.text)
 
         return results
 
-    def set_known_cidrs(self, *cidrs, append=False, chunk_size=5000):
+    def set_known_cidrs(self, *cidrs, append=False, chunk_size=5000, collapse=False):
         """Set "known" CIDRs for this zone.
         "known" CIDRs are meant to be CIDRs that you know about but that you
         don't own or control. Set append to True if you want to add these CIDRs
         to the existing CIDRs"""
-        return self._set_cidrs('known', *cidrs, append=append, chunk_size=chunk_size)
+        return self._set_cidrs('known', *cidrs, append=append, chunk_size=chunk_size, collapse=collapse)
 
-    def set_eligible_cidrs(self, *cidrs, append=False, chunk_size=5000):
+    def set_eligible_cidrs(self, *cidrs, append=False, chunk_size=5000, collapse=False):
         """Set "eligible" CIDRs for this zone.
         These are the CIDRs we're allowed to scan if we learn about them.
         Set append to True if you want to add these CIDRs
         to the existing CIDRs"""
-        return self._set_cidrs('trusted', *cidrs, append=append, chunk_size=chunk_size)
+        return self._set_cidrs('trusted', *cidrs, append=append, chunk_size=chunk_size, collapse=collapse)
 
-    def set_trusted_cidrs(self, *cidrs, append=False, chunk_size=5000):
+    def set_trusted_cidrs(self, *cidrs, append=False, chunk_size=5000, collapse=False):
         """Set "trusted" (AKA "eligible") CIDRs for this zone.
         Set append to True if you want to add these CIDRs
         to the existing CIDRs"""
-        return self._set_cidrs('trusted', *cidrs, append=append, chunk_size=chunk_size)
+        return self._set_cidrs('trusted', *cidrs, append=append, chunk_size=chunk_size, collapse=collapse)
 
-    def set_internal_cidrs(self, *cidrs, append=False, chunk_size=5000):
+    def set_internal_cidrs(self, *cidrs, append=False, chunk_size=5000, collapse=False):
         """Set "internal" CIDRs for this zone.
         "internal" CIDRs are the ones you own or control that are a part of
         your network Set append to True if you want to add these CIDRs
         to the existing CIDRs"""
-        return self._set_cidrs('internal', *cidrs, append=append, chunk_size=chunk_size)
+        return self._set_cidrs('internal', *cidrs, append=append, chunk_size=chunk_size, collapse=collapse)
 
-    def set_avoid_cidrs(self, *cidrs, append=False, chunk_size=5000):
+    def set_avoid_cidrs(self, *cidrs, append=False, chunk_size=5000, collapse=False):
         """Set "avoid" CIDRs for this zone.
         "avoid" CIDRs are the ones we won't actively scan Set append to True
         if you want to add these CIDRs to the existing CIDRs"""
-        return self._set_cidrs('avoid', *cidrs, append=append, chunk_size=chunk_size)
+        return self._set_cidrs('avoid', *cidrs, append=append, chunk_size=chunk_size, collapse=collapse)
 
     def delete_eligible_cidrs(self, *cidrs, chunk_size=5000):
         """Delete "eligible" CIDRs for this zone.
@@ -189,65 +168,59 @@ class Zone:
     def query(self, api='zonedata/devices'):
         return self.server.query(api).filter('zone.id', self.id_num)
 
+    def _collector_payload(self, name):
+        return self.server.codec.dumps([{
+            "@class": "collector",
+            "name": name,
+            "discoveryInterface": {
+                "name": f"{self.server.name}:eth0",
+                "type": "ETHERNET",
+                "active": True,
+                "config": "manual/10000/full",
+                "ospf": {}
+            },
+            "zone": {
+                "id": self.id_num,
+                "name": self.name
+            },
+            "enabled": True,
+            "rescanInterval": 1000000,
+            "hostDiscovery": {
+                "enabled": True,
+                "icmp": True,
+                "dns": False,
+                "snmp": False,
+                "udp": False
+            }
+        }])
+
     def get_or_create_collector(self, name):
         collector = self.server.get_collector_by_name(name)
         if collector:
             return collector
 
-        data = '''
-            [ {
-                "@class" : "collector",
-                "name" : "%s",
-                "discoveryInterface" : {
-                "name" : "%s:eth0",
-                "type" : "ETHERNET",
-                "active" : true,
-                "config" : "manual/10000/full",
-                "ospf" : { }
-                },
-                "zone" : {
-                "id" : %d,
-                "name" : "%s"
-                },
-                "enabled" : true,
-                "rescanInterval" : 1000000,
-                "hostDiscovery" : {
-                    "enabled" : true,
-                    "icmp" : true,
-                    "dns" : false,
-                    "snmp" : false,
-                    "udp" : false
-                }
-                } ] ''' % (name, self.server.name, self.id_num, self.name)
-        self.server.post("zone/collector", data=data)
+        self.server.post("zone/collector", data=self._collector_payload(name))
         collector = self.server.get_collector_by_name(name)
         return collector
 
+    def _device_details_params(self, ip_address):
+        params = {
+            'filter.zone.id': self.id_num,
+            'filter.address.ip': ip_address,
+        }
+        params.update(spectreapi.detail_params('full'))
+        return params
+
     def get_device_details_by_ip(self, ip_address, query_reference_ip=True):
         """Return the details for one device for a zone with an address of <ip>
         This method returns all available details (minus the profile data prior to Spectre 3.3.1)
         If query_reference_ip is True (the default) we'll query for the reference IP associated
         with <ip> and return the details for that.  If query_reference_ip is False, we won't chase
         the reference IP but will return details for the child (if any)"""
-        params = {
-            'filter.zone.id': self.id_num,
-            'filter.address.ip': ip_address,
-            'detail.ScanType': True,
-            'detail.Attributes': True,
-            'detail.Protocol': True,
-            'detail.Port': True,
-            'detail.AlternateAddress': True,
-            'detail.Profile' : True,
-            'detail.ProfileDetails' : True,
-            'detail.ReferenceIp': True,
-            'detail.Details': True,
-            'detail.LeakResponse': True,
-            'detail.Certificate': True,
-            'detail.Interfaces': True,
-            'detail.Vlans': True,
-            'detail.Collector': True,
-            'detail.SnmpAlias': True,
-        }
+        if query_reference_ip and ip_address in self.reference_ips:
+            return self.get_device_details_by_ip(self.reference_ips[ip_address])
+
+        params = self._device_details_params(ip_address)
 
         temp = self.server.get('zonedata/devices', params=params)
 
@@ -263,9 +236,99 @@ class Zone:
                     .filter('device.associated', 'true')\
                     .run()
                 if result.total > 0 and result.result['referenceIp']:
+                    self.reference_ips[ip_address] = result.result['referenceIp']
                     return self.get_device_details_by_ip(result.result['referenceIp'])
             else:
                 params['filter.device.associated'] = True
                 return self.server.get('zonedata/devices', params=params)
         else:
             return temp
+
+    def _reference_ip(self, ip_address) -> Optional[str]:
+        """The reference IP of the device <ip_address> belongs to (remembered once found)"""
+        if ip_address not in self.reference_ips:
+            result = self.query()\
+                .detail('ReferenceIp')\
+                .filter('address.ip', ip_address)\
+                .filter('device.associated', 'true')\
+                .run()
+            if result.total == 0 or not result.result['referenceIp']:
+                return None
+            self.reference_ips[ip_address] = result.result['referenceIp']
+        return self.reference_ips[ip_address]
+
+    def _device_details(self, ip_address, memo, associated=False) -> Optional[dict]:
+        """The details of the device with address <ip_address> (filtered on
+        device.associated if <associated>), fetched at most once per <memo>
+        however many threads (or children of the same device) ask for it"""
+        lock, entries = memo
+        with lock:
+            entry = entries.get((ip_address, associated))
+            if entry is None:
+                entry = entries[(ip_address, associated)] = [threading.Lock(), None, False]
+        with entry[0]:
+            if not entry[2]:
+                params = self._device_details_params(ip_address)
+                if associated:
+                    params['filter.device.associated'] = True
+                results = self.server.get('zonedata/devices', params=params)
+                entry[1] = results.value() if results.total else None
+                entry[2] = True
+        return entry[1]
+
+    def _resolve_device(self, ip_address, query_reference_ip, memo):
+        """What get_device_details_by_ip would find for <ip_address>, as a dict"""
+        if not query_reference_ip:
+            details = self._device_details(ip_address, memo)
+            if details is None:
+                details = self._device_details(ip_address, memo, associated=True)
+            return details
+
+        reference_ip = self.reference_ips.get(ip_address)
+        details = self._device_details(reference_ip or ip_address, memo)
+        if details is None and reference_ip is None:
+            reference_ip = self._reference_ip(ip_address)
+            if reference_ip and reference_ip != ip_address:
+                details = self._device_details(reference_ip, memo)
+        return details
+
+    def get_device_details_by_ips(self, ips, workers=8,
+                                  query_reference_ip=True) -> Iterator[Tuple[str, Optional[dict]]]:
+        """
+        Generator that looks up the device details for many IPs at once (see
+        get_device_details_by_ip) on <workers> threads, yielding (ip, details)
+        as each lookup completes (details is None if there's no such device).
+        Each distinct IP is looked up (and yielded) once, children are mapped
+        to their reference IP once (and remembered, see <reference_ips>), and
+        a device with several children in <ips> has its details fetched once
+        per call.
+        >>> import spectreapi
+        >>> s=spectreapi.UsernameServer('server','username','password')
+        >>> zone = s.get_zone_by_name('Twilight')
+        >>> for ip, device in zone.get_device_details_by_ips(firewall_ips, workers=16):
+        ...     print(ip, device and device['id'])
+        """
+        self.server.prepare_threads(workers)
+        pending = iter(dict.fromkeys(str(ip) for ip in ips))
+        window = 2 * workers
+        memo = (threading.Lock(), {})  # Details are only shared within this call, they go stale
+        resolve = partial(self._resolve_device, query_reference_ip=query_reference_ip, memo=memo)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='spectreapi-details') as executor:
+            in_flight = {}
+            try:
+                for ip_address in pending:
+                    in_flight[executor.submit(resolve, ip_address)] = ip_address
+                    if len(in_flight) >= window:
+                        break
+
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        ip_address = in_flight.pop(future)
+                        for next_ip in pending:
+                            in_flight[executor.submit(resolve, next_ip)] = next_ip
+                            break
+                        yield ip_address, future.result()
+            finally:
+                for future in in_flight:
+                    future.cancel()
@@ -1,8 +1,16 @@
 '''Setup for all the tests'''
 import spectreapi
 import pytest
+from standin import StandInServer, StandInSession
 
 @pytest.fixture()
 def server():
     '''Just sets up a server'''
     return spectreapi.UsernameServer('6hour', 'admin', 'admin')
+
+@pytest.fixture()
+def standin():
+    '''A Server wired up to a local stand-in for the Command Center'''
+    server = StandInServer('standin', page_size=10)
+    server.session = StandInSession()
+    return server
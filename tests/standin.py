@@ -0,0 +1,117 @@
+'''A local stand-in for a Spectre Command Center, so we can exercise
+paging and decoding without a real server on the other end'''
+import gzip
+import io
+import json
+
+import requests
+import urllib3
+
+import spectreapi
+
+
+def make_response(body, status_code=200, url='https://standin/api/rest/', compress=False):
+    '''Build a requests.Response carrying <body> the way the server would send it
+    (gzipped on the wire if <compress>)'''
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = url
+    response.headers['Content-Type'] = 'application/json'
+    if not isinstance(body, bytes):
+        body = json.dumps(body, indent=2).encode('utf-8')
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+        response.raw = urllib3.HTTPResponse(io.BytesIO(gzip.compress(body)), headers=response.headers,
+                                            status=status_code, preload_content=False, decode_content=True)
+    else:
+        response.raw = io.BytesIO(body)
+    return response
+
+
+class StandInSession(requests.Session):
+    '''Pretends to be the requests.Session a Server talks through.
+    <collections> maps an api path to the list of rows it serves (or to a
+    callable returning that list, so a test can make a query shrink).
+    Anything in <faults> is served first, one per request: a status code,
+    a (status code, headers) pair or an exception to raise.'''
+
+    def __init__(self, collections=None):
+        super().__init__()
+        self.collections = collections or {}
+        self.calls = []
+        self.faults = []
+        self.compress = False
+        self.verify = False
+
+    def _fault(self, url):
+        if not self.faults:
+            return None
+        fault = self.faults.pop(0)
+        if isinstance(fault, Exception):
+            raise fault
+        status, headers = fault if isinstance(fault, tuple) else (fault, {})
+        response = make_response(b'the server is having a bad day', status_code=status, url=url)
+        response.headers.update(headers)
+        return response
+
+    def _rows(self, api):
+        rows = self.collections[api]
+        if callable(rows):
+            rows = rows()
+        return rows
+
+    def get(self, url, params=None, headers=None, **kargs):
+        api = url.split('/api/rest/', 1)[1]
+        params = dict(params or {})
+        self.calls.append(('GET', api, params))
+        fault = self._fault(url)
+        if fault is not None:
+            return fault
+        rows = self._rows(api)
+        size = int(params.get('query.pagesize', len(rows) or 1))
+        page = int(params.get('query.page', 0))
+        response = make_response({'@class': 'apiresponse',
+                                  'status': 'SUCCESS',
+                                  'total': len(rows),
+                                  'results': rows[page * size:(page + 1) * size]}, url=url,
+                                 compress=self.compress)
+        if not kargs.get('stream'):
+            response.content  # requests reads the whole body up front unless we're streaming
+        return response
+
+    def _send(self, method, url, **kargs):
+        api = url.split('/api/rest/', 1)[1]
+        self.calls.append((method, api, kargs))
+        fault = self._fault(url)
+        if fault is not None:
+            return fault
+        return make_response({'@class': 'apiresponse', 'status': 'SUCCESS'}, url=url)
+
+    def post(self, url, **kargs):
+        return self._send('POST', url, **kargs)
+
+    def put(self, url, **kargs):
+        return self._send('PUT', url, **kargs)
+
+    def delete(self, url, **kargs):
+        return self._send('DELETE', url, **kargs)
+
+
+def devices(count, start=1):
+    '''Generate <count> device rows that look like zonedata/devices output'''
+    return [{'@class': 'device',
+             'id': i,
+             'ip': f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}',
+             'mac': '00:0e:d7:1b:11:01',
+             'active': False,
+             'firstObserved': 1524244323000 + i,
+             'lastObserved': 1524244323000 + i,
+             'phaseComplete': False,
+             'created': 1524431990907} for i in range(start, start + count)]
+
+
+class StandInServer(spectreapi.Server):
+    '''A Server whose every thread (once it's thread_safe) talks to the one stand-in session'''
+
+    def _new_session(self):
+        return self._session
@@ -0,0 +1,213 @@
+'''Tests for the asyncio AsyncServer, against a stand-in transport'''
+import asyncio
+import json
+
+import pytest
+import spectreapi
+from standin import devices
+
+httpx = pytest.importorskip('httpx')
+
+
+class StandInTransport:
+    '''Serves paged collections the way the Command Center would, via httpx.MockTransport'''
+
+    def __init__(self, collections):
+        self.collections = collections
+        self.calls = []
+
+    def __call__(self, request):
+        api = request.url.path.split('/api/rest/', 1)[1]
+        params = dict(request.url.params)
+        self.calls.append((request.method, api, params, request.content))
+        if request.method != 'GET':
+            return httpx.Response(200, json={'@class': 'apiresponse', 'status': 'SUCCESS'})
+        if api not in self.collections:
+            return httpx.Response(404, text='no such api')
+        rows = self.collections[api]
+        size = int(params.get('query.pagesize', len(rows) or 1))
+        page = int(params.get('query.page', 0))
+        return httpx.Response(200, json={'@class': 'apiresponse',
+                                         'status': 'SUCCESS',
+                                         'total': len(rows),
+                                         'results': rows[page * size:(page + 1) * size]})
+
+
+def async_server(collections):
+    collections.setdefault('system/information', [{'version': '3.3', 'name': 'standin'}])
+    transport = StandInTransport(collections)
+    server = spectreapi.AsyncAPIKeyServer('standin', api_key='key', page_size=10,
+                                          transport=httpx.MockTransport(transport))
+    return server, transport
+
+
+def test_async_iterate():
+    '''async for should page through every row, prefetched or not'''
+    async def run(prefetch):
+        server, transport = async_server({'zonedata/devices': devices(95)})
+        async with server:
+            response = await server.get('zonedata/devices', prefetch=prefetch)
+            assert response.total == 95
+            rows = [row['id'] async for row in response]
+            again = [row['id'] async for row in response]
+        return rows, again, transport
+
+    for prefetch in (0, 3):
+        rows, again, transport = asyncio.run(run(prefetch))
+        assert rows == list(range(1, 96))
+        assert again == rows
+        pages = [int(params['query.page']) for _, api, params, _ in transport.calls if api == 'zonedata/devices']
+        assert sorted(pages) == [0] + sorted(list(range(1, 10)) * 2), "Page 0 is fetched once and shared"
+
+
+def test_async_zone_cidrs():
+    '''AsyncZone methods are awaitable and send the same payloads as Zone'''
+    async def run():
+        server, transport = async_server({'zone': [{'id': 2, 'name': 'Twilight', 'description': 'Zone'}],
+                                          'zone/2/cidr/known': ['10.0.0.0/8']})
+        async with server:
+            zone = await server.get_zone_by_name('Twilight')
+            assert isinstance(zone, spectreapi.AsyncZone)
+            cidrs = await zone.get_known_cidrs()
+            await zone.set_known_cidrs('192.168.0.0/16', append=True)
+        return cidrs, transport
+
+    cidrs, transport = asyncio.run(run())
+    assert [str(cidr) for cidr in cidrs] == ['10.0.0.0/8']
+    method, api, params, content = transport.calls[-1]
+    assert (method, api, params['append']) == ('POST', 'zone/2/cidr/known', 'true')
+    assert json.loads(content) == {'addresses': [{'address': '192.168.0.0/16'}]}
+
+
+def test_async_error():
+    '''A failed call raises APIException'''
+    async def run():
+        server, _ = async_server({})
+        async with server:
+            await server.getpage('zone')
+
+    with pytest.raises(spectreapi.APIException):
+        asyncio.run(run())
+
+
+def test_async_details_by_ips():
+    '''AsyncZone looks devices up concurrently, remembering reference IPs'''
+    calls = []
+
+    def handler(request):
+        params = dict(request.url.params)
+        calls.append(params)
+        if request.url.path.endswith('system/information'):
+            rows = [{'version': '3.3', 'name': 'standin'}]
+        elif 'filter.device.associated' in params:
+            rows = [{'referenceIp': '10.0.0.1'}] if params['filter.address.ip'].startswith('192.') else []
+        else:
+            rows = [{'id': 1, 'ip': '10.0.0.1'}] if params['filter.address.ip'] == '10.0.0.1' else []
+        return httpx.Response(200, json={'@class': 'apiresponse', 'status': 'SUCCESS', 'total': len(rows),
+                                         'results': rows})
+
+    async def run():
+        server = spectreapi.AsyncAPIKeyServer('standin', api_key='key', transport=httpx.MockTransport(handler))
+        async with server:
+            zone = spectreapi.AsyncZone(2, 'Twilight', server=server)
+            found = {ip: device async for ip, device in
+                     zone.get_device_details_by_ips(['192.168.0.1', '10.0.0.1', '172.16.0.1', '10.0.0.1'])}
+            calls.clear()
+            again = await (await zone.get_device_details_by_ip('192.168.0.1')).result()
+        return found, again, zone
+
+    found, again, zone = asyncio.run(run())
+    assert found == {'192.168.0.1': {'id': 1, 'ip': '10.0.0.1'}, '10.0.0.1': {'id': 1, 'ip': '10.0.0.1'},
+                     '172.16.0.1': None}
+    assert again['id'] == 1
+    assert zone.reference_ips == {'192.168.0.1': '10.0.0.1'}
+    assert [params['filter.address.ip'] for params in calls] == ['10.0.0.1']
+
+
+def test_async_run_parallel():
+    '''run_parallel gets every row, in order unless ordered=False'''
+    async def run(ordered):
+        server, _ = async_server({'zonedata/devices': devices(95)})
+        async with server:
+            return [row['id'] async for row in server.query().run_parallel(workers=4, ordered=ordered)]
+
+    assert asyncio.run(run(True)) == list(range(1, 96))
+    assert sorted(asyncio.run(run(False))) == list(range(1, 96))
+
+
+def test_async_export(tmp_path):
+    '''AsyncQuery.export writes the same files as Query.export'''
+    rows = devices(25)
+
+    async def run(path, **kargs):
+        server, _ = async_server({'zonedata/devices': rows})
+        async with server:
+            return await server.query().export(str(path), **kargs)
+
+    stats = asyncio.run(run(tmp_path / 'devices.ndjson'))
+    assert stats.rows == 25
+    assert [json.loads(line) for line in (tmp_path / 'devices.ndjson').read_text().splitlines()] == rows
+    stats = asyncio.run(run(tmp_path / 'raw.ndjson', raw=True))
+    assert stats.rows == 25
+    assert [json.loads(line) for line in (tmp_path / 'raw.ndjson').read_text().splitlines()] == rows
+    stats = asyncio.run(run(tmp_path / 'devices.csv', format='csv', fields=['id', 'ip']))
+    assert (tmp_path / 'devices.csv').read_text().splitlines()[:2] == ['id,ip', '1,10.0.0.1']
+    with pytest.raises(spectreapi.InvalidArgument):
+        asyncio.run(run(tmp_path / 'devices.xml', format='xml'))
+
+
+def test_async_cidr_type():
+    '''Async CIDR methods check the type like their blocking cousins'''
+    collector = spectreapi.AsyncCollector(1, 'uuid', 'collector', None, server=object())
+    with pytest.raises(spectreapi.InvalidArgument):
+        asyncio.run(collector._set_cidrs('known', '10.0.0.0/8'))
+    with pytest.raises(spectreapi.NoServerException):
+        asyncio.run(spectreapi.AsyncZone(2, 'Twilight')._delete_cidrs('known', '10.0.0.0/8'))
+
+
+def test_async_run_partitioned():
+    '''run_partitioned awaits the zones, then merges the rows of each zone's query'''
+    rows = devices(45)
+    for row in rows:
+        row['zone'] = {'id': 1 if row['id'] % 3 else 2}
+
+    async def run():
+        server, transport = async_server({'zone': [{'id': 1, 'name': 'Zone1', 'description': ''},
+                                                   {'id': 2, 'name': 'Twilight', 'description': ''}],
+                                          'zonedata/devices': rows})
+        async with server:
+            results = await server.query().run_partitioned(by='zone', workers=2)
+            ids = [row['id'] async for row in results]
+            with pytest.raises(TypeError):
+                iter(results)
+        return ids, results, transport
+
+    ids, results, transport = asyncio.run(run())
+    assert sorted(ids) == sorted(list(range(1, 46)) * 2), "The stand-in doesn't filter, so each zone gets all 45"
+    assert results.rows == results.total == 90
+    assert [p.params['filter.zone.id'] for p in results.partitions] == [1, 2]
+    assert all(p.done for p in results.partitions)
+
+
+def test_async_adaptive_page_size():
+    '''Pages fetched by an AsyncServer feed its AdaptivePageSize like a Server's do'''
+    class RecordingSizer(spectreapi.AdaptivePageSize):
+        def __init__(self):
+            super().__init__(min_size=5, max_size=40, initial=10)
+            self.seen = []
+
+        def observe(self, api, size, rows, seconds, nbytes):
+            self.seen.append((api, size, rows))
+            super().observe(api, size, rows, seconds, nbytes)
+
+    async def run():
+        server, _ = async_server({'zonedata/devices': devices(25)})
+        server.page_sizer = sizer = RecordingSizer()
+        async with server:
+            assert len([row async for row in server.get('zonedata/devices', prefetch=2)]) == 25
+        return sizer
+
+    sizer = asyncio.run(run())
+    assert [seen for seen in sizer.seen if seen[0] == 'zonedata/devices'] == [
+        ('zonedata/devices', 10, 10), ('zonedata/devices', 10, 10), ('zonedata/devices', 10, 5)]
+    assert sizer.size_for('zonedata/devices') == 40, "Quick full pages grow the size"
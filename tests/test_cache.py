@@ -0,0 +1,89 @@
+'''Tests around the response cache'''
+import spectreapi
+from standin import StandInSession, make_response
+
+
+class ETagSession(StandInSession):
+    '''A stand-in that hands out ETags and answers If-None-Match with 304'''
+
+    def __init__(self, collections=None):
+        super().__init__(collections)
+        self.etag = '"v1"'
+        self.seen_headers = []
+
+    def get(self, url, params=None, headers=None, **kargs):
+        self.seen_headers.append(dict(headers or {}))
+        if (headers or {}).get('If-None-Match') == self.etag:
+            self.calls.append(('GET', url.split('/api/rest/', 1)[1], dict(params or {})))
+            return make_response(b'', status_code=304, url=url)
+        response = super().get(url, params=params, headers=headers, **kargs)
+        response.headers['ETag'] = self.etag
+        return response
+
+
+ZONES = [{'@class': 'zone', 'id': 1, 'name': 'Zone1', 'description': 'Default Zone'},
+         {'@class': 'zone', 'id': 2, 'name': 'Twilight', 'description': 'Zone to Test Scanning'}]
+
+
+def cached(standin, **kargs):
+    standin.cache = spectreapi.ResponseCache(**kargs)
+    standin.catalog.max_age = 0  # Every lookup goes to the server (well, the cache)
+    standin.session.collections['zone'] = ZONES
+    standin.session.collections['zonedata/devices'] = []
+    return standin
+
+
+def test_lookups_cached(standin):
+    '''Repeated lookups only fetch the zone list once'''
+    cached(standin)
+    for _ in range(5):
+        assert len(standin.get_zones()) == 2
+        assert standin.get_zone_by_name('Twilight').id_num == 2
+    assert len(standin.session.calls) == 2, "One for the list, one for the lookup by name"
+    assert standin.cache.hits == 8
+
+    list(standin.query().run())
+    list(standin.query().run())
+    assert len(standin.session.calls) == 4, "zonedata/devices isn't cached by default"
+
+
+def test_write_invalidates(standin):
+    '''A POST under a cached path drops it'''
+    cached(standin)
+    standin.get_zone_by_name('Twilight')
+    standin.post('zone', data='[]')
+    standin.get_zone_by_name('Twilight')
+    assert [method for method, _, _ in standin.session.calls] == ['GET', 'POST', 'GET']
+
+    standin.post('zone/2/cidr/known', data='{}')
+    standin.get_zone_by_name('Twilight')
+    assert len(standin.session.calls) == 5, "Changing something in a zone changes the zone list"
+
+    standin.put('publish/device/uuid', data='{}')
+    standin.get_zone_by_name('Twilight')
+    assert len(standin.session.calls) == 6
+
+
+def test_revalidate():
+    '''Once stale, an entry with an ETag is revalidated rather than fetched again'''
+    server = spectreapi.Server('standin', page_size=10, cache=spectreapi.ResponseCache(ttls={'zone': 60}))
+    server.session = ETagSession({'zone': ZONES})
+    server.catalog.max_age = 0
+    assert server.get_zone_by_name('Twilight').id_num == 2
+    for entry in server.cache._entries.values():
+        entry.expires = 0
+    assert server.get_zone_by_name('Twilight').id_num == 2
+    assert server.session.seen_headers[-1]['If-None-Match'] == '"v1"'
+    assert server.cache.revalidated == 1
+    assert server.get_zone_by_name('Twilight').id_num == 2
+    assert len(server.session.calls) == 2
+
+
+def test_cache_off(standin):
+    '''No cache unless asked'''
+    assert standin.cache is None
+    standin.catalog.max_age = 0
+    standin.session.collections['zone'] = ZONES
+    standin.get_zone_by_name('Twilight')
+    standin.get_zone_by_name('Twilight')
+    assert len(standin.session.calls) == 2
@@ -0,0 +1,112 @@
+'''Tests around the zone and collector catalog'''
+import spectreapi
+
+ZONES = [{'@class': 'zone', 'id': 1, 'name': 'Zone1', 'description': 'Default Zone'},
+         {'@class': 'zone', 'id': 2, 'name': 'Twilight', 'description': 'Zone to Test Scanning'}]
+
+
+def collectors(count):
+    return [{'@class': 'collector', 'id': i, 'uuid': f'uuid-{i}', 'name': f'Collector-{i}',
+             'zone': {'id': 2, 'name': 'Twilight'}} for i in range(1, count + 1)]
+
+
+def catalogued(standin, count=200):
+    standin.catalog.max_age = 60
+    standin.session.collections['zone'] = ZONES
+    standin.session.collections['zone/collector'] = collectors(count)
+    return standin
+
+
+def test_lookup_pushes_filter(standin):
+    '''A lookup by name asks the server for just that one, then answers from the index'''
+    catalogued(standin)
+    rows = standin.session.collections['zone/collector']
+    standin.session.collections['zone/collector'] = lambda: rows  # the stand-in ignores filters
+    collector = standin.get_collector_by_name('Collector-7')
+    assert collector.uuid == 'uuid-7'
+    _, api, params = standin.session.calls[-1]
+    assert (api, params['filter.collector.name']) == ('zone/collector', 'Collector-7')
+
+    calls = len(standin.session.calls)
+    assert standin.get_collector_by_name('Collector-7') is collector
+    assert standin.catalog.collector(uuid='uuid-150').name == 'Collector-150'
+    assert standin.catalog.collector(id_num=42).name == 'Collector-42'
+    assert len(standin.session.calls) == calls, "Everything was indexed from the first download"
+
+
+def test_refresh(standin):
+    '''refresh() indexes everything and drops what's gone'''
+    catalogued(standin, 5)
+    catalog = standin.catalog
+    catalog.refresh()
+    assert sorted(catalog.zones_by_name) == ['Twilight', 'Zone1']
+    assert catalog.zone(id_num=2).name == 'Twilight'
+    assert len(catalog.collectors_by_uuid) == 5
+
+    standin.session.collections['zone/collector'] = collectors(3)
+    catalog.refresh(zones=False)
+    assert sorted(catalog.collectors_by_id) == [1, 2, 3]
+    assert 'Collector-5' not in catalog.collectors_by_name
+    assert catalog.collector(uuid='uuid-5') is None
+
+
+def test_writes_invalidate(standin):
+    '''Creating a zone means the catalog asks again, but adding CIDRs doesn't'''
+    catalogued(standin)
+    assert standin.get_zone_by_name('Twilight').id_num == 2
+    calls = len(standin.session.calls)
+    standin.post('zone/2/cidr/known', data='{}')
+    standin.get_zone_by_name('Twilight')
+    assert len(standin.session.calls) == calls + 1
+
+    standin.post('zone', data='[]')
+    standin.get_zone_by_name('Twilight')
+    assert len(standin.session.calls) == calls + 3
+
+
+def test_no_caching_by_default(standin):
+    '''Unless asked to trust it for a while, every lookup goes back to the server'''
+    catalogued(standin)
+    standin.catalog.max_age = 0
+    standin.session.collections['zone'] = lambda: ZONES
+    assert standin.get_zone_by_name('Twilight').description == 'Zone to Test Scanning'
+    renamed = [dict(ZONES[0]), dict(ZONES[1], description='Renamed')]
+    standin.session.collections['zone'] = lambda: renamed
+    assert standin.get_zone_by_name('Twilight').description == 'Renamed'
+    assert spectreapi.Catalog(standin).max_age == 0
+
+
+def test_name_filter_refused(standin):
+    '''A server that won't filter on name gets the whole list scanned instead'''
+    catalogued(standin, 5)
+    standin.session.faults = [400]
+    assert standin.get_collector_by_name('Collector-3').uuid == 'uuid-3'
+    assert [params for _, _, params in standin.session.calls] == [
+        {'filter.collector.name': 'Collector-3', 'query.pagesize': 10, 'query.page': 0},
+        {'query.pagesize': 10, 'query.page': 0}]
+
+
+def test_missing(standin):
+    catalogued(standin, 3)
+    assert standin.get_zone_by_name('Nowhere') is None
+    assert standin.get_collector_by_name('Collector-99') is None
+    assert standin.catalog.zone(id_num=99) is None
+
+
+def test_collector_configs(standin):
+    '''All the configs come back in one paginated query, keyed by id'''
+    catalogued(standin, 25)
+    configs = standin.get_collector_configs()
+    assert sorted(configs) == list(range(1, 26))
+    assert configs[7]['uuid'] == 'uuid-7'
+    assert len(standin.session.calls) == 3
+    _, api, params = standin.session.calls[-1]
+    assert (api, params['detail.Config'], params['detail.Interface']) == ('zone/collector', True, True)
+
+    assert sorted(standin.get_collector_configs(ids=[3, 4, 99], workers=4)) == [3, 4]
+
+    after = dict(configs)
+    del after[1]
+    after[2] = dict(after[2], name='Renamed')
+    after[26] = {'id': 26}
+    assert spectreapi.diff_configs(configs, after) == ({26}, {1}, {2})
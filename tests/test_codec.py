@@ -0,0 +1,65 @@
+'''Tests around the pluggable JSON codec'''
+import pytest
+import spectreapi
+from standin import devices
+
+
+class CountingCodec(spectreapi.StdlibCodec):
+    '''Counts what goes through it'''
+
+    def __init__(self):
+        self.encoded = self.decoded = 0
+
+    def dumps(self, obj):
+        self.encoded += 1
+        return super().dumps(obj)
+
+    def loads(self, data):
+        self.decoded += 1
+        return super().loads(data)
+
+
+def test_codecs_agree():
+    '''Every codec we have encodes compactly and decodes what the others encode'''
+    codecs = [spectreapi.StdlibCodec()]
+    if spectreapi.codec.orjson is not None:
+        codecs.append(spectreapi.OrjsonCodec())
+    rows = devices(3) + [{'name': 'café', 'nested': {'list': [1, 2.5, None, True]}}]
+    for encoder in codecs:
+        body = encoder.dumps(rows)
+        assert isinstance(body, bytes)
+        assert b': ' not in body and b'\n' not in body
+        for decoder in codecs:
+            assert decoder.loads(body) == rows
+            assert decoder.loads(body.decode('utf-8')) == rows
+
+
+def test_default_codec():
+    expected = 'orjson' if spectreapi.codec.orjson is not None else 'json'
+    assert spectreapi.default_codec().name == expected
+    assert spectreapi.Server('standin').codec.name == expected
+
+
+def test_server_codec(standin):
+    '''Pages, counts and publishes all go through the server's codec'''
+    codec = standin.codec = CountingCodec()
+    standin.session.collections['zonedata/devices'] = devices(25)
+    assert len(list(standin.query().run())) == 25
+    assert codec.decoded == 3
+    assert standin.query().count() == 25
+    assert codec.decoded == 4
+
+    collector = spectreapi.Collector(1, 'uuid', 'collector', None, server=standin)
+    collector.add_devices({'devices': devices(2)})
+    collector.set_avoid_cidrs('10.0.0.0/8')
+    assert codec.encoded == 2
+    _, _, kargs = standin.session.calls[-2]
+    assert codec.loads(kargs['data'])['devices'][0]['responses'][0]['collector']['uuid'] == 'uuid'
+
+
+@pytest.mark.skipif(spectreapi.codec.orjson is None, reason='needs orjson')
+def test_orjson_pages(standin):
+    '''orjson decodes the same pages to the same rows'''
+    standin.codec = spectreapi.OrjsonCodec()
+    standin.session.collections['zonedata/devices'] = devices(25)
+    assert list(standin.query().run()) == devices(25)
@@ -0,0 +1,58 @@
+'''Tests around collapsing CIDRs before uploading them'''
+import ipaddress
+import json
+import random
+
+import spectreapi
+
+
+def covered(cidrs):
+    '''Every address the CIDRs cover, as integers'''
+    addresses = set()
+    for cidr in cidrs:
+        network = ipaddress.ip_network(cidr, strict=False)
+        addresses.update(range(int(network.network_address), int(network.broadcast_address) + 1))
+    return addresses
+
+
+def test_collapse():
+    '''Adjacent and overlapping networks merge, IPv4 and IPv6 separately'''
+    cidrs = [f'10.0.0.{i}/32' for i in range(8)] + ['10.0.0.8/30', '10.0.0.12/30', '10.0.0.0/28',
+                                                   '192.168.1.0/24', '192.168.0.0/24', '192.168.2.5',
+                                                   ipaddress.ip_network('2001:db8::/33'), '2001:db8:8000::/33',
+                                                   ['::1', '::2']]
+    collapsed = spectreapi.collapse_cidrs(cidrs)
+    assert collapsed == ['10.0.0.0/28', '192.168.0.0/23', '192.168.2.5/32', '::1/128', '::2/128', '2001:db8::/32']
+    assert collapsed.before == 18
+    assert collapsed.ratio == 3.0
+    assert spectreapi.collapse_cidrs(['0.0.0.0/1', '128.0.0.0/1']) == ['0.0.0.0/0']
+    assert spectreapi.collapse_cidrs(['not a cidr', '10.0.0.1']) == ['10.0.0.1/32', 'not a cidr']
+
+
+def test_collapse_covers_the_same():
+    '''Random /32s to /28s collapse to fewer CIDRs covering exactly the same addresses'''
+    rng = random.Random(4)
+    cidrs = [f'10.0.{rng.randrange(4)}.{rng.randrange(256)}/{rng.randrange(28, 33)}' for _ in range(3000)]
+    collapsed = spectreapi.collapse_cidrs(cidrs)
+    assert covered(collapsed) == covered(cidrs)
+    assert len(collapsed) < 100
+    networks = [ipaddress.ip_network(cidr) for cidr in collapsed]
+    assert not any(a.overlaps(b) for a, b in zip(networks, networks[1:]))
+
+
+def test_set_cidrs_collapse(standin):
+    '''set_*_cidrs(collapse=True) sends fewer CIDRs in fewer chunks'''
+    zone = spectreapi.Zone(2, 'Twilight', server=standin)
+    cidrs = [f'10.1.{i >> 8}.{i & 255}/32' for i in range(4096)]
+    zone.set_avoid_cidrs(cidrs, chunk_size=1000, collapse=True)
+    assert len(standin.session.calls) == 1
+    assert json.loads(standin.session.calls[0][2]['data']) == {'addresses': [{'address': '10.1.0.0/20'}]}
+    assert zone.last_collapse.ratio == 4096
+
+    collector = spectreapi.Collector(7, 'uuid', 'RodSerling', zone, server=standin)
+    collector.set_target_cidrs('10.0.0.0/25', '10.0.0.128/25', collapse=True)
+    assert json.loads(standin.session.calls[1][2]['data']) == {'addresses': [{'address': '10.0.0.0/24'}]}
+
+    standin.session.calls = []
+    zone.set_avoid_cidrs(cidrs, chunk_size=1000)
+    assert len(standin.session.calls) == 5, "Sent as given without collapse"
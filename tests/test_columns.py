@@ -0,0 +1,60 @@
+'''Tests around columnar output from a Response'''
+from array import array
+
+import spectreapi
+from standin import devices
+
+
+def test_to_columns_round_trip(standin):
+    '''Rows should come back out of Columns the way they went in'''
+    rows = devices(25)
+    rows[3]['ip'] = None
+    rows[4]['ip'] = '2600:802:460:653:250:56ff:fe8e:b667'
+    standin.session.collections['zonedata/devices'] = rows
+    fields = ['id', 'ip', 'mac', 'active', 'lastObserved']
+    columns = standin.query().run().to_columns(fields)
+    assert len(columns) == 25
+    assert [columns.row(i) for i in range(25)] == [{f: r[f] for f in fields} for r in rows]
+    assert isinstance(columns['ip'], spectreapi.IPColumn)
+    assert isinstance(columns['lastObserved'].data, array)
+    assert columns['mac'].values == ['00:0e:d7:1b:11:01'], "Strings should be stored once"
+
+
+def test_filter_by_network(standin):
+    '''Filtering on packed addresses should pick out the right rows'''
+    standin.session.collections['zonedata/devices'] = devices(600)
+    columns = standin.query().run().to_columns(['id', 'ip'])
+    inside = columns.filter(columns['ip'].in_network('10.0.1.0/24'))
+    assert [row['id'] for row in inside] == list(range(256, 512))
+
+
+def test_batches_and_mixed_types(standin):
+    '''Batches should split the results, and odd fields fall back to objects'''
+    rows = devices(25)
+    rows[10]['id'] = 'eleven'
+    standin.session.collections['zonedata/devices'] = rows
+    batches = list(standin.query().run().batches(10, fields=['id', 'zone.id']))
+    assert [len(b) for b in batches] == [10, 10, 5]
+    assert batches[1]['id'][0] == 'eleven'
+    assert batches[1]['id'][1] == 12
+    assert batches[0]['zone.id'][0] is None
+
+
+def test_take_is_independent():
+    '''Columns taken from another have their own storage, so appending to one leaves the other alone'''
+    strings = spectreapi.StrColumn()
+    for value in ('a', 'b', None, 'c', 'b'):
+        strings.append(value)
+    taken = strings.take([1, 2, 4])
+    assert [taken[i] for i in range(3)] == ['b', None, 'b']
+    assert taken.values == ['b']
+    taken.append('z')
+    assert strings.values == ['a', 'b', 'c']
+    assert strings.equals('z') == [False] * 5
+
+    floats = spectreapi.FloatColumn(nulls=2)
+    floats.append(1.5)
+    taken = floats.take([2, 0])
+    assert isinstance(taken, spectreapi.FloatColumn)
+    assert [taken[0], taken[1]] == [1.5, None]
+    assert spectreapi.BoolColumn(nulls=1).take([0])[0] is None
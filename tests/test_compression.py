@@ -0,0 +1,46 @@
+'''Tests around compressed transfers and the request stats'''
+import gzip
+import json
+
+import spectreapi
+from standin import devices
+
+
+def test_compact_accept(standin):
+    '''We ask for compact JSON unless told otherwise'''
+    assert standin.json_headers['Accept'] == 'application/json'
+    assert 'gzip' in standin.headers['Accept-Encoding']
+    assert spectreapi.Server('standin', pretty=True).json_headers['Accept'] == 'json:pretty'
+
+
+def test_compressed_pages(standin):
+    '''Gzipped pages decode the same and the stats see both sizes'''
+    standin.session.collections['zonedata/devices'] = devices(100)
+    standin.session.compress = True
+    assert [d['id'] for d in standin.query().run()] == list(range(1, 101))
+    assert [d['id'] for d in standin.query().run(stream=True)] == list(range(1, 101))
+
+    stats = standin.stats
+    assert stats.requests == len(standin.session.calls)
+    assert 0 < stats.bytes_received < stats.body_bytes
+    assert stats.bytes_saved == stats.body_bytes - stats.bytes_received
+    assert stats.compression_ratio > 2
+
+
+def test_gzip_requests(standin):
+    '''Bodies over the threshold go out gzipped, smaller ones as they are'''
+    standin.gzip_threshold = 1024
+    zone = spectreapi.Zone(2, 'Twilight', server=standin)
+    zone.set_known_cidrs('10.0.0.0/8')
+    _, _, kargs = standin.session.calls[-1]
+    assert 'Content-Encoding' not in kargs['headers']
+
+    cidrs = [f'10.{i >> 8}.{i & 255}.0/24' for i in range(2000)]
+    zone.set_known_cidrs(cidrs)
+    _, _, kargs = standin.session.calls[-1]
+    assert kargs['headers']['Content-Encoding'] == 'gzip'
+    assert kargs['headers']['Accept'] == 'application/json'
+    assert len(json.loads(gzip.decompress(kargs['data']))['addresses']) == 2000
+
+    assert standin.stats.bytes_sent < standin.stats.raw_bytes_sent
+    assert standin.stats.bytes_saved > 0
@@ -0,0 +1,29 @@
+'''Tests around counting results without fetching them'''
+from standin import devices
+
+
+def test_count(standin):
+    '''count() should ask for a single bare row and read the total'''
+    standin.session.collections['zonedata/devices'] = devices(1234)
+    query = standin.query().filter('zone.id', 2).detail('Attributes').detail('Interfaces')
+    assert query.count() == 1234
+    assert query.exists()
+    _, _, params = standin.session.calls[-1]
+    assert params['query.pagesize'] == 1
+    assert params['filter.zone.id'] == 2
+    assert not [name for name in params if name.startswith('detail.')]
+    assert 'detail.Attributes' in query.params, "The query itself should keep its details"
+
+
+def test_exists_empty(standin):
+    '''A query that matches nothing doesn't exist'''
+    standin.session.collections['zonedata/devices'] = []
+    assert not standin.query().exists()
+
+
+def test_len(standin):
+    '''len() of a Response is the total we already know'''
+    standin.session.collections['zonedata/devices'] = devices(95)
+    results = standin.query().run()
+    assert len(results) == 95
+    assert len(standin.session.calls) == 1
@@ -0,0 +1,100 @@
+'''Tests around looking up device details by IP'''
+import threading
+
+import spectreapi
+from standin import StandInSession, make_response
+
+DEVICES = {'10.0.0.1': 1, '10.0.0.2': 2, '10.0.0.3': 3}
+CHILDREN = {'192.168.0.1': '10.0.0.1', '192.168.0.2': '10.0.0.1', '192.168.0.3': '10.0.0.2'}
+
+
+class DeviceSession(StandInSession):
+    '''A stand-in answering zonedata/devices filtered by address.ip, where
+    child IPs only turn up when asking for their ReferenceIp'''
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.macs = {}
+
+    def get(self, url, params=None, headers=None, **kargs):
+        params = dict(params or {})
+        with self.lock:
+            self.calls.append(('GET', url.split('/api/rest/', 1)[1], params))
+        ip_address = params['filter.address.ip']
+        if 'filter.device.associated' in params:
+            rows = [{'@class': 'device', 'referenceIp': CHILDREN[ip_address]}] if ip_address in CHILDREN else []
+        elif ip_address in DEVICES:
+            rows = [{'@class': 'device', 'id': DEVICES[ip_address], 'ip': ip_address,
+                     'mac': self.macs.get(ip_address)}]
+        else:
+            rows = []
+        return make_response({'@class': 'apiresponse', 'status': 'SUCCESS', 'total': len(rows), 'results': rows},
+                             url=url)
+
+
+def zone(standin):
+    standin.session = DeviceSession()
+    return spectreapi.Zone(2, 'Twilight', server=standin)
+
+
+def test_details_by_ips(standin):
+    '''Every distinct IP comes back once, children resolved through their reference IP'''
+    twilight = zone(standin)
+    ips = ['10.0.0.1', '192.168.0.1', '192.168.0.2', '10.0.0.3', '172.16.0.1', '10.0.0.1', '192.168.0.3']
+    found = dict(twilight.get_device_details_by_ips(ips, workers=4))
+    assert {ip: device and device['id'] for ip, device in found.items()} == {
+        '10.0.0.1': 1, '192.168.0.1': 1, '192.168.0.2': 1, '10.0.0.3': 3, '172.16.0.1': None, '192.168.0.3': 2}
+
+    details = [call[2]['filter.address.ip'] for call in standin.session.calls
+               if 'filter.device.associated' not in call[2]]
+    assert sorted(details) == sorted(['10.0.0.1', '10.0.0.2', '10.0.0.3',
+                                      '192.168.0.1', '192.168.0.2', '192.168.0.3', '172.16.0.1'])
+    assert twilight.reference_ips == {'192.168.0.1': '10.0.0.1', '192.168.0.2': '10.0.0.1',
+                                      '192.168.0.3': '10.0.0.2'}
+
+
+def test_reference_ips_cached(standin):
+    '''Children we've seen go straight to their reference IP'''
+    twilight = zone(standin)
+    assert twilight.get_device_details_by_ip('192.168.0.1').value()['id'] == 1
+    assert len(standin.session.calls) == 3
+
+    standin.session.calls = []
+    assert twilight.get_device_details_by_ip('192.168.0.1').value()['id'] == 1
+    assert [call[2]['filter.address.ip'] for call in standin.session.calls] == ['10.0.0.1']
+
+    standin.session.calls = []
+    assert dict(twilight.get_device_details_by_ips(['192.168.0.1']))['192.168.0.1']['id'] == 1
+    assert [call[2]['filter.address.ip'] for call in standin.session.calls] == ['10.0.0.1']
+
+
+def test_details_not_stale(standin):
+    '''Each call fetches the details afresh, only the reference IPs are remembered'''
+    twilight = zone(standin)
+    assert dict(twilight.get_device_details_by_ips(['10.0.0.1', '192.168.0.1']))['192.168.0.1']['mac'] is None
+
+    standin.session.calls = []
+    standin.session.macs['10.0.0.1'] = '00:11:22:33:44:55'
+    found = dict(twilight.get_device_details_by_ips(['10.0.0.1', '192.168.0.1']))
+    assert found['10.0.0.1']['mac'] == found['192.168.0.1']['mac'] == '00:11:22:33:44:55'
+    assert [call[2]['filter.address.ip'] for call in standin.session.calls] == ['10.0.0.1']
+
+
+def test_details_associated(standin):
+    '''Without the reference IP lookup, children are found as associated devices, as by get_device_details_by_ip'''
+    twilight = zone(standin)
+    single = twilight.get_device_details_by_ip('192.168.0.1', query_reference_ip=False).value()
+    found = dict(twilight.get_device_details_by_ips(['192.168.0.1', '172.16.0.1'], query_reference_ip=False))
+    assert found == {'192.168.0.1': single, '172.16.0.1': None}
+    assert twilight.reference_ips == {}
+
+
+def test_streams(standin):
+    '''Results come back as they complete, without waiting for the rest'''
+    twilight = zone(standin)
+    ips = [f'172.16.{i >> 8}.{i & 255}' for i in range(200)]
+    lookups = twilight.get_device_details_by_ips(ips, workers=2, query_reference_ip=False)
+    assert next(lookups)[1] is None
+    assert len(standin.session.calls) < 20, "Only a window of lookups is in flight"
+    lookups.close()
@@ -0,0 +1,56 @@
+'''Tests around exporting query results to disk'''
+import csv
+import json
+
+import spectreapi
+from standin import devices
+
+
+def test_export_ndjson(standin, tmp_path):
+    '''NDJSON export should write one result per line'''
+    rows = devices(25)
+    standin.session.collections['zonedata/devices'] = rows
+    path = tmp_path / 'devices.ndjson'
+    stats = standin.query().export(str(path))
+    assert stats.rows == 25
+    assert stats.bytes == path.stat().st_size
+    assert [json.loads(line) for line in path.read_text().splitlines()] == rows
+
+
+def test_export_raw(standin, tmp_path):
+    '''Raw export should give the same rows without decoding them'''
+    rows = devices(25)
+    rows[0]['attributes'] = [{'name': 'sysDescr', 'value': 'has a , and a ] and a "quote"'}]
+    standin.session.collections['zonedata/devices'] = rows
+    path = tmp_path / 'devices.ndjson'
+    stats = standin.query().export(str(path), raw=True)
+    assert stats.rows == 25
+    assert [json.loads(line) for line in path.read_text().splitlines()] == rows
+
+
+def test_export_csv(standin, tmp_path):
+    '''CSV export should write the fields asked for'''
+    standin.session.collections['zonedata/devices'] = devices(25)
+    path = tmp_path / 'devices.csv'
+    stats = standin.query().export(str(path), format='csv', fields=['id', 'ip', 'zone.id'])
+    with open(path, newline='') as f:
+        lines = list(csv.reader(f))
+    assert stats.rows == 25
+    assert lines[0] == ['id', 'ip', 'zone.id']
+    assert lines[1] == ['1', '10.0.0.1', '']
+
+
+def test_raw_results_strings():
+    '''Raw splitting should cope with results that aren't objects'''
+    total, elements = spectreapi.raw_results(b'{"total" : 2, "results" : [ "10.0.0.0/8",\n  "::/0" ]}')
+    assert total == 2
+    assert elements == [b'"10.0.0.0/8"', b'"::/0"']
+
+
+def test_export_requests(standin, tmp_path):
+    '''Each export asks for every page exactly once'''
+    standin.session.collections['zonedata/devices'] = devices(25)
+    for kargs in ({}, {'raw': True}, {'format': 'csv'}):
+        standin.session.calls = []
+        assert standin.query().export(str(tmp_path / 'devices'), **kargs).rows == 25
+        assert [int(params['query.page']) for _, _, params in standin.session.calls] == [0, 1, 2]
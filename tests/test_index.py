@@ -0,0 +1,51 @@
+'''Tests around the local device index'''
+import spectreapi
+from standin import devices
+
+
+def test_lookups(standin):
+    '''Point lookups and CIDR scans match a linear search'''
+    standin.session.collections['zonedata/devices'] = devices(2000)
+    index = standin.query().run().to_index(['id', 'ip'])
+    assert len(index) == 2000
+
+    assert index.get('10.0.1.44') == {'id': 300, 'ip': '10.0.1.44'}
+    assert index.get('10.0.200.1') is None
+    assert '10.0.0.1' in index
+    assert 'not an ip' not in index
+
+    inside = [d['id'] for d in index.within('10.0.2.0/23')]
+    assert inside == [d['id'] for d in devices(2000) if d['ip'].startswith(('10.0.2.', '10.0.3.'))]
+    assert list(index.within('2001:db8::/32')) == []
+
+
+def test_update(standin):
+    '''Later results are upserted by id'''
+    index = spectreapi.DeviceIndex(devices(100))
+    index.update([{'id': 5, 'ip': '10.9.9.9'}, {'id': 1000, 'ip': '2001:db8::1'}, {'id': 6, 'ip': None}])
+    assert len(index) == 101
+    assert index.get('10.0.0.5') is None
+    assert index.get('10.9.9.9')['id'] == 5
+    assert index.get('2001:db8::1')['id'] == 1000
+    assert index.get('10.0.0.6') is None
+    assert [d['id'] for d in index.within('10.0.0.0/28')] == [1, 2, 3, 4, 7, 8, 9, 10, 11, 12, 13, 14, 15]
+
+    assert index.remove([7, 8, 99999]) == 2
+    assert [d['id'] for d in index.within('10.0.0.0/29')] == [1, 2, 3, 4]
+
+    for i in range(20, 30):  # Few enough to insert one at a time
+        index.update([{'id': i, 'ip': f'10.1.0.{i}'}])
+    assert [d['id'] for d in index.within('10.1.0.0/24')] == list(range(20, 30))
+    assert [d['id'] for d in index.within('10.0.0.16/28')] == list(range(16, 20)) + list(range(30, 32))
+
+
+def test_longest_prefix():
+    '''The most specific network wins'''
+    index = spectreapi.DeviceIndex()
+    index.add_networks(['10.0.0.0/8', '10.20.0.0/14', '2001:db8::/32'])
+    index.add_networks(['10.20.1.0/24'], value='lab')
+    assert index.longest_prefix('10.20.1.7') == 'lab'
+    assert index.longest_prefix('10.21.0.1') == '10.20.0.0/14'
+    assert index.longest_prefix('10.99.0.1') == '10.0.0.0/8'
+    assert index.longest_prefix('192.168.0.1') is None
+    assert index.longest_prefix('2001:db8:1::5') == '2001:db8::/32'
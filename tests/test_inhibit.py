@@ -0,0 +1,76 @@
+'''Tests around the collector inhibit scheduler'''
+import re
+import time
+
+import spectreapi
+from standin import StandInSession, make_response
+
+PROPERTY = re.compile(r'zone/collector/(\d+)/property/(get|set)/inhibited$')
+
+
+class PropertySession(StandInSession):
+    '''A stand-in that keeps each collector's inhibited property'''
+
+    def __init__(self, count):
+        super().__init__({'zone/collector': [{'@class': 'collector', 'id': i, 'uuid': f'uuid-{i}',
+                                               'name': f'Collector-{i}', 'zone': {'id': 2, 'name': 'Twilight'}}
+                                              for i in range(1, count + 1)]})
+        self.inhibited = {i: 'false' for i in range(1, count + 1)}
+
+    def get(self, url, params=None, headers=None, **kargs):
+        match = PROPERTY.search(url)
+        if match is None:
+            return super().get(url, params=params, headers=headers, **kargs)
+        id_num, verb = int(match.group(1)), match.group(2)
+        self.calls.append((verb, id_num, dict(params or {})))
+        if verb == 'set':
+            self.inhibited[id_num] = params['value']
+        return make_response({'@class': 'apiresponse', 'status': 'SUCCESS', 'result': self.inhibited[id_num]},
+                             url=url)
+
+
+def odd(t, collector):
+    return collector.id_num % 2 == 1
+
+
+def test_only_changes_set(standin):
+    '''Everything is read, only the collectors that need it are set'''
+    standin.session = PropertySession(20)
+    standin.session.inhibited[1] = 'true'
+    standin.session.inhibited[2] = 'true'
+    scheduler = spectreapi.InhibitScheduler(standin, odd, workers=4)
+    changed = scheduler.tick()
+
+    expected = {f'Collector-{i}': 'true' for i in range(3, 21, 2)}
+    expected['Collector-2'] = 'false'
+    assert changed == expected
+    assert standin.session.inhibited == {i: 'true' if i % 2 else 'false' for i in range(1, 21)}
+    verbs = [call[0] for call in standin.session.calls]
+    assert verbs.count('get') == 20
+    assert verbs.count('set') == 10
+    assert not scheduler.errors
+
+    standin.session.calls = []
+    assert scheduler.tick() == {}
+    assert [call[0] for call in standin.session.calls] == ['get'] * 20, "The collector list is kept between ticks"
+
+
+def test_server_workers(standin):
+    '''initiate_collector_inhibits(workers=) uses the scheduler'''
+    standin.session = PropertySession(6)
+    standin.initiate_collector_inhibits(lambda t, c: c.id_num <= 2, workers=3)
+    assert standin.session.inhibited == {1: 'true', 2: 'true', 3: 'false', 4: 'false', 5: 'false', 6: 'false'}
+    assert len([call for call in standin.session.calls if call[0] == 'set']) == 2
+
+
+def test_daemon(standin):
+    '''The daemon ticks until stopped'''
+    standin.session = PropertySession(3)
+    scheduler = spectreapi.InhibitScheduler(standin, odd, workers=2, interval=0.01)
+    scheduler.start()
+    deadline = time.monotonic() + 5
+    while scheduler.ticks < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    scheduler.stop()
+    assert standin.session.inhibited == {1: 'true', 2: 'false', 3: 'true'}
+    assert len([call for call in standin.session.calls if call[1] == 'zone/collector']) == 1
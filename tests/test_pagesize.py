@@ -0,0 +1,66 @@
+'''Tests around adaptive page sizing'''
+import spectreapi
+from standin import devices
+
+
+class ScriptedSizer(spectreapi.AdaptivePageSize):
+    '''An AdaptivePageSize that changes its mind on every page'''
+
+    def __init__(self, sizes):
+        super().__init__(min_size=4, max_size=64)
+        self.sizes = list(sizes)
+
+    def size_for(self, api):
+        return self.sizes.pop(0) if self.sizes else 64
+
+    def observe(self, api, size, rows, seconds, nbytes):
+        pass
+
+
+def test_sizes_snap_to_bounds():
+    '''Sizes should always be min_size * 2**n within bounds'''
+    sizer = spectreapi.AdaptivePageSize(min_size=50, max_size=5000, target_seconds=1, initial=500)
+    assert sizer.size_for('zone') == 400
+    sizer.observe('zone', 400, 400, 0.01, 4000)
+    assert sizer.size_for('zone') == 800, "Fast pages should grow, but only by doubling"
+    sizer.observe('zonedata/devices', 400, 400, 20.0, 4000)
+    assert sizer.size_for('zonedata/devices') == 50, "Slow pages should back off straight away"
+    assert sizer.size_for('zone') == 800, "Each API path is sized on its own"
+
+
+def test_target_bytes():
+    '''A byte budget should cap the page size too'''
+    sizer = spectreapi.AdaptivePageSize(min_size=10, max_size=10000, target_seconds=10,
+                                        target_bytes=100000, initial=160)
+    sizer.observe('zonedata/devices', 160, 160, 0.1, 160 * 5000)
+    assert sizer.size_for('zonedata/devices') == 20
+
+
+def test_size_changes_mid_iteration(standin):
+    '''Changing the page size part way through shouldn't skip or repeat rows'''
+    standin.session.collections['zonedata/devices'] = devices(150)
+    standin.page_sizer = ScriptedSizer([8, 32, 4, 16, 64, 8])
+    results = standin.get('zonedata/devices')
+    assert [d['id'] for d in results] == list(range(1, 151))
+    for _, _, params in standin.session.calls:
+        assert params['query.page'] * params['query.pagesize'] % 4 == 0
+
+
+def test_short_pages_ignored():
+    '''The short last page of a query doesn't undo what the earlier pages taught us'''
+    sizer = spectreapi.AdaptivePageSize(min_size=50, max_size=1600, target_seconds=2, initial=800)
+
+    def run(total):
+        sizes = []
+        offset = 0
+        while offset < total:
+            size = sizer.size_for('zonedata/devices')
+            rows = min(size, total - offset)
+            sizer.observe('zonedata/devices', size, rows, 0.2, rows * 100)  # all latency
+            sizes.append(size)
+            offset += size
+        return sizes
+
+    assert run(1605) == [800, 1600]
+    assert run(1605) == [1600, 1600]
+    assert sizer.size_for('zonedata/devices') == 1600
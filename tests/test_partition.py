@@ -0,0 +1,120 @@
+'''Tests around running a query partitioned by zone or address range'''
+import ipaddress
+
+import pytest
+import spectreapi
+from standin import StandInSession, devices, make_response
+
+ZONES = [{'@class': 'zone', 'id': 1, 'name': 'Zone1'}, {'@class': 'zone', 'id': 2, 'name': 'Twilight'},
+         {'@class': 'zone', 'id': 3, 'name': 'Empty'}]
+
+
+class FilteringSession(StandInSession):
+    '''A stand-in that filters devices on zone.id and (if <cidrs>) address.cidr'''
+
+    def __init__(self, rows, cidrs=True):
+        super().__init__({'zone': ZONES})
+        self.rows = rows
+        self.cidrs = cidrs
+
+    def get(self, url, params=None, headers=None, **kargs):
+        api = url.split('/api/rest/', 1)[1]
+        if api != 'zonedata/devices':
+            return super().get(url, params=params, headers=headers, **kargs)
+        params = dict(params or {})
+        self.calls.append(('GET', api, params))
+        fault = self._fault(url)
+        if fault is not None:
+            return fault
+        rows = self.rows
+        if 'filter.zone.id' in params:
+            rows = [row for row in rows if row['zone']['id'] == params['filter.zone.id']]
+        if self.cidrs and 'filter.address.cidr' in params:
+            network = ipaddress.ip_network(params['filter.address.cidr'])
+            rows = [row for row in rows if ipaddress.ip_address(row['ip']) in network]
+        size = int(params['query.pagesize'])
+        page = int(params.get('query.page', 0))
+        return make_response({'@class': 'apiresponse', 'status': 'SUCCESS', 'total': len(rows),
+                              'results': rows[page * size:(page + 1) * size]}, url=url)
+
+
+def zoned(count):
+    rows = devices(count)
+    for row in rows:
+        row['zone'] = {'id': 1 if row['id'] % 3 else 2}
+    return rows
+
+
+def test_by_zone(standin):
+    '''Every row comes back once, with progress for each zone'''
+    standin.session = FilteringSession(zoned(95))
+    seen = []
+    results = standin.query().detail('Attributes').run_partitioned(by='zone', workers=3,
+                                                                     progress=lambda p: seen.append(p.name))
+    assert sorted(d['id'] for d in results) == list(range(1, 96))
+    assert [(p.name, p.rows, p.total, p.done) for p in results.partitions] == \
+        [('Zone1', 64, 64, True), ('Twilight', 31, 31, True), ('Empty', 0, 0, True)]
+    assert results.rows == results.total == 95
+    assert seen.count('Zone1') == 8, "7 pages and done"
+    pages = [call[2] for call in standin.session.calls if call[1] == 'zonedata/devices']
+    assert max(int(params['query.page']) for params in pages) == 6, "No page deeper than the biggest partition"
+    assert all(params['detail.Attributes'] for params in pages)
+
+
+def test_by_zone_filtered(standin):
+    '''A query for one zone only runs that zone'''
+    standin.session = FilteringSession(zoned(30))
+    results = standin.query().filter('zone.id', 2).run_partitioned(by='zone')
+    assert [p.name for p in results.partitions] == ['Twilight']
+    assert len(list(results)) == 10
+
+
+def test_by_cidr(standin):
+    '''CIDR partitions must be disjoint, and rows outside them are dropped even if the server sends them'''
+    rows = zoned(600)
+    for cidrs in (True, False):
+        standin.session = FilteringSession(rows, cidrs=cidrs)
+        results = standin.query().fields('id').run_partitioned(by=['10.0.0.0/24', '10.0.1.0/25'], workers=2)
+        assert sorted(d['id'] for d in results) == list(range(1, 256)) + list(range(256, 384))
+        assert all(list(d) == ['id'] for d in list(results)[:5])
+        assert results.rows == 383, "Running again starts the count again"
+
+    with pytest.raises(spectreapi.InvalidArgument):
+        standin.query().run_partitioned(by=['10.0.0.0/8', '10.1.0.0/16'])
+    with pytest.raises(spectreapi.InvalidArgument):
+        standin.query().run_partitioned(by='collector')
+
+
+def test_errors(standin):
+    '''A failing partition fails the whole run'''
+    standin.session = FilteringSession(zoned(30))
+    standin.retry = spectreapi.RetryPolicy(attempts=1)
+    results = standin.query().run_partitioned(by='zone', workers=3)
+    standin.session.faults = [500]
+    with pytest.raises(spectreapi.APIException):
+        list(results)
+
+
+def test_abandoned(standin):
+    '''Stopping part way through doesn't leave the workers stuck'''
+    standin.session = FilteringSession(zoned(300))
+    rows = iter(standin.query().run_partitioned(by='zone', workers=2))
+    next(rows)
+    rows.close()
+
+
+def test_abandoned_stops_queued(standin):
+    '''Partitions that hadn't started by the time we stop are never fetched'''
+    zones = [{'@class': 'zone', 'id': i, 'name': f'Zone{i}'} for i in range(1, 31)]
+    rows = devices(300)
+    for row in rows:
+        row['zone'] = {'id': row['id'] % 30 + 1}
+    standin.session = FilteringSession(rows)
+    standin.session.collections['zone'] = zones
+    results = standin.query().run_partitioned(by='zone', workers=2)
+    standin.session.calls = []
+    rows = iter(results)
+    next(rows)
+    rows.close()
+    assert len(standin.session.calls) < 12, "Only the partitions that had started or fit in the queue ran"
+    assert not all(partition.done for partition in results.partitions)
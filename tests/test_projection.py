@@ -0,0 +1,47 @@
+'''Tests around detail presets and field projection'''
+import pytest
+import spectreapi
+from standin import devices
+
+
+def nested(count):
+    rows = devices(count)
+    for row in rows:
+        row['zone'] = {'id': 2, 'name': 'Twilight'}
+    return rows
+
+
+def test_preset(standin):
+    '''A preset replaces whatever details were asked for'''
+    query = standin.query().filter('zone.id', 2).detail('Attributes').preset('network')
+    assert {name for name in query.params if name.startswith('detail.')} == \
+        {'detail.' + detail for detail in spectreapi.DETAIL_PRESETS['network']}
+    assert query.params['filter.zone.id'] == 2
+    assert not [name for name in query.preset('minimal').params if name.startswith('detail.')]
+    with pytest.raises(spectreapi.InvalidArgument):
+        query.preset('everything')
+
+
+def test_fields(standin):
+    '''Results are cut down as they're decoded, streamed, spooled or fanned out'''
+    standin.session.collections['zonedata/devices'] = nested(25)
+    query = standin.query().fields('id', 'ip', 'zone.id', 'missing')
+    expected = [{'id': d['id'], 'ip': d['ip'], 'zone': {'id': 2}} for d in nested(25)]
+
+    response = query.run()
+    assert list(response) == expected
+    assert response.values() == expected[:10], "The page we hold is projected too"
+    assert list(query.run(stream=True)) == expected
+    spooled = query.run(spool=True)
+    assert list(spooled) == expected
+    assert list(spooled) == expected
+    assert sorted(query.run_parallel(workers=3, ordered=False), key=lambda d: d['id']) == expected
+    assert list(standin.query().run())[0]['mac'], "Other queries get everything"
+
+
+def test_details_params():
+    '''get_device_details_by_ip asks for the full preset'''
+    params = spectreapi.Zone(2, 'Twilight')._device_details_params('10.0.0.1')
+    assert params['filter.address.ip'] == '10.0.0.1'
+    assert {name for name in params if name.startswith('detail.')} == \
+        {'detail.' + detail for detail in spectreapi.DETAIL_PRESETS['full']}
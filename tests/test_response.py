@@ -0,0 +1,138 @@
+'''Tests around Response paging and its page buffer'''
+import spectreapi
+from standin import devices
+
+
+def test_iterates_all_pages(standin):
+    '''Every row should come back once, in order, across page boundaries'''
+    standin.session.collections['zonedata/devices'] = devices(25)
+    results = standin.get('zonedata/devices')
+    assert results.total == 25
+    assert [d['id'] for d in results] == list(range(1, 26))
+
+
+def test_page_buffer_shared(standin):
+    '''values(), value() and result should all come from the decoded page'''
+    standin.session.collections['zone'] = devices(3)
+    results = standin.get('zone')
+    assert results.values() is results.values()
+    assert results.value() == results.result == results.values()[0]
+    assert results.results.ok
+    assert results.results.content is None, "The raw body should be released once decoded"
+
+
+def test_query_shrinks(standin):
+    '''If the result set shrinks underneath us we should just stop'''
+    rows = devices(25)
+    standin.session.collections['zonedata/devices'] = lambda: rows
+    results = standin.get('zonedata/devices')
+    del rows[15:]
+    assert len(list(results)) == 15
+
+
+def test_prefetch_keeps_order(standin):
+    '''Prefetching pages in the background shouldn't change what we get back'''
+    standin.session.collections['zonedata/devices'] = devices(95)
+    results = standin.get('zonedata/devices', prefetch=3)
+    assert [d['id'] for d in results] == list(range(1, 96))
+    assert [d['id'] for d in results] == list(range(1, 96)), "A second pass should match too"
+
+
+def test_prefetch_query_shrinks(standin):
+    '''Prefetched pages still have to cope with the query shrinking'''
+    rows = devices(45)
+    standin.session.collections['zonedata/devices'] = lambda: rows
+    results = standin.get('zonedata/devices', prefetch=2)
+    del rows[12:]
+    assert [d['id'] for d in results] == list(range(1, 13))
+
+
+def test_fan_out_ordered(standin):
+    '''Fetching pages concurrently should still give us rows in order'''
+    standin.session.collections['zonedata/devices'] = devices(103)
+    rows = list(standin.get_parallel('zonedata/devices', workers=4))
+    assert [d['id'] for d in rows] == list(range(1, 104))
+
+
+def test_fan_out_unordered(standin):
+    '''Unordered fan out should give us every row exactly once'''
+    standin.session.collections['zonedata/devices'] = devices(103)
+    rows = list(standin.query().run_parallel(workers=4, ordered=False))
+    assert sorted(d['id'] for d in rows) == list(range(1, 104))
+    pages = [call[2]['query.page'] for call in standin.session.calls]
+    assert sorted(pages) == list(range(11)), "Each page should be fetched once"
+
+
+def test_rewind_is_lazy(standin):
+    '''Running off the end of the results shouldn't go back to the server'''
+    standin.session.collections['zonedata/devices'] = devices(25)
+    results = standin.get('zonedata/devices')
+    assert len(list(results)) == 25
+    assert len(standin.session.calls) == 3, "One request per page and no more"
+    assert len(list(results)) == 25
+    assert len(standin.session.calls) == 5, "Iterating again fetches pages 1 and 2 again"
+    assert results.result['id'] == 1
+    assert len(standin.session.calls) == 5, "We're still holding page 0"
+    results.rewind()
+    assert len(standin.session.calls) == 5
+
+
+def test_rewind_reuses_single_page(standin):
+    '''A result that fits in one page should never need fetching again'''
+    standin.session.collections['zone'] = devices(4)
+    results = standin.get('zone')
+    for _ in range(3):
+        assert len(list(results)) == 4
+    assert results.result['id'] == 1
+    assert len(standin.session.calls) == 1
+
+
+def test_independent_iterators(standin):
+    '''Two loops over the same Response shouldn't interfere with each other'''
+    standin.session.collections['zonedata/devices'] = devices(25)
+    results = standin.get('zonedata/devices')
+    pairs = [(a['id'], b['id']) for a in results for b in results]
+    assert len(pairs) == 25 * 25
+    assert pairs[26] == (2, 2)
+
+
+def test_spool(standin):
+    '''A spooled Response shouldn't go back to the server on a second pass'''
+    standin.session.collections['zonedata/devices'] = devices(25)
+    results = standin.get('zonedata/devices', spool=True)
+    first = list(results)
+    calls = len(standin.session.calls)
+    assert list(results) == first
+    assert len(standin.session.calls) == calls
+    assert results.spool.hits == 2
+
+
+def test_shared_spool(standin):
+    '''Two queries sharing a spool each get their own pages back'''
+    standin.session.collections['zonedata/devices'] = devices(25)
+    standin.session.collections['zone'] = devices(25, start=1001)
+    spool = spectreapi.PageSpool()
+    devices_results = standin.get('zonedata/devices', spool=spool)
+    assert [d['id'] for d in devices_results] == list(range(1, 26))
+    zone_results = standin.get('zone', spool=spool)
+    assert [d['id'] for d in zone_results] == list(range(1001, 1026))
+    filtered = standin.get('zonedata/devices', {'filter.zone.id': 2}, spool=spool)
+    assert len(list(filtered)) == 25
+    calls = len(standin.session.calls)
+    assert [d['id'] for d in devices_results] == list(range(1, 26))
+    assert [d['id'] for d in zone_results] == list(range(1001, 1026))
+    assert len(standin.session.calls) == calls
+    assert len(spool) == 9
+
+
+def test_spool_eviction(standin, tmp_path):
+    '''Pages should be evicted once the spool is over budget'''
+    spool = spectreapi.PageSpool(max_bytes=3000, path=str(tmp_path))
+    for page in range(10):
+        spool.put(page, bytes([page]) * 1000)
+    assert len(spool) == 3 and spool.size == 3000
+    assert spool.get(0) is None
+    assert spool.get(9) == bytes([9]) * 1000
+    spool.put(10, b'x' * 1000)
+    assert 9 in spool and 7 not in spool, "The least recently used page goes first"
+    spool.close()
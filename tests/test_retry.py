@@ -0,0 +1,105 @@
+'''Tests around retrying requests and the circuit breaker'''
+import pytest
+import requests
+import spectreapi
+from standin import devices
+
+
+@pytest.fixture()
+def quick(standin):
+    '''The stand-in server, retrying without waiting around'''
+    standin.retry = spectreapi.RetryPolicy(attempts=3, backoff=0)
+    return standin
+
+
+def test_get_retried(quick):
+    '''A transient failure on a page is retried and the pass carries on'''
+    quick.session.collections['zonedata/devices'] = devices(25)
+    quick.session.faults = [502, requests.ConnectionError('reset')]
+    assert [d['id'] for d in quick.query().run()] == list(range(1, 26))
+    assert quick.breaker.state == 'closed'
+
+
+def test_get_gives_up(quick):
+    '''We only try <attempts> times'''
+    quick.session.collections['zonedata/devices'] = devices(5)
+    quick.session.faults = [503, 503, 503]
+    with pytest.raises(spectreapi.APIException):
+        quick.query().run()
+    assert len(quick.session.calls) == 3
+
+
+def test_not_transient(quick):
+    '''A 400 isn't going to get better by asking again'''
+    quick.session.collections['zonedata/devices'] = devices(5)
+    quick.session.faults = [400]
+    with pytest.raises(spectreapi.APIException):
+        quick.query().run()
+    assert len(quick.session.calls) == 1
+
+
+def test_put_opt_in(quick):
+    '''PUT and POST aren't retried unless asked'''
+    quick.session.faults = [502]
+    with pytest.raises(spectreapi.APIException):
+        quick.put('publish/device/uuid', data='{}')
+
+    quick.session.faults = [502]
+    quick.put('publish/device/uuid', data='{}', retry=True)
+
+    quick.retry = spectreapi.RetryPolicy(attempts=3, backoff=0, methods=('GET', 'PUT'))
+    quick.session.faults = [(429, {'Retry-After': '0'})]
+    quick.put('publish/device/uuid', data='{}')
+    assert [method for method, _, _ in quick.session.calls] == ['PUT'] * 5
+
+
+def test_delay():
+    '''Backoff doubles up to the cap, jitter stays under it and Retry-After wins (up to the cap too)'''
+    policy = spectreapi.RetryPolicy(backoff=1, max_backoff=5, jitter=False)
+    assert [policy.delay(n) for n in range(5)] == [1, 2, 4, 5, 5]
+    assert policy.delay(0, retry_after='3') == 3
+    assert policy.delay(0, retry_after='7') == 5
+    assert policy.delay(0, retry_after='inf') == 5
+    assert policy.delay(2, retry_after='nan') == 4
+    assert policy.delay(0, retry_after='Wed, 21 Oct 2015 07:28:00 GMT') == 0
+    jittery = spectreapi.RetryPolicy(backoff=1, max_backoff=5)
+    assert all(0 <= jittery.delay(n) <= 5 for n in range(10))
+
+
+def test_circuit_breaker(standin):
+    '''After enough failures in a row we stop asking, then try again once the timeout passes'''
+    standin.retry = False
+    standin.breaker = spectreapi.CircuitBreaker(threshold=2, reset_seconds=60)
+    standin.session.collections['zone'] = devices(1)
+    standin.session.faults = [503, 503]
+    for _ in range(2):
+        with pytest.raises(spectreapi.APIException):
+            standin.getpage('zone')
+    assert standin.breaker.state == 'open'
+    with pytest.raises(spectreapi.CircuitOpenException):
+        standin.getpage('zone')
+    assert len(standin.session.calls) == 2
+
+    standin.breaker.opened_at -= 60
+    assert standin.breaker.state == 'half-open'
+    standin.getpage('zone')
+    assert standin.breaker.state == 'closed'
+
+
+def test_circuit_breaker_trial_fails(standin):
+    '''A half-open trial failing with any exception opens the circuit again rather than wedging it'''
+    standin.retry = False
+    standin.breaker = spectreapi.CircuitBreaker(threshold=1, reset_seconds=60)
+    standin.session.collections['zone'] = devices(1)
+    standin.session.faults = [503, requests.exceptions.ChunkedEncodingError('cut off')]
+    with pytest.raises(spectreapi.APIException):
+        standin.getpage('zone')
+
+    standin.breaker.opened_at -= 60
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        standin.getpage('zone')
+    assert standin.breaker.state == 'open'
+
+    standin.breaker.opened_at -= 60
+    standin.getpage('zone')
+    assert standin.breaker.state == 'closed'
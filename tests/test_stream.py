@@ -0,0 +1,69 @@
+'''Tests around incrementally decoding pages with PageStream'''
+import json
+
+import spectreapi
+from standin import devices, make_response
+
+
+class ChunkedResponse:
+    '''Feeds a body to PageStream a few bytes at a time'''
+
+    def __init__(self, body, chunk=7):
+        self.body = body
+        self.chunk = chunk
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), self.chunk):
+            yield self.body[i:i + self.chunk]
+
+    def close(self):
+        self.closed = True
+
+
+def test_pagestream_matches_json():
+    '''Streaming a page in tiny chunks should decode the same as json.loads'''
+    page = {'@class': 'apiresponse', 'status': 'SUCCESS', 'total': 12345,
+            'results': devices(20) + [{'name': 'café ☃', 'n': [1, 2.5, None, True]}],
+            'method': 'ZoneData.getDevices'}
+    body = json.dumps(page, indent=2).encode('utf-8')
+    results = ChunkedResponse(body)
+    stream = spectreapi.PageStream(results)
+    assert stream.header['total'] == 12345, "Members before results should be read up front"
+    assert list(stream) == page['results']
+    assert stream.header['method'] == 'ZoneData.getDevices'
+    assert results.closed
+
+
+def test_pagestream_no_results():
+    '''A page without results should just be empty'''
+    stream = spectreapi.PageStream(make_response({'status': 'SUCCESS', 'result': 'true'}))
+    assert list(stream) == []
+    assert stream.header['result'] == 'true'
+
+
+def test_streamed_response(standin):
+    '''Iterating a streamed Response should match the buffered one'''
+    standin.session.collections['zonedata/devices'] = devices(25)
+    results = standin.query().run(stream=True)
+    assert results.total == 25
+    assert [d['id'] for d in results] == list(range(1, 26))
+    assert results.result['id'] == 1, "We should be rewound to page 0"
+
+
+def test_streamed_page_zero_once(standin):
+    '''The first pass over a streamed Response reads the page 0 we opened for the total'''
+    standin.session.collections['zonedata/devices'] = devices(25)
+    results = standin.get('zonedata/devices', stream=True)
+    assert [d['id'] for d in results] == list(range(1, 26))
+    assert [int(params['query.page']) for _, _, params in standin.session.calls] == [0, 1, 2]
+    assert [d['id'] for d in results] == list(range(1, 26))
+    assert len(standin.session.calls) == 6, "Another pass has to stream everything again"
+
+
+def test_streamed_response_with_prefetch(standin):
+    '''Streamed pages can be prefetched too'''
+    standin.session.collections['zonedata/devices'] = devices(37)
+    results = standin.get('zonedata/devices', prefetch=2, stream=True)
+    assert [d['id'] for d in results] == list(range(1, 38))
+    assert [d['id'] for d in results.fan_out(workers=3)] == list(range(1, 38))
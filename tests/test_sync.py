@@ -0,0 +1,108 @@
+'''Tests around the incremental SQLite device sync'''
+import spectreapi
+from standin import StandInSession, devices
+
+SINCE = 'filter.' + spectreapi.SINCE_FILTER
+
+
+class SinceSession(StandInSession):
+    '''A stand-in that honours the "observed since" filter (if <honour>)'''
+
+    def __init__(self, rows, honour=True):
+        super().__init__({'zonedata/devices': lambda: self.filtered()})
+        self.rows = rows
+        self.honour = honour
+        self.since = None
+
+    def get(self, url, params=None, headers=None, **kargs):
+        self.since = (params or {}).get(SINCE) if self.honour else None
+        return super().get(url, params=params, headers=headers, **kargs)
+
+    def filtered(self):
+        if self.since is None:
+            return self.rows
+        return [row for row in self.rows if max(row['lastObserved'], row['created']) >= self.since]
+
+
+def stamped(count):
+    '''Device rows each created when first observed (so they all have different stamps)'''
+    rows = devices(count)
+    for row in rows:
+        row['created'] = row['firstObserved']
+    return rows
+
+
+def synced(standin, tmp_path, rows, honour=True):
+    standin.session = SinceSession(rows, honour)
+    zone = spectreapi.Zone(2, 'Twilight', server=standin)
+    return spectreapi.DeviceSync(zone, str(tmp_path / 'devices.db'))
+
+
+def touch(row, when):
+    row = dict(row)
+    row['lastObserved'] = when
+    row['mac'] = 'aa:bb:cc:dd:ee:ff'
+    return row
+
+
+def test_baseline_then_incremental(standin, tmp_path):
+    '''Only what's new since the watermark is fetched'''
+    rows = stamped(50)
+    with synced(standin, tmp_path, rows) as sync:
+        changes = sync.sync()
+        assert changes.full and len(changes.added) == 50 and not changes.updated and not changes.gone
+        assert len(sync) == 50
+        assert sync.watermark == 1524244323050
+
+        changes = sync.sync()
+        assert not changes
+        assert changes.fetched == 1, "Just the device at the watermark"
+        assert len(standin.session.calls) == 7, "5 pages, then one incremental page and a count"
+
+        newest = sync.watermark + 1000
+        rows[3] = touch(rows[3], newest)
+        rows.append(touch(dict(rows[0], id=100, ip='10.0.0.100'), newest))
+        changes = sync.sync()
+        assert [d['id'] for d in changes.added] == [100]
+        assert [d['id'] for d in changes.updated] == [4]
+        assert changes.fetched == 3, "Those two and the device at the old watermark"
+        assert sync.watermark == newest
+        assert sync.device(4)['mac'] == 'aa:bb:cc:dd:ee:ff'
+        assert [d['id'] for d in sync.get('10.0.0.100')] == [100]
+        assert [d['id'] for d in sync.devices('id BETWEEN ? AND ?', [10, 12])] == [10, 11, 12]
+
+
+def test_gone(standin, tmp_path):
+    '''Devices that disappear are found (with an id listing only when the count drops)'''
+    rows = stamped(30)
+    with synced(standin, tmp_path, rows) as sync:
+        sync.sync()
+        del rows[5]
+        del rows[20]
+        standin.session.calls = []
+        changes = sync.sync()
+        assert changes.gone == [6, 22]
+        assert len(sync) == 28
+        assert sync.device(6) is None
+        assert not sync.sync().gone
+
+
+def test_server_ignores_filter(standin, tmp_path):
+    '''Without the server filtering we fetch everything but only report real changes'''
+    rows = stamped(20)
+    with synced(standin, tmp_path, rows, honour=False) as sync:
+        sync.sync()
+        rows[0] = touch(rows[0], sync.watermark + 1)
+        changes = sync.sync()
+        assert changes.fetched == 20
+        assert [d['id'] for d in changes.updated] == [1]
+        assert not changes.added and not changes.gone
+
+
+def test_snapshot_persists(standin, tmp_path):
+    '''A later DeviceSync on the same file carries on from the watermark'''
+    rows = stamped(10)
+    synced(standin, tmp_path, rows).sync()
+    sync = synced(standin, tmp_path, rows)
+    assert len(sync) == 10
+    assert not sync.sync().full
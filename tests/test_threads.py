@@ -0,0 +1,77 @@
+'''Tests around sharing one Server between threads'''
+from concurrent.futures import ThreadPoolExecutor
+
+import spectreapi
+from standin import StandInSession, devices
+
+
+def test_per_thread_sessions():
+    '''A thread_safe Server hands each thread its own session, all sharing auth and the pool'''
+    server = spectreapi.Server('standin', thread_safe=True, max_connections=32)
+    server.headers['Authorization'] = 'Bearer key'
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        sessions = list(executor.map(lambda _: server.session, range(4)))
+        sessions = {id(session): session for session in sessions}.values()
+
+    assert server.session is server.session
+    assert server.session not in sessions
+    for session in sessions:
+        assert session.headers['Authorization'] == 'Bearer key'
+        assert session.cookies is server.cookies
+        assert session.adapters['https://'] is server._adapter
+    assert server._adapter._pool_maxsize == 32
+
+
+def test_shared_session():
+    '''Without thread_safe every thread talks through the one session'''
+    server = spectreapi.Server('standin')
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        sessions = set(executor.map(lambda _: id(server.session), range(4)))
+    assert sessions == {id(server.session)}
+
+
+def test_size_pool():
+    '''Growing the pool reaches sessions that already exist'''
+    server = spectreapi.Server('standin', max_connections=4)
+    session = server.session
+    server.size_pool(16)
+    assert server.session is session
+    assert session.adapters['https://']._pool_maxsize == 16
+
+
+def test_size_pool_closes_old():
+    '''The pool we've grown out of is closed, not left holding its sockets'''
+    server = spectreapi.Server('standin', max_connections=4)
+    old = server._adapter
+    old.poolmanager.connection_from_url('https://standin/')
+    assert old.poolmanager.pools
+    server.size_pool(16)
+    assert not old.poolmanager.pools
+
+
+def test_helpers_go_thread_safe(standin):
+    '''Fetching pages on worker threads switches to per-thread sessions, leaving ours as it was'''
+    session = standin.session
+    session.collections['zonedata/devices'] = devices(50)
+    made = []
+
+    def new_session():
+        made.append(StandInSession(session.collections))
+        return made[-1]
+
+    standin._new_session = new_session
+    assert not standin.thread_safe
+    assert len(list(standin.get_parallel('zonedata/devices', workers=3))) == 50
+    assert standin.thread_safe
+    assert standin.session is session
+    assert 1 <= len(made) <= 3
+    assert len(session.calls) + sum(len(other.calls) for other in made) == 5
+
+
+def test_timeouts(standin):
+    '''Every request carries our connect and read timeouts'''
+    standin.timeout = (3, 30)
+    standin.session.collections['zonedata/devices'] = devices(5)
+    standin.post('zone', data='[]')
+    _, _, kargs = standin.session.calls[-1]
+    assert kargs['timeout'] == (3, 30)